@@ -1,6 +1,6 @@
 import os
+import threading
 from pathlib import Path
-from dotenv import load_dotenv
 
 class Singleton(type):
     _instances = {}
@@ -10,6 +10,52 @@ class Singleton(type):
         return cls._instances[cls]
 
 
+_env_loaded = False
+_env_lock = threading.Lock()
+
+def load_env_files():
+    """Load the `.env` files once, on the first setting read (not at import)."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+
+            for env_path in _Config.ENV_FILE_PATHS:
+                load_dotenv(env_path)
+            _env_loaded = True
+
+def _bool(value: str) -> bool:
+    return value.lower() == 'true'
+
+class LazySetting:
+    """
+    A class attribute resolved on first access and then cached on the class, so
+    importing the config costs nothing and assigning the attribute still
+    overrides it.
+    """
+
+    def __init__(self, resolve):
+        self.resolve = resolve
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        value = self.resolve(self.name)
+        setattr(owner, self.name, value)
+        return value
+
+def env(default=None, cast=None) -> LazySetting:
+    """A setting read from the environment variable of the same name."""
+    def resolve(name):
+        load_env_files()
+        value = os.environ.get(name, default)
+        return cast(value) if cast is not None and value is not None else value
+    return LazySetting(resolve)
+
+
 class _Config():
 
     ##  Configs  ##
@@ -19,27 +65,134 @@ class _Config():
         BASE_DIR / '.env',
         Path(__file__).resolve().parent / '.env',
     ]
-    for env_path in ENV_FILE_PATHS:
-        load_dotenv(env_path)
 
     # Storage Method
-    TOKENS_STORAGE_METHOD = os.environ.get('TOKENS_STORAGE_METHOD', 'json')
+    TOKENS_STORAGE_METHOD = env('json')
+    SQLITE_PATH           = env()
 
     ##  Secrets ##
 
     # BLING
-    BLING_CLIENT_ID     = os.environ.get('BLING_CLIENT_ID')
-    BLING_CLIENT_SECRET = os.environ.get('BLING_CLIENT_SECRET')
+    BLING_CLIENT_ID     = env()
+    BLING_CLIENT_SECRET = env()
+    BLING_APP_NAME      = env('default')
 
     # REDIS
-    REDIS_HOST_IP       = os.environ.get('REDIS_HOST_IP')
-    REDIS_HOST_PORT     = os.environ.get('REDIS_HOST_PORT')
-    REDIS_PASSWORD      = os.environ.get('REDIS_PASSWORD')
+    REDIS_HOST_IP       = env()
+    REDIS_HOST_PORT     = env()
+    REDIS_PASSWORD      = env()
+
+    # Redis connection pool
+    REDIS_MAX_CONNECTIONS = env('50', int)
+    REDIS_SOCKET_TIMEOUT = env('5', float)
+    REDIS_SOCKET_CONNECT_TIMEOUT = env('5', float)
+    REDIS_HEALTH_CHECK_INTERVAL = env('30', int)
+
+    # Token rotation events (keep every process's token cache coherent in Redis mode)
+    REDIS_TOKEN_EVENTS_ENABLED = env('true', _bool)
+    REDIS_TOKEN_EVENTS_CHANNEL = env('bling:token-rotations')
+
+    # Sorted set of refresh token expiries (scored by expiry time) in Redis mode
+    REDIS_EXPIRY_INDEX_KEY = env('bling:refresh-token-expiries')
+
+    # HTTP connection pool
+    HTTP_MAX_CONNECTIONS = env('100', int)
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = env('20', int)
+    HTTP_POOL_CONNECTIONS = env('10', int)
+    HTTP_KEEP_ALIVE = env('true', _bool)
+    HTTP_TIMEOUT = env('30', float)
+
+    # Bling API
+    BLING_API_URL = env('https://www.bling.com.br/Api/v3')
+
+    # Rate limiting (Bling allows 3 requests/s and 120000 requests/day per account)
+    RATE_LIMIT_ENABLED = env('true', _bool)
+    RATE_LIMIT_PER_SECOND = env('3', float)
+    RATE_LIMIT_BURST = env('3', int)
+    RATE_LIMIT_DAILY_QUOTA = env('120000', int)
+    RATE_LIMIT_STORAGE = env('')
+
+    # GET response cache (TTLS: comma-separated /path=seconds, 0 = not cached;
+    # DEFAULT_TTL applies to every other path, 0 caches only the TTLS prefixes)
+    RESPONSE_CACHE_ENABLED = env('false', _bool)
+    RESPONSE_CACHE_MAX_BYTES = env('33554432', int)
+    RESPONSE_CACHE_DEFAULT_TTL = env('0', int)
+    RESPONSE_CACHE_TTLS = env('/categorias=3600,/depositos=3600,/formas-pagamentos=3600')
+    RESPONSE_CACHE_STALE_TTL = env('86400', int)
+    RESPONSE_CACHE_REDIS = env('false', _bool)
+
+    # Auth endpoint timeout and circuit breaker
+    AUTH_TIMEOUT = env('10', float)
+    AUTH_TIMEOUT_MIN = env('1', float)
+    AUTH_TIMEOUT_PERCENTILE = env('0.99', float)
+    AUTH_TIMEOUT_MULTIPLIER = env('3', float)
+    CIRCUIT_BREAKER_ENABLED = env('true', _bool)
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD = env('5', int)
+    CIRCUIT_BREAKER_RECOVERY_TIMEOUT = env('30', float)
+    CIRCUIT_BREAKER_GRACE_PERIOD = env('0', int)
+
+    # Retries of token and API requests (decorrelated-jitter backoff, Retry-After honored;
+    # keep RETRY_DEADLINE below REFRESH_LOCK_TIMEOUT, a refresh retries while holding its lock)
+    RETRY_ENABLED = env('true', _bool)
+    RETRY_MAX_ATTEMPTS = env('4', int)
+    RETRY_BASE_DELAY = env('0.5', float)
+    RETRY_MAX_DELAY = env('10', float)
+    RETRY_DEADLINE = env('20', float)
+
+    # Metrics (Prometheus text format on METRICS_HOST:METRICS_PORT/metrics, 0 = not served)
+    METRICS_ENABLED = env('false', _bool)
+    METRICS_HOST = env('127.0.0.1')
+    METRICS_PORT = env('0', int)
+
+    # Batch writes
+    BATCH_WORKERS = env('8', int)
+    BATCH_MAX_RETRIES = env('3', int)
+    BATCH_BACKOFF = env('0.5', float)
+    BATCH_MAX_BACKOFF = env('30', float)
 
     # Token handling defaults
-    DEFAULT_ACCESS_TOKEN_EXPIRES_IN = int(os.environ.get('DEFAULT_ACCESS_TOKEN_EXPIRES_IN', '3600'))
-    DEFAULT_REFRESH_TOKEN_EXPIRES_IN = int(os.environ.get('DEFAULT_REFRESH_TOKEN_EXPIRES_IN', '2592000'))
-    ACCESS_TOKEN_EXPIRY_SKEW = int(os.environ.get('ACCESS_TOKEN_EXPIRY_SKEW', '60'))
+    DEFAULT_ACCESS_TOKEN_EXPIRES_IN = env('3600', int)
+    DEFAULT_REFRESH_TOKEN_EXPIRES_IN = env('2592000', int)
+    ACCESS_TOKEN_EXPIRY_SKEW = env('60', int)
+    ACCESS_TOKEN_CACHE_ENABLED = env('true', _bool)
+
+    # Refresh coordination
+    REFRESH_SINGLE_FLIGHT = env('true', _bool)
+    REFRESH_LOCK_TIMEOUT = env('30', int)
+    REFRESH_LOCK_STRIPES = env('64', int)
+
+    # Background refresher
+    BACKGROUND_REFRESH_FRACTION = env('0.8', float)
+    BACKGROUND_REFRESH_JITTER = env('0.05', float)
+    BACKGROUND_REFRESH_MIN_BACKOFF = env('5', float)
+    BACKGROUND_REFRESH_MAX_BACKOFF = env('300', float)
+
+    # Refresh token renewal (renew refresh tokens expiring within RENEW_BEFORE seconds)
+    REFRESH_TOKEN_RENEW_BEFORE = env('604800', int)
+    REFRESH_TOKEN_RENEWAL_BATCH_SIZE = env('50', int)
+    REFRESH_TOKEN_RENEWAL_INTERVAL = env('300', float)
+
+    # Webhook receiver (empty WEBHOOK_SECRET signs with BLING_CLIENT_SECRET; WEBHOOK_QUEUE: memory or redis)
+    WEBHOOK_HOST = env('127.0.0.1')
+    WEBHOOK_PORT = env('8085', int)
+    WEBHOOK_PATH = env('/webhooks/bling')
+    WEBHOOK_SECRET = env('')
+    WEBHOOK_VERIFY_SIGNATURE = env('true', _bool)
+    WEBHOOK_QUEUE = env('memory')
+    WEBHOOK_QUEUE_KEY = env('bling:webhook-events')
+    WEBHOOK_QUEUE_SIZE = env('10000', int)
+    WEBHOOK_DEDUPE_TTL = env('86400', int)
+    WEBHOOK_WORKERS = env('2', int)
+    WEBHOOK_BATCH_SIZE = env('50', int)
+    WEBHOOK_FAILURE_PAUSE = env('30', float)
+    WEBHOOK_RETRY_AFTER = env('60', int)
+
+    # Token service (Unix socket, or 127.0.0.1:TOKEN_SERVICE_PORT when set; TCP has
+    # no authentication, any local process can read the tokens: trusted hosts only)
+    TOKEN_SERVICE_SOCKET = env('')
+    TOKEN_SERVICE_PORT = env('0', int)
+    TOKEN_SERVICE_TIMEOUT = env('5', float)
+    TOKEN_SERVICE_TENANTS_FILE = env('')
 
 
 class ConfigSingleton(_Config, metaclass=Singleton):
@@ -0,0 +1,287 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from config import ConfigSingleton
+from modules.bling import BlingApiError
+from modules.circuit_breaker import CircuitOpenError
+from modules.locks import LockTimeout
+from modules.rate_limit import PRIORITY_BULK, RateLimitExceeded
+from modules.retry import IDEMPOTENT_METHODS, RetryPolicy
+from modules.session import BlingSession
+
+@dataclass
+class BlingOperation:
+    """
+    One write against the Bling API, e.g.
+    `BlingOperation('PATCH', '/produtos/123', json={'preco': 9.9})`.
+
+    Operations on the same entity (the same `path`, or the same explicit `key`)
+    are merged before sending when one write can stand for both: a later `PUT`
+    or `DELETE` replaces earlier `PUT`/`PATCH` writes, a `PATCH` is folded into
+    the preceding `PATCH` or `PUT` body with its fields winning, and repeated
+    `POST`s with a `key` keep the last one. Writes that cannot be merged (e.g.
+    anything after a `DELETE`) are sent one after another in input order.
+    `POST` only joins an entity with an explicit `key`.
+    """
+
+    method: str
+    path: str
+    json: Optional[Any] = None
+    params: Optional[Dict[str, Any]] = None
+    key: Optional[Hashable] = None
+
+    def coalesce_key(self) -> Optional[Hashable]:
+        if self.key is not None:
+            return self.key
+        if self.method.upper() in ('PUT', 'PATCH', 'DELETE'):
+            return self.path
+        return None
+
+@dataclass
+class BatchResult:
+    """The outcome of one operation; coalesced duplicates share their winner's result."""
+
+    operation: BlingOperation
+    status_code: Optional[int] = None
+    data: Optional[Any] = None
+    error: Optional[Exception] = None
+    attempts: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status_code is not None and self.status_code < 400
+
+def _merge(previous: BlingOperation, operation: BlingOperation) -> Optional[BlingOperation]:
+    """Return one write equivalent to `previous` followed by `operation`, or None if both must be sent."""
+    previous_method, method = previous.method.upper(), operation.method.upper()
+    if previous_method == 'DELETE':
+        return None
+    if method in ('PUT', 'DELETE') and previous_method in ('PUT', 'PATCH'):
+        return operation
+    if method == 'PATCH' and previous_method in ('PUT', 'PATCH'):
+        if not isinstance(previous.json, dict) or not isinstance(operation.json, dict):
+            return None
+        return BlingOperation(previous.method, operation.path,
+                              json={**previous.json, **operation.json},
+                              params=operation.params, key=operation.key)
+    if method == previous_method == 'POST':
+        return operation
+    return None
+
+def coalesce(operations: Iterable[BlingOperation]) -> Tuple[List[BlingOperation], List[int]]:
+    """
+    Merge consecutive writes to the same entity.
+
+    Returns:
+        Tuple[List[BlingOperation], List[int]]: The operations to send, in first-seen
+        order, and for every input operation the index of the one that carries it.
+    """
+    unique: List[BlingOperation] = []
+    last: Dict[Hashable, int] = {}
+    index: List[int] = []
+
+    for operation in operations:
+        key = operation.coalesce_key()
+        position = last.get(key) if key is not None else None
+        merged = _merge(unique[position], operation) if position is not None else None
+        if merged is None:
+            position = len(unique)
+            unique.append(operation)
+            if key is not None:
+                last[key] = position
+        else:
+            unique[position] = merged
+        index.append(position)
+
+    return unique, index
+
+def chains(operations: List[BlingOperation]) -> List[List[int]]:
+    """
+    Group the positions of coalesced operations by entity, in order. Each chain
+    is sent sequentially; different chains run concurrently.
+    """
+    grouped: Dict[Hashable, List[int]] = {}
+    result: List[List[int]] = []
+    for position, operation in enumerate(operations):
+        key = operation.coalesce_key()
+        if key is None:
+            result.append([position])
+        elif key in grouped:
+            grouped[key].append(position)
+        else:
+            grouped[key] = [position]
+            result.append(grouped[key])
+    return result
+
+# Failures of one operation that must not abort the rest of the batch: API and
+# transport errors, an open circuit, the rate limiter giving up, or a token
+# refresh that could not take its single-flight lock in time.
+OPERATION_ERRORS = (BlingApiError, CircuitOpenError, RateLimitExceeded, LockTimeout)
+
+def _response_data(response) -> Optional[Any]:
+    try:
+        return response.json() if response.content else None
+    except ValueError:
+        return response.text
+
+def _record(result: BatchResult, response) -> BatchResult:
+    result.status_code = response.status_code
+    result.data = _response_data(response)
+    if response.status_code >= 400:
+        result.error = BlingApiError(f'Bling API error ({response.status_code}): {response.text}')
+    return result
+
+class BatchWriter:
+    """
+    Sends many writes through a bounded thread pool.
+
+    Every worker goes through one BlingSession, so they share the cached access
+    token (refreshed once on expiry), the pooled HTTP connections and the
+    account's rate limiter; throughput grows with `workers` up to the rate limit.
+    Writes to one entity are coalesced and sent in order (see BlingOperation),
+    and 429/5xx responses and connection errors are retried through a
+    RetryPolicy (decorrelated-jitter backoff or the `Retry-After` header, within
+    `RETRY_DEADLINE`); `POST`/`PATCH` only when the API cannot have applied them (see
+    `modules.retry.RetryPolicy`), so a write is never duplicated.
+
+    Args:
+        session (BlingSession, optional): Session to send through, `BlingSession()` by default.
+        workers (int, optional): Concurrent requests, `BATCH_WORKERS` by default.
+        max_retries (int, optional): Retries per operation, `BATCH_MAX_RETRIES` by default.
+        backoff (float, optional): First retry delay in seconds, `BATCH_BACKOFF` by default.
+        max_backoff (float, optional): Retry delay cap, `BATCH_MAX_BACKOFF` by default.
+        priority (int): Rate limiter priority, `PRIORITY_BULK` so interactive calls go first.
+    """
+
+    def __init__(self,
+                 session: Optional[BlingSession] = None,
+                 workers: Optional[int] = None,
+                 max_retries: Optional[int] = None,
+                 backoff: Optional[float] = None,
+                 max_backoff: Optional[float] = None,
+                 priority: int = PRIORITY_BULK):
+        self.session = session or BlingSession()
+        self.workers = workers or ConfigSingleton.BATCH_WORKERS
+        self.max_retries = max_retries if max_retries is not None else ConfigSingleton.BATCH_MAX_RETRIES
+        self.backoff = backoff if backoff is not None else ConfigSingleton.BATCH_BACKOFF
+        self.max_backoff = max_backoff if max_backoff is not None else ConfigSingleton.BATCH_MAX_BACKOFF
+        self.retry_policy = RetryPolicy(max_attempts=self.max_retries + 1,
+                                        base_delay=self.backoff,
+                                        max_delay=self.max_backoff)
+        self.priority = priority
+
+    def execute(self, operation: BlingOperation) -> BatchResult:
+        """Send one operation, retrying transient failures through `retry_policy`."""
+        import requests
+
+        result = BatchResult(operation)
+
+        def send(remaining: float):
+            result.attempts += 1
+            timeout = min(self.session.timeout, max(remaining, 1.0))
+            return self.session.request(operation.method, operation.path,
+                                        priority=self.priority,
+                                        retry=False,
+                                        timeout=timeout,
+                                        json=operation.json,
+                                        params=operation.params)
+
+        try:
+            response = self.retry_policy.call(send,
+                                              idempotent=operation.method.upper() in IDEMPOTENT_METHODS,
+                                              operation='batch')
+        except requests.RequestException as exc:
+            result.error = BlingApiError(f'Bling API request failed: {exc}')
+            return result
+        except OPERATION_ERRORS as exc:
+            result.error = exc
+            return result
+        return _record(result, response)
+
+    def run(self, operations: Iterable[BlingOperation]) -> List[BatchResult]:
+        """
+        Send a batch of operations.
+
+        Returns:
+            List[BatchResult]: One result per input operation, in input order.
+        """
+        unique, index = coalesce(operations)
+        results: List[Optional[BatchResult]] = [None] * len(unique)
+
+        def send_chain(chain: List[int]):
+            for position in chain:
+                results[position] = self.execute(unique[position])
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(send_chain, chains(unique)))
+        return [results[position] for position in index]
+
+class AsyncBatchWriter:
+    """
+    The asyncio counterpart of BatchWriter, on top of
+    `modules.bling_async.AsyncBlingSession`; `workers` bounds the requests in
+    flight. Arguments match BatchWriter.
+    """
+
+    def __init__(self,
+                 session,
+                 workers: Optional[int] = None,
+                 max_retries: Optional[int] = None,
+                 backoff: Optional[float] = None,
+                 max_backoff: Optional[float] = None,
+                 priority: int = PRIORITY_BULK):
+        self.session = session
+        self.workers = workers or ConfigSingleton.BATCH_WORKERS
+        self.max_retries = max_retries if max_retries is not None else ConfigSingleton.BATCH_MAX_RETRIES
+        self.backoff = backoff if backoff is not None else ConfigSingleton.BATCH_BACKOFF
+        self.max_backoff = max_backoff if max_backoff is not None else ConfigSingleton.BATCH_MAX_BACKOFF
+        self.retry_policy = RetryPolicy(max_attempts=self.max_retries + 1,
+                                        base_delay=self.backoff,
+                                        max_delay=self.max_backoff)
+        self.priority = priority
+
+    async def execute(self, operation: BlingOperation) -> BatchResult:
+        """Send one operation, retrying transient failures through `retry_policy`."""
+        result = BatchResult(operation)
+
+        async def send(remaining: float):
+            result.attempts += 1
+            timeout = min(self.session.timeout, max(remaining, 1.0))
+            return await self.session.request(operation.method, operation.path,
+                                              priority=self.priority,
+                                              retry=False,
+                                              timeout=timeout,
+                                              json=operation.json,
+                                              params=operation.params)
+
+        try:
+            response = await self.retry_policy.acall(send,
+                                                     idempotent=operation.method.upper() in IDEMPOTENT_METHODS,
+                                                     operation='batch')
+        except OPERATION_ERRORS as exc:
+            # AsyncBlingSession reports connection errors as BlingApiError.
+            result.error = exc
+            return result
+        return _record(result, response)
+
+    async def run(self, operations: Iterable[BlingOperation]) -> List[BatchResult]:
+        """
+        Send a batch of operations.
+
+        Returns:
+            List[BatchResult]: One result per input operation, in input order.
+        """
+        import asyncio
+
+        unique, index = coalesce(operations)
+        results: List[Optional[BatchResult]] = [None] * len(unique)
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def send_chain(chain: List[int]):
+            async with semaphore:
+                for position in chain:
+                    results[position] = await self.execute(unique[position])
+
+        await asyncio.gather(*(send_chain(chain) for chain in chains(unique)))
+        return [results[position] for position in index]
@@ -1,21 +1,31 @@
 import base64
-import json
-import os
 import time
-from typing import Optional, Tuple
-
-import requests
+from typing import Dict, List, Optional, Tuple
 
 from config import ConfigSingleton
+from modules import metrics, storage
+from modules.http_client import get_http_session
+from modules.locks import KeyedThreadLocks
+from modules.token_cache import token_cache
 
 class BlingApiError(RuntimeError):
     """Raised when the Bling auth API returns an error."""
 
 class TokenStorage:
-    """A class to handle token storage and retrieval."""
+    """
+    A class to handle token storage and retrieval.
+
+    Storage itself is delegated to the backend selected by `TOKENS_STORAGE_METHOD`
+    (see `modules.storage`); this class validates the input, fills in default
+    lifetimes and records storage latency.
+    """
+
+    CREDENTIALS_DIRNAME = storage.CREDENTIALS_DIRNAME
+    CREDENTIALS_FILENAME = storage.JsonStorageBackend.FILENAME
 
-    CREDENTIALS_DIRNAME = 'credential'
-    CREDENTIALS_FILENAME = 'credentials.json'
+    _metadata_keys = staticmethod(storage.metadata_keys)
+    is_record_expired = staticmethod(storage.is_record_expired)
+    refresh_lease_key = staticmethod(storage.refresh_lease_key)
 
     @staticmethod
     def check_param_value(param_name: str, param_value: str):
@@ -41,34 +51,12 @@ class TokenStorage:
             raise TypeError('(check_param_value) - token_key_name must be a string')
 
     @staticmethod
-    def _credentials_path() -> str:
-        credentials_folder = os.path.join(ConfigSingleton.BASE_DIR, TokenStorage.CREDENTIALS_DIRNAME)
-        return os.path.join(credentials_folder, TokenStorage.CREDENTIALS_FILENAME)
-
-    @staticmethod
-    def _ensure_credentials_file() -> None:
-        credentials_file = TokenStorage._credentials_path()
-        credentials_folder = os.path.dirname(credentials_file)
-        os.makedirs(credentials_folder, exist_ok=True)
-
-        if not os.path.exists(credentials_file):
-            with open(credentials_file, 'w', encoding='utf-8') as file:
-                json.dump(
-                    {
-                        'access_token': '',
-                        'access_token_expires_in': '',
-                        'access_token_obtained_at': '',
-                        'refresh_token': '',
-                        'refresh_token_expires_in': '',
-                        'refresh_token_obtained_at': ''
-                    },
-                    file
-                )
-            os.chmod(credentials_file, 0o600)
-
-    @staticmethod
-    def _metadata_keys(token_key_name: str) -> Tuple[str, str]:
-        return (f'{token_key_name}_expires_in', f'{token_key_name}_obtained_at')
+    def _default_expires_in(token_key_name: str) -> Optional[int]:
+        if token_key_name.endswith('access_token'):
+            return ConfigSingleton.DEFAULT_ACCESS_TOKEN_EXPIRES_IN
+        if token_key_name.endswith('refresh_token'):
+            return ConfigSingleton.DEFAULT_REFRESH_TOKEN_EXPIRES_IN
+        return None
 
     @staticmethod
     def save_token(token_key_name: str,
@@ -84,59 +72,33 @@ class TokenStorage:
             expires_in (int, optional): The expiration time of the token in seconds.
             obtained_at (int, optional): Unix timestamp when the token was obtained.
         """
-        TokenStorage.check_param_value(param_name=token_key_name, param_value=token_value)
+        TokenStorage.save_tokens([(token_key_name, token_value, expires_in)], obtained_at)
 
-        if expires_in is None:
-            if token_key_name == 'access_token':
-                expires_in = ConfigSingleton.DEFAULT_ACCESS_TOKEN_EXPIRES_IN
-            elif token_key_name == 'refresh_token':
-                expires_in = ConfigSingleton.DEFAULT_REFRESH_TOKEN_EXPIRES_IN
+    @staticmethod
+    def save_tokens(tokens: List[Tuple[str, str, Optional[int]]],
+                    obtained_at: Optional[int] = None):
+        """
+        Save several tokens at once, so readers never see a new access token next
+        to a stale refresh token: a single MULTI/EXEC pipeline in Redis mode, a
+        single file write in JSON mode and a single transaction in SQLite mode.
 
+        Args:
+            tokens (List[Tuple[str, str, Optional[int]]]): `(token_key_name, token_value, expires_in)` items.
+            obtained_at (int, optional): Unix timestamp when the tokens were obtained.
+        """
         if obtained_at is None:
             obtained_at = int(time.time())
 
-        if ConfigSingleton.TOKENS_STORAGE_METHOD == 'redis':
-            try:
-                import redis  # type: ignore
-            except ModuleNotFoundError as exc:
-                raise ModuleNotFoundError(
-                    'Redis dependency not installed. Install with '
-                    '`pip install -r requirements-redis.txt` or set '
-                    'TOKENS_STORAGE_METHOD=json.'
-                ) from exc
-            try:
-                from modules import redis_client
-                redis_client_instance = redis_client.RedisClient()
-
-                redis_client_instance.set_bling_token(
-                    token_name=token_key_name,
-                    token_value=token_value,
-                    expires_in=expires_in
-                )
-            except redis.RedisError as e:
-                print(e)
-                raise
-        elif ConfigSingleton.TOKENS_STORAGE_METHOD == 'json':
-            TokenStorage._ensure_credentials_file()
-            credentials_file = TokenStorage._credentials_path()
-
-            with open(credentials_file, 'r', encoding='utf-8') as file:
-                credentials = json.load(file)
-
-            credentials[token_key_name] = token_value
-            expires_in_key, obtained_at_key = TokenStorage._metadata_keys(token_key_name)
-            if expires_in is not None:
-                credentials[expires_in_key] = expires_in
-            if obtained_at is not None:
-                credentials[obtained_at_key] = obtained_at
-
-            with open(credentials_file,
-                      'w',
-                      encoding='utf-8') as file:
-                json.dump(credentials, file)
-            os.chmod(credentials_file, 0o600)
-        else:
-            raise NotImplementedError
+        entries = []
+        for token_key_name, token_value, expires_in in tokens:
+            TokenStorage.check_param_value(param_name=token_key_name, param_value=token_value)
+            if expires_in is None:
+                expires_in = TokenStorage._default_expires_in(token_key_name)
+            entries.append((token_key_name, token_value, expires_in))
+
+        backend = storage.get_storage_backend()
+        with metrics.span('bling_token_storage', backend=backend.name, operation='write'):
+            backend.save_tokens(entries, obtained_at)
 
     @staticmethod
     def retrieve_token_by_key(token_key: str) -> Optional[str]:
@@ -149,101 +111,110 @@ class TokenStorage:
         Returns:
             Optional[str]: The value of the token if found, None otherwise.
         """
+        backend = storage.get_storage_backend()
+        with metrics.span('bling_token_storage', backend=backend.name, operation='read'):
+            return backend.retrieve_token_by_key(token_key)
 
-        token = None
-        if ConfigSingleton.TOKENS_STORAGE_METHOD == 'redis':
-            try:
-                import redis  # type: ignore
-            except ModuleNotFoundError as exc:
-                raise ModuleNotFoundError(
-                    'Redis dependency not installed. Install with '
-                    '`pip install -r requirements-redis.txt` or set '
-                    'TOKENS_STORAGE_METHOD=json.'
-                ) from exc
-
-            token = redis.Redis(
-                host=ConfigSingleton.REDIS_HOST_IP,
-                port=ConfigSingleton.REDIS_HOST_PORT,
-                password=ConfigSingleton.REDIS_PASSWORD,
-                db=0
-            ).get(token_key)
-
-            if isinstance(token, bytes):
-                token = token.decode('utf-8')
-
-        if ConfigSingleton.TOKENS_STORAGE_METHOD == 'json':
-            credentials_file = TokenStorage._credentials_path()
-            if not os.path.exists(credentials_file):
-                return None
-
-            with open(credentials_file, 'r', encoding='utf-8') as file:
-                file_dict = json.load(file)
-
-            token = file_dict.get(token_key)
+    @staticmethod
+    def retrieve_token_record(token_key: str) -> Tuple[Optional[str], Optional[int], int]:
+        """
+        Retrieve a token value together with its expiry metadata in a single read
+        (one file read in JSON mode, one pipelined round trip in Redis mode).
 
-        return token
+        Args:
+            token_key (str): The key of the token.
+
+        Returns:
+            Tuple[Optional[str], Optional[int], int]: `(token_value, expires_in, obtained_at)`.
+            `expires_in` is None when the token never expires (Redis key without TTL)
+            and 0 when the expiry metadata is missing or invalid.
+        """
+        backend = storage.get_storage_backend()
+        with metrics.span('bling_token_storage', backend=backend.name, operation='read'):
+            return backend.retrieve_token_record(token_key)
+
+    @staticmethod
+    def retrieve_token_records(token_keys: List[str]) -> Dict[str, Tuple[Optional[str], Optional[int], int]]:
+        """
+        Bulk version of `retrieve_token_record`: one pipelined round trip in Redis
+        mode, one file read in JSON mode and one query per 500 keys in SQLite mode.
+
+        Args:
+            token_keys (List[str]): The keys of the tokens.
+
+        Returns:
+            Dict[str, Tuple[Optional[str], Optional[int], int]]: Records by token key.
+        """
+        backend = storage.get_storage_backend()
+        with metrics.span('bling_token_storage', backend=backend.name, operation='bulk_read'):
+            return backend.retrieve_token_records(token_keys)
 
     @staticmethod
     def is_token_expired(token_key: str) -> bool:
         """
         Check if a token is expired based on stored metadata or Redis TTL.
         """
-        if ConfigSingleton.TOKENS_STORAGE_METHOD == 'redis':
-            try:
-                import redis  # type: ignore
-            except ModuleNotFoundError as exc:
-                raise ModuleNotFoundError(
-                    'Redis dependency not installed. Install with '
-                    '`pip install -r requirements-redis.txt` or set '
-                    'TOKENS_STORAGE_METHOD=json.'
-                ) from exc
-
-            redis_client = redis.Redis(
-                host=ConfigSingleton.REDIS_HOST_IP,
-                port=ConfigSingleton.REDIS_HOST_PORT,
-                password=ConfigSingleton.REDIS_PASSWORD,
-                db=0
-            )
-            ttl = redis_client.ttl(token_key)
-            if ttl is None or ttl == -2:
-                return True
-            if ttl == -1:
-                return False
-            return ttl <= ConfigSingleton.ACCESS_TOKEN_EXPIRY_SKEW
-
-        if ConfigSingleton.TOKENS_STORAGE_METHOD == 'json':
-            credentials_file = TokenStorage._credentials_path()
-            if not os.path.exists(credentials_file):
-                return True
-
-            with open(credentials_file, 'r', encoding='utf-8') as file:
-                file_dict = json.load(file)
-
-            expires_in_key, obtained_at_key = TokenStorage._metadata_keys(token_key)
-            expires_in = file_dict.get(expires_in_key)
-            obtained_at = file_dict.get(obtained_at_key)
-
-            if not expires_in or not obtained_at:
-                return True
+        backend = storage.get_storage_backend()
+        with metrics.span('bling_token_storage', backend=backend.name, operation='expiry_check'):
+            return backend.is_token_expired(token_key)
 
-            try:
-                expires_in = int(expires_in)
-                obtained_at = int(obtained_at)
-            except (TypeError, ValueError):
-                return True
+    @staticmethod
+    def refresh_token_expiries(start: float, end: float, limit: int) -> List[Tuple[str, float]]:
+        """
+        Return up to `limit` `(refresh_token_key, expires_at)` pairs expiring in
+        `[start, end]`, nearest first: a sorted set range in Redis mode, an index
+        range scan in SQLite mode, a scan of the file in JSON mode.
+        """
+        backend = storage.get_storage_backend()
+        with metrics.span('bling_token_storage', backend=backend.name, operation='expiry_index'):
+            return backend.refresh_token_expiries(start, end, limit)
 
-            now = int(time.time())
-            return now >= (obtained_at + expires_in - ConfigSingleton.ACCESS_TOKEN_EXPIRY_SKEW)
+    @staticmethod
+    def rebuild_expiry_index():
+        """Index refresh tokens stored before the expiry index existed (Redis mode only)."""
+        storage.get_storage_backend().rebuild_expiry_index()
 
-        return True
+    @staticmethod
+    def refresh_lock(lock_name: str):
+        """
+        Return the cross-process lock guarding a token refresh: a lock file next to
+        the credentials in JSON and SQLite mode, a `SET NX PX` lease in Redis mode
+        and no lock at all in memory mode.
+
+        Lock names are spread over `REFRESH_LOCK_STRIPES` lock files, so the number
+        of files stays bounded however many tenants are stored.
+        """
+        return storage.get_storage_backend().refresh_lock(lock_name)
+
+    @staticmethod
+    def refresh_lock_path(lock_name: str) -> Optional[str]:
+        """Return the striped lock file guarding refreshes of `lock_name`, if the backend uses one."""
+        return storage.get_storage_backend().refresh_lock_path(lock_name)
 
 class BlingApiTokenHandler:
     """
     A class for handling API token authentication for the Bling API.
+
+    By default it uses `BLING_CLIENT_ID`/`BLING_CLIENT_SECRET` and stores tokens
+    under the `access_token`/`refresh_token` keys. Multi-account setups pass their
+    own client credentials and a `key_prefix` that namespaces the stored keys
+    (see `modules.tenants.TenantTokenManager`). `retry_policy` overrides the
+    `RETRY_*` settings for this handler's token requests.
     """
     AUTH_URL = 'https://www.bling.com.br/Api/v3/oauth/token'
 
-    def __init__(self):
+    def __init__(self,
+                 client_id: Optional[str] = None,
+                 client_secret: Optional[str] = None,
+                 key_prefix: str = '',
+                 retry_policy=None):
+        self.client_id = client_id or ConfigSingleton.BLING_CLIENT_ID
+        self.client_secret = client_secret or ConfigSingleton.BLING_CLIENT_SECRET
+        self.key_prefix = key_prefix
+        self.access_token_key = f'{key_prefix}access_token'
+        self.refresh_token_key = f'{key_prefix}refresh_token'
+        self.rate_limit_key = f'{key_prefix}rate_limit'
+        self.retry_policy = retry_policy
         self.headers = self._prepare_headers()
 
     def _prepare_headers(self):
@@ -251,10 +222,10 @@ class BlingApiTokenHandler:
         Prepares the headers for the API request
         (must be in base64 {client_id}:{client_secret} format).
         """
-        if not ConfigSingleton.BLING_CLIENT_ID or not ConfigSingleton.BLING_CLIENT_SECRET:
+        if not self.client_id or not self.client_secret:
             raise ValueError('Missing BLING_CLIENT_ID or BLING_CLIENT_SECRET')
 
-        credential = f"{ConfigSingleton.BLING_CLIENT_ID}:{ConfigSingleton.BLING_CLIENT_SECRET}"
+        credential = f"{self.client_id}:{self.client_secret}"
         encoded_credentials = base64.b64encode(credential.encode('ascii')).decode('ascii')
         return {
             'Accept': 'application/json',
@@ -264,19 +235,91 @@ class BlingApiTokenHandler:
     def _post_request(self, payload):
         """
         Sends a POST request to the authentication endpoint.
+        With `RATE_LIMIT_ENABLED` it goes through the account's rate limiter ahead
+        of any queued API call. With `CIRCUIT_BREAKER_ENABLED` the endpoint is
+        guarded by a circuit breaker and the timeout adapts to observed latency.
+        With `RETRY_ENABLED` transient failures are retried (see `modules.retry`),
+        but a grant is only sent again when Bling cannot have processed it.
+
+        Raises:
+            CircuitOpenError: If the auth endpoint's circuit is open.
+            BlingApiError: If the request fails or Bling returns an error.
         """
+        import requests
+
+        from modules.retry import default_retry_policy
+
+        policy = self.retry_policy or default_retry_policy()
+        try:
+            if policy is None:
+                response = self._send_post(payload, float('inf'))
+            else:
+                response = policy.call(lambda remaining: self._send_post(payload, remaining),
+                                       idempotent=False, operation='auth')
+        except requests.RequestException as exc:
+            raise BlingApiError(f'Bling auth request failed: {exc}') from exc
+
+        data = self._response_data(response)
+        self._save_credentials(data)
+        return data
+
+    def _send_post(self, payload, remaining: float):
+        """Sends one auth request, its timeout clamped to the `remaining` retry budget."""
         headers = {
             **self.headers,
             'Content-Type': 'application/x-www-form-urlencoded'
         }
+        if ConfigSingleton.RATE_LIMIT_ENABLED:
+            from modules.rate_limit import PRIORITY_REFRESH, get_rate_limiter
+            get_rate_limiter(self.rate_limit_key).acquire(PRIORITY_REFRESH)
+
+        breaker = None
+        probe = False
+        timeout = ConfigSingleton.AUTH_TIMEOUT
+        if ConfigSingleton.CIRCUIT_BREAKER_ENABLED:
+            from modules.circuit_breaker import get_circuit_breaker
+            breaker = get_circuit_breaker(self.AUTH_URL)
+            probe = breaker.before_call()
+            timeout = breaker.timeout()
+        timeout = min(timeout, max(remaining, ConfigSingleton.AUTH_TIMEOUT_MIN))
+
+        import requests
+
+        grant_type = payload.get('grant_type')
+        started = time.monotonic()
         try:
-            response = requests.post(self.AUTH_URL,
-                                     headers=headers,
-                                     data=payload,
-                                     timeout=10)
-        except requests.RequestException as exc:
-            raise BlingApiError(f'Bling auth request failed: {exc}') from exc
+            response = get_http_session().post(self.AUTH_URL,
+                                               headers=headers,
+                                               data=payload,
+                                               timeout=timeout)
+        except requests.RequestException:
+            if breaker:
+                breaker.record_failure()
+            metrics.observe('bling_auth_request_seconds', time.monotonic() - started,
+                            grant_type=grant_type, status='error')
+            raise
+        except BaseException:
+            # No outcome to record (e.g. KeyboardInterrupt), but free the half-open probe.
+            if breaker:
+                breaker.release_probe(probe)
+            raise
+
+        latency = time.monotonic() - started
+        metrics.observe('bling_auth_request_seconds', latency,
+                        grant_type=grant_type, status=response.status_code)
+        if breaker:
+            if breaker.is_failure_status(response.status_code):
+                breaker.record_failure()
+            else:
+                breaker.record_success(latency)
+        return response
 
+    @staticmethod
+    def _response_data(response) -> dict:
+        """
+        Parses an auth endpoint response, raising BlingApiError on error statuses.
+        Works with any response object exposing `status_code`, `headers`, `text` and `json()`.
+        """
         data = {}
         content_type = response.headers.get('Content-Type', '').lower()
         if 'application/json' in content_type:
@@ -287,17 +330,16 @@ class BlingApiTokenHandler:
         else:
             data = {'raw': response.text}
 
-        if not response.ok:
+        if response.status_code >= 400:
             message = data.get('error_description') or data.get('error') or response.text
             raise BlingApiError(f'Bling auth error ({response.status_code}): {message}')
 
-        self._save_credentials(data)
         return data
 
-    def _save_credentials(self, bling_response_dict):
+    def _token_entries(self, bling_response_dict) -> List[Tuple[str, str, Optional[int]]]:
         """
-        Saves the access and refresh tokens to the token using TokenStorage
-        class to handle custom storage options (e.g. Redis/Json).
+        Returns the `(token_key_name, token_value, expires_in)` items to store
+        for an auth endpoint response.
         """
         access_token = bling_response_dict.get('access_token')
         refresh_token = bling_response_dict.get('refresh_token')
@@ -314,15 +356,24 @@ class BlingApiTokenHandler:
         except (TypeError, ValueError):
             refresh_expires_in = None
 
+        tokens = []
         if access_token:
-            TokenStorage.save_token(token_key_name='access_token',
-                                    token_value=access_token,
-                                    expires_in=access_expires_in)
-
+            tokens.append((self.access_token_key, access_token, access_expires_in))
         if refresh_token:
-            TokenStorage.save_token(token_key_name='refresh_token',
-                                    token_value=refresh_token,
-                                    expires_in=refresh_expires_in)
+            tokens.append((self.refresh_token_key, refresh_token, refresh_expires_in))
+        return tokens
+
+    def _save_credentials(self, bling_response_dict):
+        """
+        Saves the access and refresh tokens to the token using TokenStorage
+        class to handle custom storage options (e.g. Redis/Json).
+        """
+        token_cache.invalidate(self.access_token_key)
+        token_cache.invalidate(self.refresh_token_key)
+
+        tokens = self._token_entries(bling_response_dict)
+        if tokens:
+            TokenStorage.save_tokens(tokens)
 
     def get_token_using_code(self, code):
         """
@@ -352,3 +403,152 @@ class BlingApiTokenHandler:
         }
 
         return self._post_request(payload)
+
+_refresh_thread_locks = KeyedThreadLocks()
+
+def _read_valid_token(token_storage: TokenStorage,
+                      token_key: str,
+                      valid_until: Optional[float] = None,
+                      stale_token: Optional[str] = None) -> Optional[str]:
+    token, expires_in, obtained_at = token_storage.retrieve_token_record(token_key)
+    if not token or token == stale_token or token_storage.is_record_expired(expires_in, obtained_at):
+        return None
+    if valid_until is not None and expires_in is not None and obtained_at + expires_in < valid_until:
+        return None
+
+    token_cache.set(token_key, token, expires_in, obtained_at)
+    return token
+
+def _read_usable_token(token_storage: TokenStorage,
+                       token_handler: BlingApiTokenHandler,
+                       valid_until: Optional[float],
+                       stale_token: Optional[str],
+                       refresh_valid_until: Optional[float]) -> Optional[str]:
+    """`_read_valid_token` that also requires the refresh token to last until `refresh_valid_until`."""
+    access_token = _read_valid_token(token_storage, token_handler.access_token_key, valid_until, stale_token)
+    if access_token and refresh_valid_until is not None:
+        _, expires_in, obtained_at = token_storage.retrieve_token_record(token_handler.refresh_token_key)
+        if expires_in is not None and obtained_at + expires_in < refresh_valid_until:
+            return None
+    return access_token
+
+def get_valid_access_token(token_storage: TokenStorage,
+                           token_handler: BlingApiTokenHandler) -> Optional[str]:
+    """
+    Return a valid access token, refreshing it only when needed.
+
+    Hot reads are served from the in-process token cache; expired tokens are
+    renewed through `refresh_access_token`.
+    """
+    access_token_key = token_handler.access_token_key
+    access_token = token_cache.get(access_token_key)
+    if access_token:
+        metrics.increment('bling_token_cache_total', result='hit')
+        return access_token
+
+    metrics.increment('bling_token_cache_total', result='miss')
+    access_token = _read_valid_token(token_storage, access_token_key)
+    if access_token:
+        return access_token
+
+    metrics.increment('bling_token_expired_total')
+    try:
+        return refresh_access_token(token_storage, token_handler)
+    except BlingApiError:
+        access_token = _read_grace_token(token_storage, access_token_key)
+        if access_token:
+            return access_token
+        raise
+
+def _read_grace_token(token_storage: TokenStorage, token_key: str) -> Optional[str]:
+    """
+    Return the stored token if it is inside the expiry skew but not yet expired,
+    or expired less than `CIRCUIT_BREAKER_GRACE_PERIOD` seconds ago. Used only
+    when a refresh fails, so an auth outage does not take down API calls that
+    the old token can still serve.
+    """
+    if ConfigSingleton.CIRCUIT_BREAKER_GRACE_PERIOD < 0:
+        return None
+
+    token, expires_in, obtained_at = token_storage.retrieve_token_record(token_key)
+    if not token or expires_in is None:
+        return token
+    if time.time() < obtained_at + expires_in + ConfigSingleton.CIRCUIT_BREAKER_GRACE_PERIOD:
+        return token
+    return None
+
+def refresh_access_token(token_storage: TokenStorage,
+                         token_handler: BlingApiTokenHandler,
+                         valid_until: Optional[float] = None,
+                         stale_token: Optional[str] = None,
+                         refresh_valid_until: Optional[float] = None) -> Optional[str]:
+    """
+    Refresh the access token unless a stored one is still usable.
+
+    With `REFRESH_SINGLE_FLIGHT` enabled, exactly one caller refreshes: threads of
+    the same process wait on a per-key lock and processes coordinate through
+    `TokenStorage.refresh_lock`, re-reading storage once they get their turn.
+
+    Args:
+        token_storage (TokenStorage): The token storage.
+        token_handler (BlingApiTokenHandler): The handler used to refresh.
+        valid_until (float, optional): Unix timestamp; a stored token expiring
+            before it is renewed even if not yet expired.
+        stale_token (str, optional): A token the API rejected; it is renewed
+            unless another caller already replaced it.
+        refresh_valid_until (float, optional): Unix timestamp; tokens are also
+            renewed when the stored refresh token expires before it.
+
+    Returns:
+        Optional[str]: The access token, or None if there is no refresh token.
+    """
+    if not ConfigSingleton.REFRESH_SINGLE_FLIGHT:
+        return _refresh_access_token(token_storage, token_handler)
+
+    access_token_key = token_handler.access_token_key
+    if stale_token:
+        token_cache.invalidate(access_token_key)
+
+    thread_lock = _refresh_thread_locks.get(access_token_key)
+    with metrics.span('bling_refresh_lock_wait', lock='thread'):
+        thread_lock.acquire()
+    try:
+        access_token = _read_usable_token(token_storage, token_handler,
+                                          valid_until, stale_token, refresh_valid_until)
+        if access_token:
+            metrics.increment('bling_token_refresh_coalesced_total')
+            return access_token
+
+        process_lock = token_storage.refresh_lock(access_token_key)
+        metrics.observe('bling_refresh_lock_wait_seconds', process_lock.acquire(), lock='process')
+        try:
+            access_token = _read_usable_token(token_storage, token_handler,
+                                              valid_until, stale_token, refresh_valid_until)
+            if access_token:
+                metrics.increment('bling_token_refresh_coalesced_total')
+                return access_token
+
+            return _refresh_access_token(token_storage, token_handler)
+        finally:
+            process_lock.release()
+    finally:
+        thread_lock.release()
+
+def _refresh_access_token(token_storage: TokenStorage,
+                          token_handler: BlingApiTokenHandler) -> Optional[str]:
+    refresh_token = token_storage.retrieve_token_by_key(token_handler.refresh_token_key)
+    if not refresh_token:
+        metrics.increment('bling_token_refresh_total', result='no_refresh_token')
+        return None
+
+    try:
+        token_handler.refresh_tokens(refresh_token)
+    except BlingApiError:
+        metrics.increment('bling_token_refresh_total', result='failure')
+        raise
+    metrics.increment('bling_token_refresh_total', result='success')
+    access_token_key = token_handler.access_token_key
+    access_token, expires_in, obtained_at = token_storage.retrieve_token_record(access_token_key)
+    if access_token:
+        token_cache.set(access_token_key, access_token, expires_in, obtained_at)
+    return access_token
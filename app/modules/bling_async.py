@@ -0,0 +1,491 @@
+import asyncio
+import time
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import httpx  # type: ignore
+except ModuleNotFoundError as exc:  # pragma: no cover - guarded import
+    raise ModuleNotFoundError(
+        'Async dependencies not installed. Install with '
+        '`pip install -r requirements-async.txt`.'
+    ) from exc
+
+from config import ConfigSingleton
+from modules import metrics, storage, token_events
+from modules.bling import BlingApiError, BlingApiTokenHandler, TokenStorage
+from modules.locks import AsyncFileLock, AsyncRedisLease, KeyedAsyncLocks, NullLock
+from modules.token_cache import token_cache
+
+class AsyncLocalTokenStorage:
+    """
+    Async adapter over the sync storage backends (JSON, SQLite, memory or a
+    registered custom backend).
+
+    Reads the backend can answer from memory run inline: memory reads are dict
+    lookups, and a JSON read is served from the parsed copy kept by
+    JsonCredentialStore once a `stat` shows the file unchanged. Writes, and reads
+    that have to open the file or reach a database, run in a worker thread so
+    they never stall the event loop.
+    """
+
+    is_record_expired = staticmethod(TokenStorage.is_record_expired)
+
+    @staticmethod
+    async def _call(func, *args):
+        if storage.get_storage_backend().read_is_cached():
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    async def save_tokens(self, tokens: List[Tuple[str, str, Optional[int]]],
+                          obtained_at: Optional[int] = None):
+        await asyncio.to_thread(TokenStorage.save_tokens, tokens, obtained_at)
+
+    async def retrieve_token_by_key(self, token_key: str) -> Optional[str]:
+        return await self._call(TokenStorage.retrieve_token_by_key, token_key)
+
+    async def retrieve_token_record(self, token_key: str) -> Tuple[Optional[str], Optional[int], int]:
+        return await self._call(TokenStorage.retrieve_token_record, token_key)
+
+    def refresh_lock(self, lock_name: str):
+        path = TokenStorage.refresh_lock_path(lock_name)
+        if path is None:
+            return NullLock()
+        return AsyncFileLock(path, timeout=ConfigSingleton.REFRESH_LOCK_TIMEOUT)
+
+AsyncJsonTokenStorage = AsyncLocalTokenStorage
+
+class AsyncRedisTokenStorage:
+    """
+    Async Redis storage backend on `redis.asyncio`, sharing one connection pool
+    per event loop. Keys, metadata and rotation events match the sync Redis backend.
+    """
+
+    is_record_expired = staticmethod(TokenStorage.is_record_expired)
+
+    @staticmethod
+    def _connection():
+        from modules import redis_client
+        return redis_client.get_async_redis_connection()
+
+    async def save_tokens(self, tokens: List[Tuple[str, str, Optional[int]]],
+                          obtained_at: Optional[int] = None):
+        from modules.redis_client import RedisClient
+
+        if obtained_at is None:
+            obtained_at = int(time.time())
+
+        entries = []
+        for token_name, token_value, expires_in in tokens:
+            TokenStorage.check_param_value(param_name=token_name, param_value=token_value)
+            entries.append((token_name, token_value, expires_in or TokenStorage._default_expires_in(token_name)))
+
+        token_events.ensure_listening(wait=False)
+        pipeline = self._connection().pipeline(transaction=True)
+        RedisClient.queue_bling_tokens(pipeline, entries, obtained_at)
+        await pipeline.execute()
+
+    async def retrieve_token_by_key(self, token_key: str) -> Optional[str]:
+        token = await self._connection().get(token_key)
+        if isinstance(token, bytes):
+            token = token.decode('utf-8')
+        return token
+
+    async def retrieve_token_record(self, token_key: str) -> Tuple[Optional[str], Optional[int], int]:
+        from modules.redis_client import RedisClient
+
+        token_events.ensure_listening(wait=False)
+        pipeline = self._connection().pipeline(transaction=False)
+        pipeline.mget(token_key, f'{token_key}_expires_in', f'{token_key}_obtained_at')
+        pipeline.ttl(token_key)
+        (token, expires_in, obtained_at), ttl = await pipeline.execute()
+        return RedisClient._token_record(token, expires_in, obtained_at, ttl)
+
+    def refresh_lock(self, lock_name: str) -> AsyncRedisLease:
+        timeout = ConfigSingleton.REFRESH_LOCK_TIMEOUT
+        return AsyncRedisLease(self._connection(),
+                               key=TokenStorage.refresh_lease_key(lock_name),
+                               lease_ms=timeout * 1000,
+                               timeout=timeout)
+
+def get_async_token_storage():
+    """
+    Return the async storage backend matching `TOKENS_STORAGE_METHOD`.
+    """
+    if storage.get_storage_backend().name == 'redis':
+        return AsyncRedisTokenStorage()
+    return AsyncLocalTokenStorage()
+
+class AsyncBlingApiTokenHandler:
+    """
+    The asyncio counterpart of BlingApiTokenHandler.
+
+    Token requests go through an `httpx.AsyncClient` shared by every handler on
+    the same event loop, and tokens are saved through an async storage backend.
+    Client credentials and stored key names follow the sync handler's rules.
+    """
+    AUTH_URL = BlingApiTokenHandler.AUTH_URL
+
+    _clients = weakref.WeakKeyDictionary()
+
+    def __init__(self,
+                 client_id: Optional[str] = None,
+                 client_secret: Optional[str] = None,
+                 key_prefix: str = '',
+                 token_storage=None,
+                 client: Optional[httpx.AsyncClient] = None,
+                 retry_policy=None):
+        self.sync_handler = BlingApiTokenHandler(client_id=client_id,
+                                                 client_secret=client_secret,
+                                                 key_prefix=key_prefix,
+                                                 retry_policy=retry_policy)
+        self.headers = self.sync_handler.headers
+        self.access_token_key = self.sync_handler.access_token_key
+        self.refresh_token_key = self.sync_handler.refresh_token_key
+        self.token_storage = token_storage or get_async_token_storage()
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The pooled HTTP client for the running event loop."""
+        if self._client is not None:
+            return self._client
+
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients.setdefault(loop, httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=ConfigSingleton.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=ConfigSingleton.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                # Auth requests pass their own AUTH_TIMEOUT-based timeout.
+                timeout=ConfigSingleton.HTTP_TIMEOUT,
+            ))
+        return client
+
+    async def _post_request(self, payload) -> dict:
+        """
+        Sends a POST request to the authentication endpoint, through the same
+        rate limiter, circuit breaker and retry policy as `BlingApiTokenHandler._post_request`.
+        """
+        from modules.retry import default_retry_policy
+
+        policy = self.sync_handler.retry_policy or default_retry_policy()
+        try:
+            if policy is None:
+                response = await self._send_post(payload, float('inf'))
+            else:
+                response = await policy.acall(lambda remaining: self._send_post(payload, remaining),
+                                              idempotent=False, operation='auth')
+        except httpx.HTTPError as exc:
+            raise BlingApiError(f'Bling auth request failed: {exc}') from exc
+
+        data = BlingApiTokenHandler._response_data(response)
+        await self._save_credentials(data)
+        return data
+
+    async def _send_post(self, payload, remaining: float) -> httpx.Response:
+        headers = {
+            **self.headers,
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+        if ConfigSingleton.RATE_LIMIT_ENABLED:
+            from modules.rate_limit import PRIORITY_REFRESH, get_rate_limiter
+            await get_rate_limiter(self.sync_handler.rate_limit_key).acquire_async(PRIORITY_REFRESH)
+
+        breaker = None
+        probe = False
+        timeout = ConfigSingleton.AUTH_TIMEOUT
+        if ConfigSingleton.CIRCUIT_BREAKER_ENABLED:
+            from modules.circuit_breaker import get_circuit_breaker
+            breaker = get_circuit_breaker(self.AUTH_URL)
+            probe = breaker.before_call()
+            timeout = breaker.timeout()
+        timeout = min(timeout, max(remaining, ConfigSingleton.AUTH_TIMEOUT_MIN))
+
+        grant_type = payload.get('grant_type')
+        started = time.monotonic()
+        try:
+            response = await self.client.post(self.AUTH_URL, headers=headers, data=payload, timeout=timeout)
+        except httpx.HTTPError:
+            if breaker:
+                breaker.record_failure()
+            metrics.observe('bling_auth_request_seconds', time.monotonic() - started,
+                            grant_type=grant_type, status='error')
+            raise
+        except BaseException:
+            # Cancelled (e.g. by asyncio.wait_for): no outcome, but free the half-open probe.
+            if breaker:
+                breaker.release_probe(probe)
+            raise
+
+        latency = time.monotonic() - started
+        metrics.observe('bling_auth_request_seconds', latency,
+                        grant_type=grant_type, status=response.status_code)
+        if breaker:
+            if breaker.is_failure_status(response.status_code):
+                breaker.record_failure()
+            else:
+                breaker.record_success(latency)
+        return response
+
+    async def _save_credentials(self, bling_response_dict):
+        token_cache.invalidate(self.access_token_key)
+        token_cache.invalidate(self.refresh_token_key)
+
+        tokens = self.sync_handler._token_entries(bling_response_dict)
+        if tokens:
+            await self.token_storage.save_tokens(tokens)
+
+    async def get_token_using_code(self, code) -> dict:
+        """
+        - Retrieves the access token using the URL code param.
+        - Obtém o token de acesso usando o código URL.
+        """
+        return await self._post_request({
+            'grant_type': 'authorization_code',
+            'code': code
+        })
+
+    async def refresh_tokens(self, refresh_token) -> dict:
+        """
+        - Refreshes the access and refresh tokens using the refresh token.
+        - Atualiza os tokens de acesso e de atualização usando o token de atualização.
+        """
+        return await self._post_request({
+            'grant_type': 'refresh_token',
+            'refresh_token': refresh_token
+        })
+
+    @classmethod
+    async def aclose(cls):
+        """Close the shared HTTP client of the running event loop."""
+        client = cls._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+_refresh_async_locks: Dict[asyncio.AbstractEventLoop, KeyedAsyncLocks] = weakref.WeakKeyDictionary()
+
+async def _read_valid_token(token_storage,
+                            token_key: str,
+                            valid_until: Optional[float] = None,
+                            stale_token: Optional[str] = None) -> Optional[str]:
+    token, expires_in, obtained_at = await token_storage.retrieve_token_record(token_key)
+    if not token or token == stale_token or token_storage.is_record_expired(expires_in, obtained_at):
+        return None
+    if valid_until is not None and expires_in is not None and obtained_at + expires_in < valid_until:
+        return None
+
+    token_cache.set(token_key, token, expires_in, obtained_at)
+    return token
+
+async def get_valid_access_token(token_storage,
+                                 token_handler: AsyncBlingApiTokenHandler) -> Optional[str]:
+    """
+    Async version of `modules.bling.get_valid_access_token`, with the same
+    expiry-skew semantics and the same in-process token cache.
+    """
+    access_token_key = token_handler.access_token_key
+    access_token = token_cache.get(access_token_key)
+    if access_token:
+        metrics.increment('bling_token_cache_total', result='hit')
+        return access_token
+
+    metrics.increment('bling_token_cache_total', result='miss')
+    access_token = await _read_valid_token(token_storage, access_token_key)
+    if access_token:
+        return access_token
+
+    metrics.increment('bling_token_expired_total')
+    try:
+        return await refresh_access_token(token_storage, token_handler)
+    except BlingApiError:
+        access_token = await _read_grace_token(token_storage, access_token_key)
+        if access_token:
+            return access_token
+        raise
+
+async def _read_grace_token(token_storage, token_key: str) -> Optional[str]:
+    if ConfigSingleton.CIRCUIT_BREAKER_GRACE_PERIOD < 0:
+        return None
+
+    token, expires_in, obtained_at = await token_storage.retrieve_token_record(token_key)
+    if not token or expires_in is None:
+        return token
+    if time.time() < obtained_at + expires_in + ConfigSingleton.CIRCUIT_BREAKER_GRACE_PERIOD:
+        return token
+    return None
+
+async def refresh_access_token(token_storage,
+                               token_handler: AsyncBlingApiTokenHandler,
+                               valid_until: Optional[float] = None,
+                               stale_token: Optional[str] = None) -> Optional[str]:
+    """
+    Async version of `modules.bling.refresh_access_token`.
+
+    Coroutines of the same event loop await a per-key `asyncio.Lock`, so only one
+    of them refreshes; processes (sync or async) coordinate through the same lock
+    files or Redis leases as the sync API.
+    """
+    if not ConfigSingleton.REFRESH_SINGLE_FLIGHT:
+        return await _refresh_access_token(token_storage, token_handler)
+
+    loop = asyncio.get_running_loop()
+    locks = _refresh_async_locks.get(loop)
+    if locks is None:
+        locks = _refresh_async_locks.setdefault(loop, KeyedAsyncLocks())
+
+    access_token_key = token_handler.access_token_key
+    if stale_token:
+        token_cache.invalidate(access_token_key)
+
+    async with locks.get(access_token_key):
+        access_token = await _read_valid_token(token_storage, access_token_key, valid_until, stale_token)
+        if access_token:
+            metrics.increment('bling_token_refresh_coalesced_total')
+            return access_token
+
+        async with token_storage.refresh_lock(access_token_key):
+            access_token = await _read_valid_token(token_storage, access_token_key,
+                                                   valid_until, stale_token)
+            if access_token:
+                metrics.increment('bling_token_refresh_coalesced_total')
+                return access_token
+
+            return await _refresh_access_token(token_storage, token_handler)
+
+async def _refresh_access_token(token_storage,
+                                token_handler: AsyncBlingApiTokenHandler) -> Optional[str]:
+    refresh_token = await token_storage.retrieve_token_by_key(token_handler.refresh_token_key)
+    if not refresh_token:
+        metrics.increment('bling_token_refresh_total', result='no_refresh_token')
+        return None
+
+    try:
+        await token_handler.refresh_tokens(refresh_token)
+    except BlingApiError:
+        metrics.increment('bling_token_refresh_total', result='failure')
+        raise
+    metrics.increment('bling_token_refresh_total', result='success')
+    access_token_key = token_handler.access_token_key
+    access_token, expires_in, obtained_at = await token_storage.retrieve_token_record(access_token_key)
+    if access_token:
+        token_cache.set(access_token_key, access_token, expires_in, obtained_at)
+    return access_token
+
+class AsyncBlingSession:
+    """
+    The asyncio counterpart of `modules.session.BlingSession`: authenticated
+    requests over the handler's pooled `httpx.AsyncClient`, with one refresh and
+    replay on a 401, the account's rate limiter applied to every attempt and
+    transient failures retried through `retry_policy` like the sync session.
+    """
+
+    def __init__(self,
+                 token_handler: Optional[AsyncBlingApiTokenHandler] = None,
+                 timeout: Optional[float] = None,
+                 base_url: Optional[str] = None,
+                 retry_policy=None):
+        from modules.retry import default_retry_policy
+
+        self.token_handler = token_handler or AsyncBlingApiTokenHandler()
+        self.retry_policy = retry_policy or default_retry_policy()
+        self.token_storage = self.token_handler.token_storage
+        self.timeout = timeout or ConfigSingleton.HTTP_TIMEOUT
+        self.base_url = (base_url or ConfigSingleton.BLING_API_URL).rstrip('/')
+
+    def url(self, path: str) -> str:
+        """Return the absolute URL of an API path such as `/produtos`."""
+        if path.startswith(('http://', 'https://')):
+            return path
+        return f'{self.base_url}/{path.lstrip("/")}'
+
+    async def access_token(self) -> str:
+        """
+        Return the current valid access token.
+
+        Raises:
+            BlingApiError: If there is no token and no refresh token to get one.
+        """
+        access_token = await get_valid_access_token(self.token_storage, self.token_handler)
+        if not access_token:
+            raise BlingApiError('No access token available, authorize with get_token_using_code first')
+        return access_token
+
+    async def _send(self, method: str, url: str, access_token: str,
+                    priority: int, **kwargs) -> httpx.Response:
+        if ConfigSingleton.RATE_LIMIT_ENABLED:
+            from modules.rate_limit import get_rate_limiter
+            await get_rate_limiter(self.token_handler.sync_handler.rate_limit_key).acquire_async(priority)
+
+        headers = {
+            'Accept': 'application/json',
+            **kwargs.pop('headers', {}),
+            'Authorization': f'Bearer {access_token}',
+        }
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            return await self.token_handler.client.request(method, url, headers=headers, **kwargs)
+        except httpx.HTTPError as exc:
+            raise BlingApiError(f'Bling API request failed: {exc}') from exc
+
+    async def _attempt(self, method: str, url: str, access_token: str, priority: int,
+                       retry: bool, kwargs: dict) -> httpx.Response:
+        from modules.retry import IDEMPOTENT_METHODS
+
+        async def send(remaining: float) -> httpx.Response:
+            timeout = kwargs.get('timeout') or self.timeout
+            if isinstance(timeout, (int, float)):
+                timeout = min(timeout, max(remaining, 1.0))
+            return await self._send(method, url, access_token, priority, **{**kwargs, 'timeout': timeout})
+
+        if not retry or self.retry_policy is None:
+            return await send(float('inf'))
+        return await self.retry_policy.acall(send, idempotent=method.upper() in IDEMPOTENT_METHODS)
+
+    async def request(self, method: str, path: str,
+                      priority: Optional[int] = None,
+                      retry: bool = True,
+                      **kwargs) -> httpx.Response:
+        """
+        Send an authenticated request, refreshing the token and replaying once on a 401.
+
+        Args:
+            method (str): HTTP method.
+            path (str): API path (e.g. `/produtos`) or absolute URL.
+            priority (int, optional): Rate limiter priority.
+            retry (bool): Apply the retry policy; False for callers running their own retries.
+            **kwargs: Passed on to `httpx.AsyncClient.request`.
+        """
+        from modules.rate_limit import PRIORITY_DEFAULT
+
+        priority = PRIORITY_DEFAULT if priority is None else priority
+        url = self.url(path)
+        access_token = await self.access_token()
+        response = await self._attempt(method, url, access_token, priority, retry, kwargs)
+
+        if response.status_code == 401:
+            access_token = await refresh_access_token(self.token_storage,
+                                                      self.token_handler,
+                                                      stale_token=access_token)
+            if not access_token:
+                raise BlingApiError('Access token rejected and no refresh token available')
+            response = await self._attempt(method, url, access_token, priority, retry, kwargs)
+
+        return response
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request('POST', path, **kwargs)
+
+    async def put(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request('PUT', path, **kwargs)
+
+    async def patch(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request('PATCH', path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request('DELETE', path, **kwargs)
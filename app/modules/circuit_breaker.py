@@ -0,0 +1,170 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from config import ConfigSingleton
+from modules.bling import BlingApiError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(BlingApiError):
+    """Raised without calling the endpoint while its circuit is open."""
+
+class AdaptiveTimeout:
+    """
+    A request timeout derived from recent latencies: `multiplier` times the
+    `percentile` of the last `window` successful calls, clamped to
+    `[min_timeout, max_timeout]`. Until enough samples exist it is `max_timeout`.
+    """
+
+    MIN_SAMPLES = 10
+
+    def __init__(self, min_timeout: float, max_timeout: float,
+                 percentile: float = 0.99,
+                 multiplier: float = 3.0,
+                 window: int = 100):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def latency_percentile(self) -> Optional[float]:
+        """Return the configured latency percentile, or None without enough samples."""
+        with self._lock:
+            if len(self._samples) < self.MIN_SAMPLES:
+                return None
+            samples = sorted(self._samples)
+        rank = max(0, math.ceil(self.percentile * len(samples)) - 1)
+        return samples[rank]
+
+    def timeout(self) -> float:
+        latency = self.latency_percentile()
+        if latency is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, latency * self.multiplier))
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker with an adaptive timeout.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail immediately with CircuitOpenError. After `recovery_timeout` seconds one
+    probe call is let through (half-open): its success closes the circuit, its
+    failure opens it again. Only transport errors and 429/5xx responses count as
+    failures; a rejected grant is the caller's problem, not the endpoint's.
+
+    Usage:
+        probe = breaker.before_call()
+        ... send with timeout=breaker.timeout() ...
+        breaker.record_success(latency) / breaker.record_failure()
+        ... or, if the call ended without an outcome (cancelled, unexpected error):
+        breaker.release_probe(probe)
+    """
+
+    def __init__(self, name: str,
+                 failure_threshold: int,
+                 recovery_timeout: float,
+                 timeout: AdaptiveTimeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.adaptive_timeout = timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def before_call(self) -> bool:
+        """
+        Returns:
+            bool: True if this call is the half-open probe.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a probe in flight.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return False
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+        raise CircuitOpenError(f'Circuit open for {self.name}, failing fast')
+
+    def release_probe(self, probe: bool):
+        """
+        Let another probe through after a probe ended without a success or a
+        failure to record (e.g. it was cancelled), leaving the state unchanged.
+        """
+        if not probe:
+            return
+        with self._lock:
+            self._probe_in_flight = False
+
+    def timeout(self) -> float:
+        return self.adaptive_timeout.timeout()
+
+    def record_success(self, latency: Optional[float] = None):
+        if latency is not None:
+            self.adaptive_timeout.observe(latency)
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    @staticmethod
+    def is_failure_status(status_code: int) -> bool:
+        return status_code == 429 or status_code >= 500
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """
+    Return the shared circuit breaker for an endpoint, configured from
+    `CIRCUIT_BREAKER_*` and `AUTH_TIMEOUT_*`.
+    """
+    breaker = _breakers.get(name)
+    if breaker is not None:
+        return breaker
+
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            timeout = AdaptiveTimeout(min_timeout=ConfigSingleton.AUTH_TIMEOUT_MIN,
+                                      max_timeout=ConfigSingleton.AUTH_TIMEOUT,
+                                      percentile=ConfigSingleton.AUTH_TIMEOUT_PERCENTILE,
+                                      multiplier=ConfigSingleton.AUTH_TIMEOUT_MULTIPLIER)
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=ConfigSingleton.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                recovery_timeout=ConfigSingleton.CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+                timeout=timeout)
+    return breaker
@@ -0,0 +1,55 @@
+import os
+import threading
+from typing import TYPE_CHECKING
+
+from config import ConfigSingleton
+
+if TYPE_CHECKING:
+    import requests
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def build_http_session(pool_connections: int = None,
+                       pool_maxsize: int = None,
+                       keep_alive: bool = None) -> 'requests.Session':
+    """
+    Build a `requests.Session` with a tuned connection pool.
+
+    Args:
+        pool_connections (int, optional): Number of per-host pools to keep.
+        pool_maxsize (int, optional): Connections kept alive per host.
+        keep_alive (bool, optional): Reuse connections between requests.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    pool_connections = pool_connections or ConfigSingleton.HTTP_POOL_CONNECTIONS
+    pool_maxsize = pool_maxsize or ConfigSingleton.HTTP_MAX_CONNECTIONS
+    if keep_alive is None:
+        keep_alive = ConfigSingleton.HTTP_KEEP_ALIVE
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+def get_http_session() -> 'requests.Session':
+    """
+    Return the process-wide pooled HTTP session, shared by token requests and
+    API calls so keep-alive connections and TLS sessions are reused. A new
+    session is built after a fork. `requests` is only imported here, on first use.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = build_http_session()
+                _session_pid = pid
+    return _session
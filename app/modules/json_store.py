@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from config import ConfigSingleton
+from modules.locks import FileLock
+
+class JsonCredentialStore:
+    """
+    A crash-safe `credentials.json` store.
+
+    Writes go to a temp file that is fsynced and committed with `os.replace` while
+    holding an advisory lock, so concurrent writers never lose updates and a crash
+    never leaves a truncated file behind. Readers keep the parsed dict in memory
+    and re-parse only when the file's mtime, inode or size changes.
+    """
+
+    _instances: Dict[str, 'JsonCredentialStore'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        self._data: Dict[str, object] = {}
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def for_path(cls, path: str) -> 'JsonCredentialStore':
+        """Return the shared store for `path`, so every caller shares one parsed copy."""
+        store = cls._instances.get(path)
+        if store is None:
+            with cls._instances_lock:
+                store = cls._instances.setdefault(path, cls(path))
+        return store
+
+    def _stat_stamp(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+    def is_current(self) -> bool:
+        """Whether `read` would return the parsed copy without opening the file (one `stat`)."""
+        stamp = self._stat_stamp()
+        return stamp is None or stamp == self._stamp
+
+    def read(self) -> Dict[str, object]:
+        """
+        Return the credentials dict, re-parsing the file only if it changed on disk.
+        The returned dict is shared and must not be mutated.
+        """
+        stamp = self._stat_stamp()
+        if stamp is None:
+            return {}
+        if stamp == self._stamp:
+            return self._data
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            # Left behind by a non-atomic writer; the next update replaces it.
+            data = {}
+
+        self._data, self._stamp = data, stamp
+        return data
+
+    def update(self, values: Dict[str, object]):
+        """
+        Merge `values` into the stored credentials and atomically replace the file.
+        """
+        folder = os.path.dirname(self.path)
+        os.makedirs(folder, exist_ok=True)
+
+        with self._write_lock, FileLock(self.lock_path, timeout=ConfigSingleton.REFRESH_LOCK_TIMEOUT):
+            credentials = dict(self.read())
+            credentials.update(values)
+
+            import tempfile
+
+            # mkstemp creates the file with 0o600, so no chmod is needed afterwards
+            fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.credentials-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    json.dump(credentials, file)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temp_path, self.path)
+            except BaseException:
+                try:
+                    os.unlink(temp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+
+            self._fsync_folder(folder)
+            self._data, self._stamp = credentials, self._stat_stamp()
+
+    @staticmethod
+    def _fsync_folder(folder: str):
+        if not hasattr(os, 'O_DIRECTORY'):  # pragma: no cover - Windows
+            return
+        fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,283 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ModuleNotFoundError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+class LockTimeout(TimeoutError):
+    """Raised when a lock could not be acquired within its timeout."""
+
+class FileLock:
+    """An advisory, cross-process lock backed by a lock file."""
+
+    def __init__(self, path: str,
+                 timeout: Optional[float] = None,
+                 poll_interval: float = 0.05):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+        self._locked = False
+
+    @staticmethod
+    def _try_lock(fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:  # pragma: no cover - Windows
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+    @staticmethod
+    def _unlock(fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:  # pragma: no cover - Windows
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def try_acquire(self) -> bool:
+        """
+        Try to take the lock without blocking.
+
+        Returns:
+            bool: True if the lock is now held.
+        """
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._try_lock(self._fd)
+        except OSError:
+            return False
+        self._locked = True
+        return True
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def acquire(self) -> float:
+        """
+        Block until the lock is held.
+
+        Returns:
+            float: Seconds spent waiting for the lock.
+
+        Raises:
+            LockTimeout: If the lock is still held elsewhere after `timeout` seconds.
+        """
+        started = time.monotonic()
+        while not self.try_acquire():
+            if self.timeout is not None and time.monotonic() - started >= self.timeout:
+                self._close()
+                raise LockTimeout(f'Timed out waiting for file lock {self.path}')
+            time.sleep(self.poll_interval)
+        return time.monotonic() - started
+
+    def release(self):
+        """Release the lock if held."""
+        try:
+            if self._locked:
+                self._unlock(self._fd)
+        finally:
+            self._locked = False
+            self._close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class RedisLease:
+    """
+    A cross-process lock backed by a Redis `SET NX PX` lease.
+
+    The lease expires on its own after `lease_ms`, so a crashed holder cannot
+    block the other processes forever.
+    """
+
+    RELEASE_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) "
+        "else return 0 end"
+    )
+
+    def __init__(self, connection, key: str,
+                 lease_ms: int,
+                 timeout: Optional[float] = None,
+                 poll_interval: float = 0.05):
+        self.connection = connection
+        self.key = key
+        self.lease_ms = lease_ms
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._token = None
+
+    def acquire(self) -> float:
+        """
+        Block until the lease is held.
+
+        Returns:
+            float: Seconds spent waiting for the lease.
+
+        Raises:
+            LockTimeout: If the lease is still held elsewhere after `timeout` seconds.
+        """
+        token = os.urandom(16).hex()
+        started = time.monotonic()
+
+        while not self.connection.set(self.key, token, nx=True, px=self.lease_ms):
+            if self.timeout is not None and time.monotonic() - started >= self.timeout:
+                raise LockTimeout(f'Timed out waiting for Redis lease {self.key}')
+            time.sleep(self.poll_interval)
+
+        self._token = token
+        return time.monotonic() - started
+
+    def release(self):
+        """Release the lease if it is still ours."""
+        if self._token is None:
+            return
+        try:
+            self.connection.eval(self.RELEASE_SCRIPT, 1, self.key, self._token)
+        finally:
+            self._token = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class NullLock:
+    """
+    A lock that is always free, for storage backends that live in a single
+    process. Works both as a sync and an async context manager.
+    """
+
+    def acquire(self) -> float:
+        return 0.0
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+class KeyedThreadLocks:
+    """A registry of one `threading.Lock` per key, created on demand."""
+
+    def __init__(self):
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def get(self, key: str) -> threading.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.setdefault(key, threading.Lock())
+        return lock
+
+class AsyncFileLock:
+    """An awaitable wrapper around FileLock that polls without blocking the event loop."""
+
+    def __init__(self, path: str,
+                 timeout: Optional[float] = None,
+                 poll_interval: float = 0.05):
+        self._lock = FileLock(path, timeout=timeout, poll_interval=poll_interval)
+
+    async def acquire(self) -> float:
+        import asyncio
+
+        lock = self._lock
+        started = time.monotonic()
+        while not lock.try_acquire():
+            if lock.timeout is not None and time.monotonic() - started >= lock.timeout:
+                lock._close()
+                raise LockTimeout(f'Timed out waiting for file lock {lock.path}')
+            await asyncio.sleep(lock.poll_interval)
+        return time.monotonic() - started
+
+    def release(self):
+        self._lock.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+class AsyncRedisLease:
+    """The `redis.asyncio` counterpart of RedisLease."""
+
+    def __init__(self, connection, key: str,
+                 lease_ms: int,
+                 timeout: Optional[float] = None,
+                 poll_interval: float = 0.05):
+        self.connection = connection
+        self.key = key
+        self.lease_ms = lease_ms
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._token = None
+
+    async def acquire(self) -> float:
+        import asyncio
+
+        token = os.urandom(16).hex()
+        started = time.monotonic()
+
+        while not await self.connection.set(self.key, token, nx=True, px=self.lease_ms):
+            if self.timeout is not None and time.monotonic() - started >= self.timeout:
+                raise LockTimeout(f'Timed out waiting for Redis lease {self.key}')
+            await asyncio.sleep(self.poll_interval)
+
+        self._token = token
+        return time.monotonic() - started
+
+    async def release(self):
+        if self._token is None:
+            return
+        try:
+            await self.connection.eval(RedisLease.RELEASE_SCRIPT, 1, self.key, self._token)
+        finally:
+            self._token = None
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.release()
+
+class KeyedAsyncLocks:
+    """A registry of one `asyncio.Lock` per key, created on demand."""
+
+    def __init__(self):
+        self._locks: Dict[str, 'asyncio.Lock'] = {}
+
+    def get(self, key: str) -> 'asyncio.Lock':
+        import asyncio
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks.setdefault(key, asyncio.Lock())
+        return lock
@@ -0,0 +1,252 @@
+import bisect
+import threading
+import time
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from config import ConfigSingleton
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_SPAN = nullcontext()
+
+class MetricsHook:
+    """
+    Instrumentation interface for token operations and API calls; this base class does nothing.
+
+    Subclass it to forward counters, gauges, histograms and spans to another backend
+    (StatsD, OpenTelemetry, ...) and install it with `set_metrics_hook`.
+
+    Metrics emitted:
+        bling_token_cache_total{result}: In-process token cache hits and misses.
+        bling_token_expired_total: Cache misses whose stored access token was missing or expired.
+        bling_token_refresh_total{result}: Refresh attempts by outcome.
+        bling_token_refresh_coalesced_total: Refreshes skipped because another caller just refreshed.
+        bling_auth_request_seconds{grant_type, status}: Token endpoint latency.
+        bling_token_storage_seconds{backend, operation}: Token storage read/write/index latency.
+        bling_refresh_lock_wait_seconds{lock}: Time spent waiting for the refresh locks.
+        bling_retries_total{operation, reason}: Retried token (auth) and API requests by cause.
+        bling_response_cache_total{result, tier}: GET response cache lookups (hit, miss, revalidated).
+        bling_response_cache_requests_saved_total: API requests (quota) saved by cache hits.
+        bling_response_cache_bytes_saved_total: Response bytes served from the cache (hits and 304s).
+        bling_response_cache_bytes / bling_response_cache_entries: In-memory cache footprint (gauges).
+        bling_refresh_token_renewal_total{result}: Scheduled refresh token renewals by outcome.
+        bling_token_rotation_events_total: Rotation events applied to the token cache (Redis mode).
+        bling_webhook_events_total{result}: Webhook deliveries (queued, merged, duplicate, full, invalid, unauthorized).
+        bling_webhook_batches_total{result}: Processed webhook batches (ok, requeued, failed).
+        bling_webhook_events_processed_total / bling_webhook_batch_seconds: Webhook work done.
+        bling_webhook_queue_depth: Events waiting for a worker (gauge).
+        bling_token_service_requests_total{command, result}: Token service requests.
+        bling_token_service_pushes_total: Rotations pushed to token service watchers.
+    """
+
+    enabled = False
+
+    def increment(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None):
+        pass
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        pass
+
+    def gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        """Set the current value of a level, such as a cache size."""
+        pass
+
+    def span(self, name: str, labels: Optional[Dict[str, str]] = None):
+        """Return a context manager timing (and, for tracing backends, tracing) a block."""
+        return _NULL_SPAN
+
+class _Span:
+    __slots__ = ('hook', 'name', 'labels', 'started')
+
+    def __init__(self, hook: MetricsHook, name: str, labels: Optional[Dict[str, str]]):
+        self.hook = hook
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        labels = self.labels
+        if exc_type is not None:
+            labels = {**(labels or {}), 'error': exc_type.__name__}
+        self.hook.observe(f'{self.name}_seconds', time.perf_counter() - self.started, labels)
+
+class PrometheusMetrics(MetricsHook):
+    """
+    In-memory counters, gauges and histograms rendered in the Prometheus text format.
+    Spans are recorded as `<name>_seconds` histograms.
+    """
+
+    enabled = True
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._histograms: Dict[str, Dict[LabelSet, list]] = {}
+        self._gauges: Dict[str, Dict[LabelSet, float]] = {}
+        self._label_sets: Dict[tuple, LabelSet] = {}
+        self._lock = threading.Lock()
+
+    def _label_set(self, labels: Optional[Dict[str, str]]) -> LabelSet:
+        if not labels:
+            return ()
+        raw = tuple(labels.items())
+        label_set = self._label_sets.get(raw)
+        if label_set is None:
+            label_set = self._label_sets[raw] = tuple(sorted((key, str(value)) for key, value in raw))
+        return label_set
+
+    def increment(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None):
+        label_set = self._label_set(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[label_set] = series.get(label_set, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        label_set = self._label_set(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(label_set)
+            if histogram is None:
+                # Per-bucket counts (last one is +Inf), then sum and count.
+                histogram = series[label_set] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        label_set = self._label_set(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[label_set] = value
+
+    def span(self, name: str, labels: Optional[Dict[str, str]] = None):
+        return _Span(self, name, labels)
+
+    @staticmethod
+    def _escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @staticmethod
+    def _format_labels(label_set: LabelSet, extra: LabelSet = ()) -> str:
+        pairs = label_set + extra
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{PrometheusMetrics._escape(value)}"' for key, value in pairs) + '}'
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f'# TYPE {name} counter')
+                for label_set, value in sorted(series.items()):
+                    lines.append(f'{name}{self._format_labels(label_set)} {value:g}')
+
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f'# TYPE {name} gauge')
+                for label_set, value in sorted(series.items()):
+                    lines.append(f'{name}{self._format_labels(label_set)} {value:g}')
+
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f'# TYPE {name} histogram')
+                for label_set, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float('inf'),), histogram):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                        lines.append(f'{name}_bucket{self._format_labels(label_set, (("le", le),))} {cumulative}')
+                    lines.append(f'{name}_sum{self._format_labels(label_set)} {histogram[-2]:.6f}')
+                    lines.append(f'{name}_count{self._format_labels(label_set)} {histogram[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+class _DefaultHook(MetricsHook):
+    """Stands in until first use, then installs the hook chosen by `METRICS_ENABLED`."""
+
+    def _resolve(self) -> MetricsHook:
+        global _hook
+        if _hook is self:
+            _hook = PrometheusMetrics() if ConfigSingleton.METRICS_ENABLED else MetricsHook()
+        return _hook
+
+    def increment(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None):
+        self._resolve().increment(name, value, labels)
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        self._resolve().observe(name, value, labels)
+
+    def gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        self._resolve().gauge(name, value, labels)
+
+    def span(self, name: str, labels: Optional[Dict[str, str]] = None):
+        return self._resolve().span(name, labels)
+
+_hook: MetricsHook = _DefaultHook()
+
+def get_metrics_hook() -> MetricsHook:
+    if isinstance(_hook, _DefaultHook):
+        return _hook._resolve()
+    return _hook
+
+def set_metrics_hook(hook: MetricsHook):
+    """Install the instrumentation backend, e.g. `set_metrics_hook(PrometheusMetrics())`."""
+    global _hook
+    _hook = hook
+
+def increment(name: str, value: float = 1.0, **labels):
+    _hook.increment(name, value, labels)
+
+def observe(name: str, value: float, **labels):
+    _hook.observe(name, value, labels)
+
+def gauge(name: str, value: float, **labels):
+    _hook.gauge(name, value, labels)
+
+def span(name: str, **labels):
+    return _hook.span(name, labels)
+
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None) -> 'ThreadingHTTPServer':
+    """
+    Serve the installed PrometheusMetrics on `http://<host>:<port>/metrics` from
+    a daemon thread (`METRICS_HOST`, loopback only, and `METRICS_PORT` by default).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    host = host or ConfigSingleton.METRICS_HOST
+    port = port if port is not None else ConfigSingleton.METRICS_PORT
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            hook = get_metrics_hook()
+            if self.path.split('?')[0] != '/metrics' or not isinstance(hook, PrometheusMetrics):
+                self.send_error(404)
+                return
+            payload = hook.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,149 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from modules.bling import BlingApiError
+from modules.rate_limit import PRIORITY_DEFAULT
+from modules.session import BlingSession
+
+def _page_records(response, path: str, page: int) -> List[dict]:
+    if response.status_code >= 400:
+        raise BlingApiError(f'Bling API error ({response.status_code}) on {path} page {page}: {response.text}')
+    return response.json().get('data') or []
+
+class BlingPaginator:
+    """
+    Lazily iterate a Bling v3 list endpoint (`pagina`/`limite` pagination).
+
+    Records are yielded one by one while the next `prefetch` pages are fetched
+    concurrently; every fetch goes through the session, so it stays within the
+    account's rate limit and the token is refreshed transparently mid-stream. At
+    most `prefetch + 1` pages are held in memory.
+
+    To resume an interrupted export, pass a `checkpoint` callable, which receives
+    the next page to fetch once a page has been fully consumed, and restart with
+    that value as `start_page`. A page interrupted before the consumer moved past
+    it is not checkpointed and is delivered again on resume.
+
+    Args:
+        session (BlingSession): Authenticated session.
+        path (str): List endpoint, e.g. `/produtos`.
+        params (dict, optional): Extra query parameters (filters).
+        limit (int): Page size (`limite`).
+        prefetch (int): Pages fetched ahead of the consumer.
+        start_page (int): First page (`pagina`) to fetch.
+        checkpoint (Callable[[int], None], optional): Progress callback.
+        priority (int): Rate limiter priority.
+    """
+
+    def __init__(self,
+                 session: BlingSession,
+                 path: str,
+                 params: Optional[Dict[str, object]] = None,
+                 limit: int = 100,
+                 prefetch: int = 2,
+                 start_page: int = 1,
+                 checkpoint: Optional[Callable[[int], None]] = None,
+                 priority: int = PRIORITY_DEFAULT):
+        self.session = session
+        self.path = path
+        self.params = dict(params or {})
+        self.limit = limit
+        self.prefetch = max(0, prefetch)
+        self.start_page = start_page
+        self.checkpoint = checkpoint
+        self.priority = priority
+
+    def fetch_page(self, page: int) -> List[dict]:
+        """Fetch one page and return its records."""
+        params = {**self.params, 'pagina': page, 'limite': self.limit}
+        response = self.session.get(self.path, params=params, priority=self.priority)
+        return _page_records(response, self.path, page)
+
+    def pages(self) -> Iterator[Tuple[int, List[dict]]]:
+        """Yield `(page_number, records)` until an empty or short page."""
+        next_page = self.start_page
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.prefetch + 1) as executor:
+            try:
+                while True:
+                    while len(pending) <= self.prefetch:
+                        pending.append((next_page, executor.submit(self.fetch_page, next_page)))
+                        next_page += 1
+
+                    page, future = pending.popleft()
+                    records = future.result()
+                    if records:
+                        yield page, records
+                    if self.checkpoint:
+                        self.checkpoint(page + 1)
+                    if len(records) < self.limit:
+                        return
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def __iter__(self) -> Iterator[dict]:
+        for _, records in self.pages():
+            yield from records
+
+class AsyncBlingPaginator:
+    """
+    The asyncio counterpart of BlingPaginator, on top of
+    `modules.bling_async.AsyncBlingSession`. Prefetched pages are fetched by
+    concurrent tasks; arguments match BlingPaginator.
+    """
+
+    def __init__(self,
+                 session,
+                 path: str,
+                 params: Optional[Dict[str, object]] = None,
+                 limit: int = 100,
+                 prefetch: int = 2,
+                 start_page: int = 1,
+                 checkpoint: Optional[Callable[[int], None]] = None,
+                 priority: int = PRIORITY_DEFAULT):
+        self.session = session
+        self.path = path
+        self.params = dict(params or {})
+        self.limit = limit
+        self.prefetch = max(0, prefetch)
+        self.start_page = start_page
+        self.checkpoint = checkpoint
+        self.priority = priority
+
+    async def fetch_page(self, page: int) -> List[dict]:
+        """Fetch one page and return its records."""
+        params = {**self.params, 'pagina': page, 'limite': self.limit}
+        response = await self.session.get(self.path, params=params, priority=self.priority)
+        return _page_records(response, self.path, page)
+
+    async def pages(self) -> AsyncIterator[Tuple[int, List[dict]]]:
+        """Yield `(page_number, records)` until an empty or short page."""
+        next_page = self.start_page
+        pending = deque()
+
+        try:
+            while True:
+                while len(pending) <= self.prefetch:
+                    pending.append((next_page, asyncio.ensure_future(self.fetch_page(next_page))))
+                    next_page += 1
+
+                page, task = pending.popleft()
+                records = await task
+                if records:
+                    yield page, records
+                if self.checkpoint:
+                    self.checkpoint(page + 1)
+                if len(records) < self.limit:
+                    return
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    async def __aiter__(self) -> AsyncIterator[dict]:
+        async for _, records in self.pages():
+            for record in records:
+                yield record
@@ -0,0 +1,319 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from datetime import date
+from typing import Dict, Optional
+
+from config import ConfigSingleton
+from modules.bling import BlingApiError
+
+PRIORITY_REFRESH = 0
+PRIORITY_DEFAULT = 10
+PRIORITY_BULK = 20
+
+class RateLimitExceeded(BlingApiError):
+    """Raised when the daily request quota is used up or a rate limit wait times out."""
+
+class LocalTokenBucket:
+    """
+    An in-memory token bucket with an optional daily quota, for one process.
+    """
+
+    def __init__(self, rate: float, capacity: float, daily_quota: int = 0):
+        self.rate = rate
+        self.capacity = capacity
+        self.daily_quota = daily_quota
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._day = date.today()
+        self._used_today = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: int = 1) -> float:
+        """
+        Take `tokens` from the bucket if available.
+
+        Returns:
+            float: 0 if acquired, otherwise the seconds to wait before trying again.
+
+        Raises:
+            RateLimitExceeded: If the daily quota is used up.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+            today = date.today()
+            if today != self._day:
+                self._day, self._used_today = today, 0
+            if self.daily_quota and self._used_today + tokens > self.daily_quota:
+                raise RateLimitExceeded('Bling daily request quota exhausted')
+
+            if self._tokens < tokens:
+                return (tokens - self._tokens) / self.rate
+
+            self._tokens -= tokens
+            self._used_today += tokens
+            return 0.0
+
+class RedisTokenBucket:
+    """
+    A token bucket shared by every process through Redis.
+
+    The refill, the take and the daily counter run in one Lua script using the
+    Redis server clock, so hosts with skewed clocks still share one budget. When
+    Redis is unreachable the bucket falls back to a LocalTokenBucket.
+    """
+
+    SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local daily_quota = tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+if daily_quota > 0 then
+    local used = tonumber(redis.call('GET', KEYS[2]) or '0')
+    if used + requested > daily_quota then
+        return -1
+    end
+end
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+
+local wait_ms = 0
+if tokens < requested then
+    wait_ms = math.ceil((requested - tokens) / rate * 1000)
+else
+    tokens = tokens - requested
+    if daily_quota > 0 then
+        redis.call('INCRBY', KEYS[2], requested)
+        redis.call('EXPIRE', KEYS[2], 90000)
+    end
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return wait_ms
+"""
+
+    def __init__(self, key: str, rate: float, capacity: float, daily_quota: int = 0):
+        from modules import redis_client
+
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.daily_quota = daily_quota
+        self._redis_client = redis_client
+        self._script = None
+        self._fallback = LocalTokenBucket(rate, capacity, daily_quota)
+
+    def try_acquire(self, tokens: int = 1) -> float:
+        """
+        Take `tokens` from the shared bucket if available.
+
+        Returns:
+            float: 0 if acquired, otherwise the seconds to wait before trying again.
+
+        Raises:
+            RateLimitExceeded: If the daily quota is used up.
+        """
+        connection = self._redis_client.get_redis_connection()
+        if self._script is None:
+            self._script = connection.register_script(self.SCRIPT)
+
+        day_key = f'{self.key}:day:{date.today():%Y%m%d}'
+        try:
+            wait_ms = self._script(keys=[self.key, day_key],
+                                   args=[self.rate, self.capacity, tokens, self.daily_quota],
+                                   client=connection)
+        except self._redis_client.redis.RedisError:
+            return self._fallback.try_acquire(tokens)
+
+        if wait_ms < 0:
+            raise RateLimitExceeded('Bling daily request quota exhausted')
+        return wait_ms / 1000
+
+class RateLimiter:
+    """
+    A priority-aware request scheduler in front of a token bucket.
+
+    Callers queue by priority (lower first, FIFO within a priority) and only the
+    head of the queue draws from the bucket, so a token refresh
+    (`PRIORITY_REFRESH`) always goes ahead of queued bulk calls
+    (`PRIORITY_BULK`) while throughput stays at the bucket rate.
+
+    Threads and coroutines share one queue. Each waiter sleeps on its own event,
+    woken when it reaches the head, so waiting coroutines hold no executor
+    thread, and the queue lock is never held while the bucket is drawn from
+    (a Redis round trip for RedisTokenBucket). A token drawn for a coroutine
+    that was cancelled meanwhile is handed to the next head, not lost.
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._prepaid = 0
+        self._lock = threading.Lock()
+
+    def _enqueue(self, priority: int, wake) -> tuple:
+        entry = (priority, next(self._sequence), wake)
+        with self._lock:
+            heapq.heappush(self._waiters, entry)
+        return entry
+
+    def _is_head(self, entry: tuple) -> bool:
+        with self._lock:
+            return self._waiters[0] is entry
+
+    def _dequeue(self, entry: tuple):
+        with self._lock:
+            was_head = self._waiters[0] is entry
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            head = self._waiters[0] if was_head and self._waiters else None
+        if head is not None:
+            head[2]()
+
+    def _draw(self) -> float:
+        """Take a handed-off token if there is one, otherwise draw from the bucket."""
+        with self._lock:
+            if self._prepaid:
+                self._prepaid -= 1
+                return 0.0
+        return self.bucket.try_acquire()
+
+    def _hand_off(self, draw):
+        """Done callback of a cancelled head's draw: keep a drawn token for the next head."""
+        if draw.cancelled() or draw.exception() is not None or draw.result():
+            return
+        with self._lock:
+            self._prepaid += 1
+            head = self._waiters[0] if self._waiters else None
+        if head is not None:
+            head[2]()
+
+    @staticmethod
+    def _remaining(started: float, timeout: Optional[float]) -> Optional[float]:
+        if timeout is None:
+            return None
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            raise RateLimitExceeded('Timed out waiting for the Bling rate limit')
+        return remaining
+
+    def acquire(self, priority: int = PRIORITY_DEFAULT, timeout: Optional[float] = None) -> float:
+        """
+        Block until a request may be sent.
+
+        Args:
+            priority (int): Lower values are served first.
+            timeout (float, optional): Maximum seconds to wait.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            RateLimitExceeded: If the daily quota is used up or `timeout` expires.
+        """
+        started = time.monotonic()
+        woken = threading.Event()
+        entry = self._enqueue(priority, woken.set)
+        try:
+            while True:
+                woken.clear()
+                remaining = self._remaining(started, timeout)
+                delay = None
+                if self._is_head(entry):
+                    delay = self._draw()
+                    if not delay:
+                        return time.monotonic() - started
+                if remaining is not None:
+                    delay = remaining if delay is None else min(delay, remaining)
+                woken.wait(delay)
+        finally:
+            self._dequeue(entry)
+
+    async def acquire_async(self, priority: int = PRIORITY_DEFAULT,
+                            timeout: Optional[float] = None) -> float:
+        """
+        Awaitable `acquire`: waits in the same queue without blocking the event
+        loop or an executor thread. Only a Redis draw runs in a worker thread.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+
+        def wake():
+            try:
+                loop.call_soon_threadsafe(woken.set)
+            except RuntimeError:  # the loop is closed, the waiter is gone with it
+                pass
+
+        started = time.monotonic()
+        entry = self._enqueue(priority, wake)
+        local = isinstance(self.bucket, LocalTokenBucket)
+        try:
+            while True:
+                woken.clear()
+                remaining = self._remaining(started, timeout)
+                delay = None
+                if self._is_head(entry):
+                    if local:
+                        delay = self._draw()
+                    else:
+                        draw = asyncio.ensure_future(asyncio.to_thread(self._draw))
+                        try:
+                            delay = await asyncio.shield(draw)
+                        except asyncio.CancelledError:
+                            draw.add_done_callback(self._hand_off)
+                            raise
+                    if not delay:
+                        return time.monotonic() - started
+                if remaining is not None:
+                    delay = remaining if delay is None else min(delay, remaining)
+                try:
+                    await asyncio.wait_for(woken.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._dequeue(entry)
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(key: str = 'rate_limit') -> RateLimiter:
+    """
+    Return the shared rate limiter for `key` (one per account or tenant).
+
+    Buckets follow `RATE_LIMIT_PER_SECOND`, `RATE_LIMIT_BURST` and
+    `RATE_LIMIT_DAILY_QUOTA` and live in Redis when `RATE_LIMIT_STORAGE` (by
+    default `TOKENS_STORAGE_METHOD`) is `redis`, in memory otherwise.
+    """
+    limiter = _limiters.get(key)
+    if limiter is not None:
+        return limiter
+
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            rate = ConfigSingleton.RATE_LIMIT_PER_SECOND
+            capacity = ConfigSingleton.RATE_LIMIT_BURST or math.ceil(rate)
+            daily_quota = ConfigSingleton.RATE_LIMIT_DAILY_QUOTA
+            storage = ConfigSingleton.RATE_LIMIT_STORAGE or ConfigSingleton.TOKENS_STORAGE_METHOD
+
+            if storage == 'redis':
+                bucket = RedisTokenBucket(key, rate, capacity, daily_quota)
+            else:
+                bucket = LocalTokenBucket(rate, capacity, daily_quota)
+            limiter = _limiters[key] = RateLimiter(bucket)
+    return limiter
@@ -1,3 +1,9 @@
+import os
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Tuple
+
 try:
     import redis  # type: ignore
 except ModuleNotFoundError as exc:  # pragma: no cover - guarded import
@@ -7,20 +13,106 @@ except ModuleNotFoundError as exc:  # pragma: no cover - guarded import
         'TOKENS_STORAGE_METHOD=json.'
     ) from exc
 
-from config import ConfigSingleton
+from config import ConfigSingleton, LazySetting
+
+_pool = None
+_client = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_connection_pool() -> redis.ConnectionPool:
+    """
+    Return the process-wide Redis connection pool, creating it on first use.
+
+    The pool is recreated after a fork, so pre-fork servers never share
+    sockets between worker processes.
+    """
+    global _pool, _client, _pool_pid
+
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = redis.ConnectionPool(
+                    host=RedisConn.HOST,
+                    port=RedisConn.PORT,
+                    password=RedisConn.PASSWORD,
+                    db=0,
+                    max_connections=ConfigSingleton.REDIS_MAX_CONNECTIONS,
+                    socket_timeout=ConfigSingleton.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=ConfigSingleton.REDIS_SOCKET_CONNECT_TIMEOUT,
+                    health_check_interval=ConfigSingleton.REDIS_HEALTH_CHECK_INTERVAL,
+                )
+                _client = redis.Redis(connection_pool=_pool)
+                _pool_pid = pid
+    return _pool
+
+def get_redis_connection() -> redis.Redis:
+    """
+    Return a Redis client backed by the shared connection pool.
+    """
+    get_connection_pool()
+    return _client
+
+def get_async_redis_connection():
+    """
+    Return a `redis.asyncio` client for the running event loop, backed by a
+    connection pool shared by every caller on that loop.
+    """
+    import redis.asyncio  # type: ignore
+
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        pool = redis.asyncio.ConnectionPool(
+            host=RedisConn.HOST,
+            port=RedisConn.PORT,
+            password=RedisConn.PASSWORD,
+            db=0,
+            max_connections=ConfigSingleton.REDIS_MAX_CONNECTIONS,
+            socket_timeout=ConfigSingleton.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=ConfigSingleton.REDIS_SOCKET_CONNECT_TIMEOUT,
+            health_check_interval=ConfigSingleton.REDIS_HEALTH_CHECK_INTERVAL,
+        )
+        client = _async_clients.setdefault(loop, redis.asyncio.Redis(connection_pool=pool))
+    return client
+
+def _reset_after_fork():
+    global _pool, _client, _pool_pid, _pool_lock
+    # Drop the parent's pool without closing its sockets, they still belong to the parent.
+    _pool, _client, _pool_pid = None, None, None
+    _pool_lock = threading.Lock()
+    _async_clients.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
 class RedisConn:
     """A class to handle Redis connection."""
 
-    HOST = ConfigSingleton.REDIS_HOST_IP or '127.0.0.1'
-    PORT = int(ConfigSingleton.REDIS_HOST_PORT or 6379)
-    PASSWORD = ConfigSingleton.REDIS_PASSWORD
+    # Resolved on first use; no connection is opened until a command is sent.
+    HOST = LazySetting(lambda name: ConfigSingleton.REDIS_HOST_IP or '127.0.0.1')
+    PORT = LazySetting(lambda name: int(ConfigSingleton.REDIS_HOST_PORT or 6379))
+    PASSWORD = LazySetting(lambda name: ConfigSingleton.REDIS_PASSWORD)
 
-    redis_connection = redis.Redis(host=HOST, port=PORT, password=PASSWORD, db=0)
+    @property
+    def redis_connection(self) -> redis.Redis:
+        return get_redis_connection()
 
 class RedisClient(RedisConn):
     """A class to handle Redis operations."""
 
+    @staticmethod
+    def is_bling_token_name(token_name: str) -> bool:
+        """
+        Whether `token_name` is an access/refresh token key, plain or tenant-namespaced
+        (e.g. `bling:<app>:<tenant>:access_token`).
+        """
+        return token_name.endswith(('access_token', 'refresh_token'))
+
     def set_bling_token(self, token_name: str,
                         token_value: str=None,
                         expires_in: int=21600):
@@ -32,9 +124,120 @@ class RedisClient(RedisConn):
         - token_value: The value of the token.
         - expires_in: The time in seconds until the token expires.
         """
-        if token_name in ['access_token', 'refresh_token']:
+        if self.is_bling_token_name(token_name):
             self.redis_connection.setex(token_name, expires_in, token_value)
 
+    def set_bling_tokens(self, tokens: List[Tuple[str, str, Optional[int]]],
+                         obtained_at: int):
+        """
+        Set several Bling tokens and their metadata atomically in one MULTI/EXEC round trip,
+        together with their refresh token expiries and the rotation event
+        (see `modules.token_events`).
+
+        Args:
+        - tokens: `(token_name, token_value, expires_in)` items.
+        - obtained_at: Unix timestamp when the tokens were obtained.
+        """
+        pipeline = self.redis_connection.pipeline(transaction=True)
+        self.queue_bling_tokens(pipeline, tokens, obtained_at)
+        pipeline.execute()
+
+    @classmethod
+    def queue_bling_tokens(cls, pipeline, tokens: List[Tuple[str, str, Optional[int]]], obtained_at: int):
+        """
+        Queue a token write on a MULTI/EXEC pipeline: the tokens and their
+        metadata, the refresh token expiries and the rotation event. Shared by
+        `set_bling_tokens` and the async Redis storage; works with sync and
+        `redis.asyncio` pipelines. Names that are not Bling tokens are skipped.
+        """
+        stored = []
+        for token_name, token_value, expires_in in tokens:
+            if not cls.is_bling_token_name(token_name):
+                continue
+            expires_in = expires_in or 21600
+            pipeline.setex(token_name, expires_in, token_value)
+            pipeline.setex(f'{token_name}_expires_in', expires_in, expires_in)
+            pipeline.setex(f'{token_name}_obtained_at', expires_in, obtained_at)
+            stored.append((token_name, token_value, expires_in))
+        cls.index_expiries(pipeline, stored, obtained_at)
+        cls.publish_rotation(pipeline, stored, obtained_at)
+
+    @staticmethod
+    def index_expiries(pipeline, tokens: List[Tuple[str, str, int]], obtained_at: int):
+        """
+        Queue the refresh token expiries of a token write in the
+        `REDIS_EXPIRY_INDEX_KEY` sorted set, and trim the entries that already
+        expired. Works with sync and `redis.asyncio` pipelines.
+        """
+        expiries = {token_name: obtained_at + expires_in
+                    for token_name, _, expires_in in tokens
+                    if token_name.endswith('refresh_token')}
+        if expiries:
+            pipeline.zadd(ConfigSingleton.REDIS_EXPIRY_INDEX_KEY, expiries)
+            pipeline.zremrangebyscore(ConfigSingleton.REDIS_EXPIRY_INDEX_KEY, '-inf', f'({int(time.time())}')
+
+    @staticmethod
+    def publish_rotation(pipeline, tokens: List[Tuple[str, str, int]], obtained_at: int):
+        """
+        Queue the rotation event of a token write on its MULTI/EXEC pipeline, so
+        the other processes' caches learn about it in the same transaction.
+        Works with sync and `redis.asyncio` pipelines.
+        """
+        if tokens and ConfigSingleton.REDIS_TOKEN_EVENTS_ENABLED:
+            from modules.token_events import rotation_message
+
+            pipeline.publish(ConfigSingleton.REDIS_TOKEN_EVENTS_CHANNEL,
+                             rotation_message(tokens, obtained_at))
+
+    def get_bling_token_record(self, token_name: str) -> Tuple[Optional[str], Optional[int], int]:
+        """
+        Get a Bling token with its expiry metadata in one pipelined round trip.
+
+        Returns:
+        - `(token_value, expires_in, obtained_at)`. `expires_in` is None when the key has no
+          TTL and 0 when the key is missing.
+        """
+        return self.get_bling_token_records([token_name])[token_name]
+
+    def get_bling_token_records(self, token_names: List[str]) -> Dict[str, Tuple[Optional[str], Optional[int], int]]:
+        """
+        Get many Bling token records with a single MGET plus TTLs in one pipelined round trip.
+
+        Returns:
+        - A dict of `(token_value, expires_in, obtained_at)` records keyed by token name.
+        """
+        if not token_names:
+            return {}
+
+        keys = []
+        for token_name in token_names:
+            keys.extend((token_name, f'{token_name}_expires_in', f'{token_name}_obtained_at'))
+
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        pipeline.mget(keys)
+        for token_name in token_names:
+            pipeline.ttl(token_name)
+        values, *ttls = pipeline.execute()
+
+        records = {}
+        for index, token_name in enumerate(token_names):
+            token, expires_in, obtained_at = values[index * 3:index * 3 + 3]
+            records[token_name] = self._token_record(token, expires_in, obtained_at, ttls[index])
+        return records
+
+    @staticmethod
+    def _token_record(token, expires_in, obtained_at, ttl) -> Tuple[Optional[str], Optional[int], int]:
+        if isinstance(token, bytes):
+            token = token.decode('utf-8')
+
+        if ttl is None or ttl == -2:
+            return token, 0, 0
+        if ttl == -1:
+            return token, None, int(time.time())
+        if expires_in is not None and obtained_at is not None:
+            return token, int(expires_in), int(obtained_at)
+        return token, ttl, int(time.time())
+
     def get_current_bling_access_token(self):
         """
         Get the current Bling access token from Redis.
@@ -0,0 +1,323 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from config import ConfigSingleton
+from modules import metrics
+
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+VALIDATOR_HEADERS = ('ETag', 'Last-Modified')
+KEPT_HEADERS = ('Content-Type',) + VALIDATOR_HEADERS
+
+def parse_ttls(value: str) -> Dict[str, int]:
+    """Parse `RESPONSE_CACHE_TTLS` (`/path=seconds,...`) into TTLs by path prefix."""
+    ttls = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        path, _, seconds = item.partition('=')
+        ttls['/' + path.strip().strip('/')] = int(seconds)
+    return ttls
+
+@dataclass
+class CachedResponse:
+    """A stored GET response; it is fresh until `expires_at`, then only revalidatable."""
+
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+    expires_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.content) + sum(len(key) + len(value) for key, value in self.headers.items()) + 64
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers for revalidation, empty if the API sent no validators."""
+        headers = {}
+        if 'ETag' in self.headers:
+            headers['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+    def to_response(self, url: str) -> 'requests.Response':
+        import requests
+
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.headers.update(self.headers)
+        response._content = self.content
+        response.url = url
+        response.from_cache = True
+        return response
+
+    def encode(self) -> bytes:
+        meta = json.dumps({'status_code': self.status_code,
+                           'headers': self.headers,
+                           'expires_at': self.expires_at}, separators=(',', ':'))
+        return meta.encode('utf-8') + b'\n' + self.content
+
+    @classmethod
+    def decode(cls, payload: bytes) -> 'CachedResponse':
+        meta, _, content = payload.partition(b'\n')
+        return cls(content=content, **json.loads(meta))
+
+class ResponseCache:
+    """
+    An opt-in cache for GET responses of the Bling API, keyed by account
+    (token key prefix), URL, query parameters and caller headers.
+
+    Entries live in a byte-bounded LRU in this process and, with `redis_tier`,
+    in Redis (`RedisConn` settings) so every process and host shares them.
+    Each path prefix can have its own TTL (`RESPONSE_CACHE_TTLS`, 0 disables
+    caching); other paths use `RESPONSE_CACHE_DEFAULT_TTL`, 0 by default, so
+    only the configured reference data is cached. Expired entries whose
+    response carried an ETag or Last-Modified header are kept for
+    `RESPONSE_CACHE_STALE_TTL` seconds and revalidated with a conditional request,
+    a 304 renewing them without downloading the body again.
+
+    Only 200 responses are stored. A write through the session drops the
+    account's entries for the written path, its collections and its children
+    (`invalidate_path`) in this process and in Redis; other processes' memory
+    tiers keep theirs until they expire.
+    """
+
+    REDIS_PREFIX = 'bling:response-cache:'
+
+    def __init__(self,
+                 max_bytes: Optional[int] = None,
+                 default_ttl: Optional[int] = None,
+                 ttls: Optional[Dict[str, int]] = None,
+                 stale_ttl: Optional[int] = None,
+                 redis_tier: Optional[bool] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else ConfigSingleton.RESPONSE_CACHE_MAX_BYTES
+        self.default_ttl = default_ttl if default_ttl is not None else ConfigSingleton.RESPONSE_CACHE_DEFAULT_TTL
+        self.ttls = ttls if ttls is not None else parse_ttls(ConfigSingleton.RESPONSE_CACHE_TTLS)
+        self.stale_ttl = stale_ttl if stale_ttl is not None else ConfigSingleton.RESPONSE_CACHE_STALE_TTL
+        self.redis_tier = redis_tier if redis_tier is not None else ConfigSingleton.RESPONSE_CACHE_REDIS
+        self._prefixes = sorted(self.ttls, key=len, reverse=True)
+        self._entries: 'OrderedDict[str, CachedResponse]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hit': 0, 'miss': 0, 'revalidated': 0, 'bytes_saved': 0}
+
+    def ttl(self, url: str) -> int:
+        """
+        Return the TTL of a URL: that of the longest `ttls` path (e.g. `/categorias`)
+        found in its path, or `default_ttl`.
+        """
+        path = urlsplit(url).path.rstrip('/') + '/'
+        for prefix in self._prefixes:
+            if f'{prefix}/' in path:
+                return self.ttls[prefix]
+        return self.default_ttl
+
+    @staticmethod
+    def key(account: str, url: str, params=None, headers=None) -> str:
+        if params:
+            items = params.items() if isinstance(params, dict) else params
+            url = f'{url}?{urlencode(sorted((str(key), str(value)) for key, value in items))}'
+        if headers:
+            url = f'{url}#{urlencode(sorted((str(key).lower(), str(value)) for key, value in headers.items()))}'
+        return f'{account or "default"}|{url}'
+
+    def _redis_key(self, key: str) -> str:
+        return self.REDIS_PREFIX + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _index_key(self, account: str) -> str:
+        return f'{self.REDIS_PREFIX}index:{account or "default"}'
+
+    @property
+    def _index_ttl(self) -> float:
+        return max([self.default_ttl, *self.ttls.values()]) + self.stale_ttl
+
+    def _record(self, result: str, tier: str, entry: Optional[CachedResponse] = None):
+        self.stats[result] += 1
+        metrics.increment('bling_response_cache_total', result=result, tier=tier)
+        if result == 'hit':
+            metrics.increment('bling_response_cache_requests_saved_total')
+        if entry is not None:
+            self.stats['bytes_saved'] += len(entry.content)
+            metrics.increment('bling_response_cache_bytes_saved_total', len(entry.content))
+
+    def _report_size(self):
+        metrics.gauge('bling_response_cache_bytes', self._bytes)
+        metrics.gauge('bling_response_cache_entries', len(self._entries))
+
+    def _remember(self, key: str, entry: CachedResponse):
+        size = entry.size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+        self._report_size()
+
+    def lookup(self, key: str) -> Tuple[Optional[CachedResponse], str]:
+        """
+        Return `(entry, tier)` for a key: a fresh or revalidatable entry from memory,
+        then from Redis, or `(None, '')`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            return entry, 'memory'
+
+        if self.redis_tier:
+            from modules import redis_client
+            try:
+                payload = redis_client.get_redis_connection().get(self._redis_key(key))
+            except redis_client.redis.RedisError as exc:
+                logger.warning('Response cache Redis tier unavailable: %s', exc)
+                payload = None
+            if payload:
+                entry = CachedResponse.decode(payload)
+                self._remember(key, entry)
+                return entry, 'redis'
+        return None, ''
+
+    def store(self, key: str, url: str, response: 'requests.Response'):
+        """Store a 200 response for the TTL of its URL."""
+        ttl = self.ttl(url)
+        if response.status_code != 200 or ttl <= 0:
+            return
+        headers = {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers}
+        self.save(key, CachedResponse(response.status_code, headers, response.content, time.time() + ttl))
+
+    def renew(self, key: str, url: str, entry: CachedResponse, response: 'requests.Response') -> CachedResponse:
+        """Renew an entry the API confirmed with a 304, adopting any new validators."""
+        headers = dict(entry.headers)
+        headers.update({name: response.headers[name] for name in VALIDATOR_HEADERS if name in response.headers})
+        entry = CachedResponse(entry.status_code, headers, entry.content, time.time() + self.ttl(url))
+        self.save(key, entry)
+        return entry
+
+    def save(self, key: str, entry: CachedResponse):
+        self._remember(key, entry)
+        if not self.redis_tier:
+            return
+
+        from modules import redis_client
+        keep_for = entry.expires_at - time.time()
+        if entry.validators():
+            keep_for += self.stale_ttl
+        redis_key = self._redis_key(key)
+        index_key = self._index_key(key.partition('|')[0])
+        try:
+            pipeline = redis_client.get_redis_connection().pipeline(transaction=False)
+            pipeline.set(redis_key, entry.encode(), px=max(1, int(keep_for * 1000)))
+            # Per-account index of cached URLs, so writes can find their entries.
+            pipeline.hset(index_key, redis_key, key)
+            pipeline.pexpire(index_key, int(self._index_ttl * 1000))
+            pipeline.execute()
+        except redis_client.redis.RedisError as exc:
+            logger.warning('Response cache Redis tier unavailable: %s', exc)
+
+    @staticmethod
+    def _affected(written: str, cached: str) -> bool:
+        """Whether a write to path `written` may change the response cached for path `cached`."""
+        return cached == written or cached.startswith(written + '/') or written.startswith(cached + '/')
+
+    def invalidate_path(self, account: str, url: str):
+        """
+        Drop the entries of `account` that a write to `url` may have changed: the
+        same path, its parents (e.g. the `/produtos` list after a PUT to
+        `/produtos/1`) and its children, with any query string.
+        """
+        account = account or 'default'
+        written = urlsplit(url).path.rstrip('/')
+
+        def affected(key: str) -> bool:
+            key_account, _, key_url = key.partition('|')
+            return key_account == account and self._affected(written, urlsplit(key_url).path.rstrip('/'))
+
+        with self._lock:
+            for key in [key for key in self._entries if affected(key)]:
+                self._bytes -= self._entries.pop(key).size
+        self._report_size()
+        if not self.redis_tier:
+            return
+
+        from modules import redis_client
+        index_key = self._index_key(account)
+        try:
+            connection = redis_client.get_redis_connection()
+            stale = [redis_key for redis_key, key in connection.hgetall(index_key).items()
+                     if affected(key.decode('utf-8') if isinstance(key, bytes) else key)]
+            if stale:
+                pipeline = connection.pipeline(transaction=False)
+                pipeline.delete(*stale)
+                pipeline.hdel(index_key, *stale)
+                pipeline.execute()
+        except redis_client.redis.RedisError as exc:
+            logger.warning('Response cache Redis tier unavailable: %s', exc)
+
+    def invalidate(self):
+        """Drop every in-memory entry (Redis entries expire with their TTL)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        self._report_size()
+
+    @property
+    def size(self) -> int:
+        """Bytes held by the in-memory tier."""
+        return self._bytes
+
+    def fetch(self, account: str, url: str, params, send, headers=None) -> 'requests.Response':
+        """
+        Return the cached response of a GET, or call `send(extra_headers)` to get
+        (or revalidate) it and cache the result. URLs whose TTL is 0 are sent as is.
+        """
+        if self.ttl(url) <= 0:
+            return send({})
+        key = self.key(account, url, params, headers)
+        entry, tier = self.lookup(key)
+        if entry is not None and entry.fresh:
+            self._record('hit', tier, entry)
+            return entry.to_response(url)
+
+        validators = entry.validators() if entry is not None else {}
+        response = send(validators)
+        if response.status_code == 304 and entry is not None:
+            self._record('revalidated', tier, entry)
+            return self.renew(key, url, entry, response).to_response(url)
+
+        self._record('miss', tier or 'none')
+        self.store(key, url, response)
+        return response
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the process-wide ResponseCache, or None unless `RESPONSE_CACHE_ENABLED`."""
+    global _cache
+    if not ConfigSingleton.RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,190 @@
+import logging
+import random
+import sys
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+from config import ConfigSingleton
+from modules import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# Statuses stating that the request was not processed (RFC 6585, RFC 9110), so
+# even a non-idempotent request, such as a token grant, can be sent again.
+NOT_PROCESSED_STATUS_CODES = frozenset({429, 503})
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+def retry_after(response) -> Optional[float]:
+    """Return the `Retry-After` delay of a response in seconds (number or HTTP date), if any."""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def transport_error(exc: BaseException) -> Optional[BaseException]:
+    """
+    Return the `requests`/`httpx` transport error behind `exc` (itself or the
+    error it was raised from, as in `BlingApiError(...) from exc`), or None.
+    """
+    requests, httpx = sys.modules.get('requests'), sys.modules.get('httpx')
+    for error in (exc, exc.__cause__):
+        if requests is not None and isinstance(error, requests.RequestException):
+            return error
+        if httpx is not None and isinstance(error, httpx.TransportError):
+            return error
+    return None
+
+def is_connect_error(exc: BaseException) -> bool:
+    """
+    Whether a transport error happened before the request was sent (DNS failure,
+    connection refused, connect timeout), so the server never saw it.
+    """
+    requests, httpx = sys.modules.get('requests'), sys.modules.get('httpx')
+    if requests is not None and isinstance(exc, requests.ConnectTimeout):
+        return True
+    if requests is not None and isinstance(exc, requests.ConnectionError):
+        import urllib3
+
+        # requests wraps urllib3's MaxRetryError, whose reason tells the phase apart.
+        reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+        return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+    if httpx is not None:
+        return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+    return False
+
+class RetryPolicy:
+    """
+    Retries transient failures with decorrelated-jitter backoff: each delay is
+    drawn between `base_delay` and three times the previous one, capped at
+    `max_delay`, so clients that failed together do not come back together.
+    A `Retry-After` header is honored (plus up to `base_delay` of jitter).
+
+    Network errors and 429/5xx responses are retried; anything else (e.g. a 400
+    `invalid_grant`) is returned or raised at once. Requests that are not
+    idempotent, token grants included, are only sent again when the server
+    cannot have processed them: connection failures before sending and 429/503
+    responses. A read timeout or a 502 after a refresh grant may hide a rotated
+    refresh token, and replaying the old one would fail or revoke the new one.
+
+    No retry starts after `deadline` seconds: `send` gets the remaining budget
+    to clamp the timeout of retries (infinite for the first attempt, which
+    keeps its usual timeout).
+
+    Args:
+        max_attempts (int, optional): Attempts including the first, `RETRY_MAX_ATTEMPTS` by default.
+        base_delay (float, optional): Smallest delay in seconds, `RETRY_BASE_DELAY` by default.
+        max_delay (float, optional): Largest backoff delay, `RETRY_MAX_DELAY` by default.
+        deadline (float, optional): Total time budget in seconds, `RETRY_DEADLINE` by default.
+    """
+
+    def __init__(self,
+                 max_attempts: Optional[int] = None,
+                 base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None,
+                 deadline: Optional[float] = None):
+        self.max_attempts = max(1, max_attempts if max_attempts is not None else ConfigSingleton.RETRY_MAX_ATTEMPTS)
+        self.base_delay = base_delay if base_delay is not None else ConfigSingleton.RETRY_BASE_DELAY
+        self.max_delay = max_delay if max_delay is not None else ConfigSingleton.RETRY_MAX_DELAY
+        self.deadline = deadline if deadline is not None else ConfigSingleton.RETRY_DEADLINE
+
+    def backoff(self, previous: float) -> float:
+        """Return the decorrelated-jitter delay following a delay of `previous` seconds."""
+        return min(self.max_delay, random.uniform(self.base_delay, max(self.base_delay, previous) * 3))
+
+    def delay(self, previous: float, response=None) -> float:
+        """Return the wait before the next attempt: the response's `Retry-After`, or the backoff."""
+        wait = retry_after(response)
+        if wait is not None:
+            return wait + random.uniform(0, self.base_delay)
+        return self.backoff(previous)
+
+    @staticmethod
+    def retryable(exc: Optional[BaseException], response, idempotent: bool) -> Optional[str]:
+        """Return the retry reason of a failed attempt (for metrics), or None if it is final."""
+        if exc is not None:
+            error = transport_error(exc)
+            if error is None:
+                return None
+            if is_connect_error(error):
+                return 'connect'
+            return 'network' if idempotent else None
+        status = response.status_code
+        if status in NOT_PROCESSED_STATUS_CODES or (idempotent and status in RETRY_STATUS_CODES):
+            return str(status)
+        return None
+
+    @staticmethod
+    def _remaining(attempt: int, expires_at: float) -> float:
+        return float('inf') if attempt == 1 else max(0.0, expires_at - time.monotonic())
+
+    def _next_delay(self, attempt: int, previous: float, expires_at: float, operation: str,
+                    exc: Optional[BaseException], response, idempotent: bool) -> Optional[float]:
+        """Return the delay before attempt `attempt + 1`, or None to stop retrying."""
+        if attempt >= self.max_attempts:
+            return None
+        reason = self.retryable(exc, response, idempotent)
+        if reason is None:
+            return None
+
+        delay = self.delay(previous, response)
+        if time.monotonic() + delay >= expires_at:
+            logger.warning('Giving up %s retries: waiting %.1fs would pass the %.0fs deadline',
+                           operation, delay, self.deadline)
+            return None
+
+        metrics.increment('bling_retries_total', operation=operation, reason=reason)
+        return delay
+
+    def call(self, send: Callable[[float], object], idempotent: bool = True, operation: str = 'api'):
+        """
+        Call `send(remaining_seconds)` until it returns a final response, retrying
+        as described above. Returns the last response or raises the last error.
+        """
+        expires_at = time.monotonic() + self.deadline
+        delay = 0.0
+        for attempt in range(1, self.max_attempts + 1):
+            exc = response = None
+            try:
+                response = send(self._remaining(attempt, expires_at))
+            except Exception as error:
+                exc = error
+            delay = self._next_delay(attempt, delay, expires_at, operation, exc, response, idempotent)
+            if delay is None:
+                if exc is not None:
+                    raise exc
+                return response
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+
+    async def acall(self, send, idempotent: bool = True, operation: str = 'api'):
+        """The asyncio counterpart of `call`; `send(remaining_seconds)` is a coroutine function."""
+        import asyncio
+
+        expires_at = time.monotonic() + self.deadline
+        delay = 0.0
+        for attempt in range(1, self.max_attempts + 1):
+            exc = response = None
+            try:
+                response = await send(self._remaining(attempt, expires_at))
+            except Exception as error:
+                exc = error
+            delay = self._next_delay(attempt, delay, expires_at, operation, exc, response, idempotent)
+            if delay is None:
+                if exc is not None:
+                    raise exc
+                return response
+            await asyncio.sleep(delay)
+
+def default_retry_policy() -> Optional[RetryPolicy]:
+    """Return a RetryPolicy from the settings, or None unless `RETRY_ENABLED`."""
+    return RetryPolicy() if ConfigSingleton.RETRY_ENABLED else None
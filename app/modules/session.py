@@ -0,0 +1,184 @@
+from typing import Optional
+
+import requests
+
+from config import ConfigSingleton
+from modules.bling import (BlingApiError, BlingApiTokenHandler, TokenStorage,
+                           get_valid_access_token, refresh_access_token)
+from modules.http_client import build_http_session, get_http_session
+from modules.rate_limit import PRIORITY_DEFAULT, get_rate_limiter
+from modules.response_cache import ResponseCache, get_response_cache
+from modules.retry import IDEMPOTENT_METHODS, RetryPolicy, default_retry_policy
+
+class BlingSession:
+    """
+    An authenticated client for the Bling v3 API.
+
+    Requests share one pooled `requests.Session` (keep-alive and TLS session
+    reuse), carry the current Bearer token taken from the in-process token cache,
+    and on a 401 the token is refreshed once through the token handler and the
+    request replayed.
+
+    With a `response_cache` (the shared one when `RESPONSE_CACHE_ENABLED`), GET
+    responses are served from it while fresh and revalidated with the API
+    afterwards; cached responses have `from_cache = True`. Writes invalidate
+    the cached responses of the path they change.
+
+    With a `retry_policy` (built from the `RETRY_*` settings when `RETRY_ENABLED`),
+    network errors and 429/5xx responses are retried with jittered backoff;
+    POST and PATCH only when the request cannot have reached the API.
+
+    Args:
+        token_storage (TokenStorage, optional): Token storage, `TokenStorage()` by default.
+        token_handler (BlingApiTokenHandler, optional): Handler used to refresh tokens.
+        pool_connections (int, optional): Per-host pools; a dedicated session is built when set.
+        pool_maxsize (int, optional): Connections kept per host; a dedicated session is built when set.
+        keep_alive (bool, optional): Reuse connections; a dedicated session is built when set.
+        timeout (float, optional): Request timeout in seconds, `HTTP_TIMEOUT` by default.
+        response_cache (ResponseCache, optional): GET response cache, `get_response_cache()` by default.
+        retry_policy (RetryPolicy, optional): Retry policy, `default_retry_policy()` by default.
+    """
+
+    def __init__(self,
+                 token_storage: Optional[TokenStorage] = None,
+                 token_handler: Optional[BlingApiTokenHandler] = None,
+                 pool_connections: Optional[int] = None,
+                 pool_maxsize: Optional[int] = None,
+                 keep_alive: Optional[bool] = None,
+                 timeout: Optional[float] = None,
+                 base_url: Optional[str] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
+        self.token_storage = token_storage or TokenStorage()
+        self.token_handler = token_handler or BlingApiTokenHandler()
+        self.timeout = timeout or ConfigSingleton.HTTP_TIMEOUT
+        self.base_url = (base_url or ConfigSingleton.BLING_API_URL).rstrip('/')
+        self.response_cache = response_cache or get_response_cache()
+        self.retry_policy = retry_policy or default_retry_policy()
+
+        if pool_connections or pool_maxsize or keep_alive is not None:
+            self.http = build_http_session(pool_connections, pool_maxsize, keep_alive)
+            self._owns_http = True
+        else:
+            self.http = get_http_session()
+            self._owns_http = False
+
+    def url(self, path: str) -> str:
+        """Return the absolute URL of an API path such as `/produtos`."""
+        if path.startswith(('http://', 'https://')):
+            return path
+        return f'{self.base_url}/{path.lstrip("/")}'
+
+    def access_token(self) -> str:
+        """
+        Return the current valid access token.
+
+        Raises:
+            BlingApiError: If there is no token and no refresh token to get one.
+        """
+        access_token = get_valid_access_token(self.token_storage, self.token_handler)
+        if not access_token:
+            raise BlingApiError('No access token available, authorize with get_token_using_code first')
+        return access_token
+
+    def _send(self, method: str, url: str, access_token: str, **kwargs) -> requests.Response:
+        headers = {
+            'Accept': 'application/json',
+            **kwargs.pop('headers', {}),
+            'Authorization': f'Bearer {access_token}',
+        }
+        kwargs.setdefault('timeout', self.timeout)
+        return self.http.request(method, url, headers=headers, **kwargs)
+
+    def _throttle(self, priority: int):
+        if ConfigSingleton.RATE_LIMIT_ENABLED:
+            get_rate_limiter(self.token_handler.rate_limit_key).acquire(priority)
+
+    def request(self, method: str, path: str,
+                priority: int = PRIORITY_DEFAULT,
+                retry: bool = True,
+                **kwargs) -> requests.Response:
+        """
+        Send an authenticated request, refreshing the token and replaying once on a 401.
+        With `RATE_LIMIT_ENABLED` every attempt waits for the account's rate limiter.
+        GET requests go through the response cache, if any; cache hits use no quota,
+        and writes (POST, PUT, PATCH, DELETE) drop the cached responses of the path they change.
+
+        Args:
+            method (str): HTTP method.
+            path (str): API path (e.g. `/produtos`) or absolute URL.
+            priority (int): Rate limiter priority, e.g. `PRIORITY_BULK` for batch jobs.
+            retry (bool): Apply the retry policy; False for callers running their own retries.
+            **kwargs: Passed on to `requests.Session.request`.
+
+        Returns:
+            requests.Response: The API response.
+        """
+        url = self.url(path)
+        if method.upper() == 'GET' and self.response_cache is not None:
+            def send(validators):
+                headers = {**kwargs.get('headers', {}), **validators}
+                return self._request(method, url, priority, retry, **{**kwargs, 'headers': headers})
+
+            return self.response_cache.fetch(self.token_handler.key_prefix, url,
+                                             kwargs.get('params'), send, kwargs.get('headers'))
+        try:
+            return self._request(method, url, priority, retry, **kwargs)
+        finally:
+            if self.response_cache is not None and method.upper() not in ('HEAD', 'OPTIONS'):
+                self.response_cache.invalidate_path(self.token_handler.key_prefix, url)
+
+    def _attempt(self, method: str, url: str, access_token: str, priority: int,
+                 retry: bool, kwargs: dict) -> requests.Response:
+        """Send one request, retried through the retry policy when there is one."""
+        def send(remaining: float) -> requests.Response:
+            self._throttle(priority)
+            timeout = kwargs.get('timeout') or self.timeout
+            if isinstance(timeout, (int, float)):
+                timeout = min(timeout, max(remaining, 1.0))
+            return self._send(method, url, access_token, **{**kwargs, 'timeout': timeout})
+
+        if not retry or self.retry_policy is None:
+            return send(float('inf'))
+        return self.retry_policy.call(send, idempotent=method.upper() in IDEMPOTENT_METHODS)
+
+    def _request(self, method: str, url: str, priority: int, retry: bool, **kwargs) -> requests.Response:
+        access_token = self.access_token()
+        response = self._attempt(method, url, access_token, priority, retry, kwargs)
+
+        if response.status_code == 401:
+            response.close()
+            access_token = refresh_access_token(self.token_storage,
+                                                self.token_handler,
+                                                stale_token=access_token)
+            if not access_token:
+                raise BlingApiError('Access token rejected and no refresh token available')
+            response = self._attempt(method, url, access_token, priority, retry, kwargs)
+
+        return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request('PUT', path, **kwargs)
+
+    def patch(self, path: str, **kwargs) -> requests.Response:
+        return self.request('PATCH', path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        """Close the connection pool if this session owns it."""
+        if self._owns_http:
+            self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,442 @@
+import bisect
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from config import ConfigSingleton
+from modules import token_events
+from modules.json_store import JsonCredentialStore
+from modules.locks import FileLock, NullLock, RedisLease
+from modules.token_cache import token_cache
+
+logger = logging.getLogger(__name__)
+
+TokenEntry = Tuple[str, str, Optional[int]]
+TokenRecord = Tuple[Optional[str], Optional[int], int]
+Expiry = Tuple[str, float]
+
+CREDENTIALS_DIRNAME = 'credential'
+
+def credentials_folder() -> str:
+    return os.path.join(ConfigSingleton.BASE_DIR, CREDENTIALS_DIRNAME)
+
+def metadata_keys(token_key_name: str) -> Tuple[str, str]:
+    return (f'{token_key_name}_expires_in', f'{token_key_name}_obtained_at')
+
+def is_refresh_token_key(token_key: str) -> bool:
+    """Whether a key holds a refresh token, plain or tenant-namespaced."""
+    return token_key.endswith('refresh_token')
+
+def is_record_expired(expires_in: Optional[int], obtained_at: int) -> bool:
+    """
+    Check `expires_in`/`obtained_at` metadata against `ACCESS_TOKEN_EXPIRY_SKEW`.
+    """
+    if expires_in is None:
+        return False
+    if not expires_in or not obtained_at:
+        return True
+    now = int(time.time())
+    return now >= (obtained_at + expires_in - ConfigSingleton.ACCESS_TOKEN_EXPIRY_SKEW)
+
+def refresh_lease_key(lock_name: str) -> str:
+    """Return the Redis key of the refresh lease for `lock_name`."""
+    return f'{lock_name}:refresh_lock'
+
+def refresh_lock_path(lock_name: str, folder: Optional[str] = None) -> str:
+    """Return the striped lock file guarding refreshes of `lock_name`."""
+    stripe = zlib.crc32(lock_name.encode('utf-8')) % ConfigSingleton.REFRESH_LOCK_STRIPES
+    return os.path.join(folder or credentials_folder(), f'refresh-{stripe}.lock')
+
+class StorageBackend:
+    """
+    The interface every token storage backend implements.
+
+    Records are `(token_value, expires_in, obtained_at)`: `expires_in` is None
+    for a token that never expires, and a missing token reads as `(None, 0, 0)`.
+    Backends receive entries whose default lifetimes were already filled in by
+    `TokenStorage.save_tokens`.
+    """
+
+    name = ''
+    # Whether reads may block on I/O; the async adapter then runs them in a
+    # thread, unless `read_is_cached()` says the next one will not.
+    blocking_reads = True
+
+    def save_tokens(self, entries: List[TokenEntry], obtained_at: int):
+        """Store `(token_key_name, token_value, expires_in)` entries in one atomic write."""
+        raise NotImplementedError
+
+    def retrieve_token_record(self, token_key: str) -> TokenRecord:
+        raise NotImplementedError
+
+    def retrieve_token_by_key(self, token_key: str) -> Optional[str]:
+        return self.retrieve_token_record(token_key)[0]
+
+    def read_is_cached(self) -> bool:
+        """Whether the next read is answered from memory, cheap enough for an event loop."""
+        return not self.blocking_reads
+
+    def retrieve_token_records(self, token_keys: List[str]) -> Dict[str, TokenRecord]:
+        return {token_key: self.retrieve_token_record(token_key) for token_key in token_keys}
+
+    def is_token_expired(self, token_key: str) -> bool:
+        token, expires_in, obtained_at = self.retrieve_token_record(token_key)
+        return not token or is_record_expired(expires_in, obtained_at)
+
+    def refresh_token_expiries(self, start: float, end: float, limit: int) -> List[Expiry]:
+        """
+        Return up to `limit` `(refresh_token_key, expires_at)` pairs whose refresh
+        token expires in `[start, end]`, nearest expiry first, from the backend's
+        expiry index. Refresh tokens that never expire are not indexed.
+        """
+        raise NotImplementedError(f'The {self.name or type(self).__name__} backend has no expiry index')
+
+    def rebuild_expiry_index(self):
+        """Index refresh tokens stored before the index existed (a full scan, run once)."""
+
+    def refresh_lock_path(self, lock_name: str) -> Optional[str]:
+        """The lock file guarding a refresh, or None when the backend locks otherwise."""
+        return refresh_lock_path(lock_name)
+
+    def refresh_lock(self, lock_name: str):
+        """Return the cross-process lock guarding a refresh of `lock_name`."""
+        return FileLock(self.refresh_lock_path(lock_name), timeout=ConfigSingleton.REFRESH_LOCK_TIMEOUT)
+
+class JsonStorageBackend(StorageBackend):
+    """
+    Tokens in `credential/credentials.json`, written atomically through
+    JsonCredentialStore and re-parsed only when the file changes.
+    """
+
+    name = 'json'
+    FILENAME = 'credentials.json'
+
+    def path(self) -> str:
+        return os.path.join(credentials_folder(), self.FILENAME)
+
+    def store(self) -> JsonCredentialStore:
+        return JsonCredentialStore.for_path(self.path())
+
+    def read_is_cached(self) -> bool:
+        # A `stat` of a local file; only a changed file is opened and parsed.
+        return self.store().is_current()
+
+    @staticmethod
+    def _record(file_dict: dict, token_key: str) -> TokenRecord:
+        expires_in_key, obtained_at_key = metadata_keys(token_key)
+        try:
+            expires_in = int(file_dict.get(expires_in_key))
+            obtained_at = int(file_dict.get(obtained_at_key))
+        except (TypeError, ValueError):
+            expires_in, obtained_at = 0, 0
+        return file_dict.get(token_key), expires_in, obtained_at
+
+    def save_tokens(self, entries: List[TokenEntry], obtained_at: int):
+        credentials = {}
+        for token_key_name, token_value, expires_in in entries:
+            credentials[token_key_name] = token_value
+            expires_in_key, obtained_at_key = metadata_keys(token_key_name)
+            if expires_in is not None:
+                credentials[expires_in_key] = expires_in
+            credentials[obtained_at_key] = obtained_at
+        self.store().update(credentials)
+
+    def retrieve_token_by_key(self, token_key: str) -> Optional[str]:
+        return self.store().read().get(token_key)
+
+    def retrieve_token_record(self, token_key: str) -> TokenRecord:
+        return self._record(self.store().read(), token_key)
+
+    def retrieve_token_records(self, token_keys: List[str]) -> Dict[str, TokenRecord]:
+        file_dict = self.store().read()
+        return {token_key: self._record(file_dict, token_key) for token_key in token_keys}
+
+    def refresh_token_expiries(self, start: float, end: float, limit: int) -> List[Expiry]:
+        # One scan of the parsed file; the JSON backend is meant for a handful of accounts.
+        file_dict = self.store().read()
+        expiries = []
+        for token_key in file_dict:
+            if not is_refresh_token_key(token_key):
+                continue
+            _, expires_in, obtained_at = self._record(file_dict, token_key)
+            if expires_in and start <= obtained_at + expires_in <= end:
+                expiries.append((token_key, obtained_at + expires_in))
+        return sorted(expiries, key=lambda expiry: expiry[1])[:limit]
+
+class RedisStorageBackend(StorageBackend):
+    """
+    Tokens in Redis, with their metadata, on the shared connection pool.
+    Refreshes are guarded by a `SET NX PX` lease, and every write publishes a
+    rotation event that keeps the token caches of all processes coherent
+    (`modules.token_events`).
+    """
+
+    name = 'redis'
+
+    @staticmethod
+    def connection():
+        from modules import redis_client
+        return redis_client.get_redis_connection()
+
+    def save_tokens(self, entries: List[TokenEntry], obtained_at: int):
+        from modules import redis_client
+        token_events.ensure_listening()
+        try:
+            redis_client.RedisClient().set_bling_tokens(entries, obtained_at)
+        except redis_client.redis.RedisError:
+            logger.exception('Could not save the Bling tokens to Redis')
+            raise
+
+    def retrieve_token_by_key(self, token_key: str) -> Optional[str]:
+        token = self.connection().get(token_key)
+        if isinstance(token, bytes):
+            token = token.decode('utf-8')
+        return token
+
+    def retrieve_token_record(self, token_key: str) -> TokenRecord:
+        from modules import redis_client
+        token_events.ensure_listening()
+        return redis_client.RedisClient().get_bling_token_record(token_key)
+
+    def retrieve_token_records(self, token_keys: List[str]) -> Dict[str, TokenRecord]:
+        from modules import redis_client
+        token_events.ensure_listening()
+        return redis_client.RedisClient().get_bling_token_records(token_keys)
+
+    def refresh_token_expiries(self, start: float, end: float, limit: int) -> List[Expiry]:
+        members = self.connection().zrangebyscore(ConfigSingleton.REDIS_EXPIRY_INDEX_KEY, start, end,
+                                                  start=0, num=limit, withscores=True)
+        return [(member.decode('utf-8') if isinstance(member, bytes) else member, score)
+                for member, score in members]
+
+    def rebuild_expiry_index(self):
+        from modules import redis_client
+
+        connection = self.connection()
+        keys = [key.decode('utf-8') if isinstance(key, bytes) else key
+                for key in connection.scan_iter(match='*refresh_token', count=1000)]
+        records = redis_client.RedisClient().get_bling_token_records(keys)
+        expiries = {key: obtained_at + expires_in
+                    for key, (token, expires_in, obtained_at) in records.items()
+                    if token and expires_in}
+        if expiries:
+            connection.zadd(ConfigSingleton.REDIS_EXPIRY_INDEX_KEY, expiries)
+
+    def is_token_expired(self, token_key: str) -> bool:
+        ttl = self.connection().ttl(token_key)
+        if ttl is None or ttl == -2:
+            return True
+        if ttl == -1:
+            return False
+        return ttl <= ConfigSingleton.ACCESS_TOKEN_EXPIRY_SKEW
+
+    def refresh_lock_path(self, lock_name: str) -> Optional[str]:
+        return None
+
+    def refresh_lock(self, lock_name: str) -> RedisLease:
+        timeout = ConfigSingleton.REFRESH_LOCK_TIMEOUT
+        return RedisLease(self.connection(),
+                          key=refresh_lease_key(lock_name),
+                          lease_ms=timeout * 1000,
+                          timeout=timeout)
+
+class SqliteStorageBackend(StorageBackend):
+    """
+    Tokens in an SQLite database in WAL mode: one row per token key (tenant
+    keys included) indexed by its primary key, with every `save_tokens` call
+    written in a single transaction. Readers never block the writer, so several
+    processes on one host can share it without Redis. Refresh tokens are also
+    indexed by expiry (`obtained_at + expires_in`).
+
+    Each thread gets its own connection, reopened after a fork.
+    """
+
+    name = 'sqlite'
+    FILENAME = 'credentials.sqlite3'
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS tokens (
+            token_key   TEXT PRIMARY KEY,
+            token_value TEXT NOT NULL,
+            expires_in  INTEGER,
+            obtained_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    '''
+    # substr, not LIKE: `_` is a LIKE wildcard. Queries must repeat the same
+    # condition for SQLite to use the partial index.
+    REFRESH_TOKEN_KEY = "substr(token_key, -13) = 'refresh_token'"
+    EXPIRY_INDEX = f'''
+        CREATE INDEX IF NOT EXISTS tokens_refresh_token_expiry ON tokens (obtained_at + expires_in)
+        WHERE {REFRESH_TOKEN_KEY}
+    '''
+    # Stay below SQLITE_MAX_VARIABLE_NUMBER on old SQLite builds.
+    MAX_VARIABLES = 500
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or ConfigSingleton.SQLITE_PATH or os.path.join(credentials_folder(), self.FILENAME)
+        self._local = threading.local()
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            import sqlite3
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path,
+                                         timeout=ConfigSingleton.REFRESH_LOCK_TIMEOUT,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(self.SCHEMA)
+            connection.execute('DROP INDEX IF EXISTS tokens_refresh_expiry')  # the old LIKE index
+            connection.execute(self.EXPIRY_INDEX)
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def save_tokens(self, entries: List[TokenEntry], obtained_at: int):
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO tokens (token_key, token_value, expires_in, obtained_at) '
+                'VALUES (?, ?, ?, ?)',
+                [(token_key, token_value, expires_in, obtained_at)
+                 for token_key, token_value, expires_in in entries])
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def retrieve_token_record(self, token_key: str) -> TokenRecord:
+        row = self.connection().execute(
+            'SELECT token_value, expires_in, obtained_at FROM tokens WHERE token_key = ?',
+            (token_key,)).fetchone()
+        return tuple(row) if row else (None, 0, 0)
+
+    def retrieve_token_records(self, token_keys: List[str]) -> Dict[str, TokenRecord]:
+        records = {token_key: (None, 0, 0) for token_key in token_keys}
+        connection = self.connection()
+        for start in range(0, len(token_keys), self.MAX_VARIABLES):
+            chunk = token_keys[start:start + self.MAX_VARIABLES]
+            placeholders = ','.join('?' * len(chunk))
+            for token_key, token_value, expires_in, obtained_at in connection.execute(
+                    'SELECT token_key, token_value, expires_in, obtained_at FROM tokens '
+                    f'WHERE token_key IN ({placeholders})', chunk):
+                records[token_key] = (token_value, expires_in, obtained_at)
+        return records
+
+    def refresh_token_expiries(self, start: float, end: float, limit: int) -> List[Expiry]:
+        return self.connection().execute(
+            "SELECT token_key, obtained_at + expires_in FROM tokens "
+            f"WHERE {self.REFRESH_TOKEN_KEY} AND obtained_at + expires_in BETWEEN ? AND ? "
+            "ORDER BY obtained_at + expires_in LIMIT ?", (start, end, limit)).fetchall()
+
+    def refresh_lock_path(self, lock_name: str) -> Optional[str]:
+        return refresh_lock_path(lock_name, os.path.dirname(os.path.abspath(self.path)))
+
+class MemoryStorageBackend(StorageBackend):
+    """
+    Tokens in a dict of this process, for tests and single-process deployments.
+    Nothing survives a restart; refreshes only need the in-process lock.
+    """
+
+    name = 'memory'
+    blocking_reads = False
+
+    def __init__(self):
+        self._records: Dict[str, Tuple[str, Optional[int], int]] = {}
+        self._expiries: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def save_tokens(self, entries: List[TokenEntry], obtained_at: int):
+        with self._lock:
+            for token_key, token_value, expires_in in entries:
+                previous = self._records.get(token_key)
+                self._records[token_key] = (token_value, expires_in, obtained_at)
+                if not is_refresh_token_key(token_key):
+                    continue
+                if previous is not None and previous[1]:
+                    index = bisect.bisect_left(self._expiries, (previous[2] + previous[1], token_key))
+                    if index < len(self._expiries) and self._expiries[index][1] == token_key:
+                        del self._expiries[index]
+                if expires_in:
+                    bisect.insort(self._expiries, (obtained_at + expires_in, token_key))
+
+    def retrieve_token_record(self, token_key: str) -> TokenRecord:
+        return self._records.get(token_key, (None, 0, 0))
+
+    def refresh_lock_path(self, lock_name: str) -> Optional[str]:
+        return None
+
+    def refresh_lock(self, lock_name: str) -> NullLock:
+        return NullLock()
+
+    def refresh_token_expiries(self, start: float, end: float, limit: int) -> List[Expiry]:
+        with self._lock:
+            index = bisect.bisect_left(self._expiries, (start, ''))
+            return [(token_key, expires_at)
+                    for expires_at, token_key in self._expiries[index:index + limit]
+                    if expires_at <= end]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._expiries.clear()
+
+_factories: Dict[str, Callable[[], StorageBackend]] = {
+    'json': JsonStorageBackend,
+    'redis': RedisStorageBackend,
+    'sqlite': SqliteStorageBackend,
+    'memory': MemoryStorageBackend,
+}
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+def register_storage_backend(name: str, factory: Callable[[], StorageBackend]):
+    """Make a custom backend selectable with `TOKENS_STORAGE_METHOD=<name>`."""
+    _factories[name] = factory
+
+def get_storage_backend() -> StorageBackend:
+    """
+    Return the token storage backend, created once from `TOKENS_STORAGE_METHOD`.
+
+    Raises:
+        NotImplementedError: If no backend is registered under that name.
+    """
+    global _backend
+    backend = _backend
+    if backend is not None:
+        return backend
+
+    with _backend_lock:
+        if _backend is None:
+            # Created under the lock: two `memory` backends would each keep half the tokens.
+            factory = _factories.get(ConfigSingleton.TOKENS_STORAGE_METHOD)
+            if factory is None:
+                raise NotImplementedError(f'Unknown token storage backend: {ConfigSingleton.TOKENS_STORAGE_METHOD}')
+            _backend = factory()
+            ConfigSingleton.TOKENS_STORAGE_METHOD = _backend.name
+        return _backend
+
+def set_storage_backend(backend: Union[str, StorageBackend]) -> StorageBackend:
+    """
+    Switch the token storage backend, by registered name or instance. Tokens
+    cached from the previous backend are dropped.
+
+    Raises:
+        NotImplementedError: If no backend is registered under that name.
+    """
+    global _backend
+    if isinstance(backend, str):
+        factory = _factories.get(backend)
+        if factory is None:
+            raise NotImplementedError(f'Unknown token storage backend: {backend}')
+        backend = factory()
+
+    with _backend_lock:
+        _backend = backend
+        ConfigSingleton.TOKENS_STORAGE_METHOD = backend.name
+    token_cache.invalidate()
+    return backend
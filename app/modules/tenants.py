@@ -0,0 +1,141 @@
+import json
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from config import ConfigSingleton
+from modules.bling import BlingApiTokenHandler, TokenStorage, get_valid_access_token
+from modules.token_cache import token_cache
+
+@dataclass(frozen=True)
+class BlingTenant:
+    """A Bling account (company) and the app credentials used to authorize it."""
+
+    tenant_id: str
+    client_id: Optional[str] = None
+    client_secret: Optional[str] = None
+
+class TenantTokenManager:
+    """
+    Token manager for many Bling accounts sharing one storage backend.
+
+    Stored keys are namespaced as `bling:<app_name>:<tenant_id>:access_token`, so
+    every tenant lives in the same `credentials.json` or Redis database and shares
+    the same Redis connection pool. Tenants without their own client credentials
+    fall back to `BLING_CLIENT_ID`/`BLING_CLIENT_SECRET`.
+    """
+
+    KEY_NAMESPACE = 'bling'
+
+    def __init__(self,
+                 tenants: Iterable[BlingTenant] = (),
+                 app_name: Optional[str] = None,
+                 token_storage: Optional[TokenStorage] = None):
+        self.app_name = app_name or ConfigSingleton.BLING_APP_NAME
+        self.token_storage = token_storage or TokenStorage()
+        self._tenants: Dict[str, BlingTenant] = {}
+        self._handlers: Dict[str, BlingApiTokenHandler] = {}
+        self._lock = threading.Lock()
+
+        for tenant in tenants:
+            self.register(tenant)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'TenantTokenManager':
+        """
+        Build a manager from a JSON list of `{"tenant_id", "client_id", "client_secret"}` objects.
+        """
+        with open(path, 'r', encoding='utf-8') as file:
+            tenants = [BlingTenant(**item) for item in json.load(file)]
+        return cls(tenants, **kwargs)
+
+    def register(self, tenant: BlingTenant):
+        """Add or replace a tenant."""
+        with self._lock:
+            self._tenants[tenant.tenant_id] = tenant
+            self._handlers.pop(tenant.tenant_id, None)
+
+    @property
+    def tenant_ids(self) -> List[str]:
+        return list(self._tenants)
+
+    def key_prefix(self, tenant_id: str) -> str:
+        """Return the storage key prefix of a tenant."""
+        return f'{self.KEY_NAMESPACE}:{self.app_name}:{tenant_id}:'
+
+    def handler(self, tenant_id: str) -> BlingApiTokenHandler:
+        """
+        Return the token handler of a tenant.
+
+        Raises:
+            KeyError: If the tenant is not registered.
+        """
+        handler = self._handlers.get(tenant_id)
+        if handler is None:
+            tenant = self._tenants[tenant_id]
+            with self._lock:
+                handler = self._handlers.setdefault(
+                    tenant_id,
+                    BlingApiTokenHandler(client_id=tenant.client_id,
+                                         client_secret=tenant.client_secret,
+                                         key_prefix=self.key_prefix(tenant_id)))
+        return handler
+
+    def handler_for_key(self, token_key: str) -> Optional[BlingApiTokenHandler]:
+        """
+        Return the handler of the tenant owning a stored token key, or None if the
+        key belongs to no registered tenant (e.g. for `RefreshTokenRenewer`).
+        """
+        prefix = f'{self.KEY_NAMESPACE}:{self.app_name}:'
+        if not token_key.startswith(prefix):
+            return None
+        tenant_id, _, _ = token_key[len(prefix):].rpartition(':')
+        if tenant_id not in self._tenants:
+            return None
+        return self.handler(tenant_id)
+
+    def get_token_using_code(self, tenant_id: str, code: str) -> dict:
+        """Authorize a tenant with the code from its Bling invite link."""
+        return self.handler(tenant_id).get_token_using_code(code)
+
+    def get_valid_access_token(self, tenant_id: str) -> Optional[str]:
+        """Return a valid access token for one tenant, refreshing it if needed."""
+        return get_valid_access_token(self.token_storage, self.handler(tenant_id))
+
+    def get_valid_access_tokens(self, tenant_ids: Optional[Iterable[str]] = None) -> Dict[str, Optional[str]]:
+        """
+        Return valid access tokens for a batch of tenants.
+
+        Cached tokens are served from memory, the remaining ones are read in one
+        bulk storage call (`TokenStorage.retrieve_token_records`), and only the
+        expired ones are refreshed individually.
+
+        Args:
+            tenant_ids (Iterable[str], optional): Tenants to look up, all by default.
+
+        Returns:
+            Dict[str, Optional[str]]: Access tokens by tenant id, None when a tenant
+            has no refresh token stored.
+        """
+        tenant_ids = list(tenant_ids) if tenant_ids is not None else self.tenant_ids
+        tokens: Dict[str, Optional[str]] = {}
+        missing: Dict[str, str] = {}
+
+        for tenant_id in tenant_ids:
+            access_token_key = self.handler(tenant_id).access_token_key
+            access_token = token_cache.get(access_token_key)
+            if access_token:
+                tokens[tenant_id] = access_token
+            else:
+                missing[access_token_key] = tenant_id
+
+        records = self.token_storage.retrieve_token_records(list(missing)) if missing else {}
+        for access_token_key, tenant_id in missing.items():
+            access_token, expires_in, obtained_at = records[access_token_key]
+            if access_token and not self.token_storage.is_record_expired(expires_in, obtained_at):
+                token_cache.set(access_token_key, access_token, expires_in, obtained_at)
+                tokens[tenant_id] = access_token
+            else:
+                tokens[tenant_id] = self.get_valid_access_token(tenant_id)
+
+        return tokens
@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from config import ConfigSingleton
+
+class TokenCache:
+    """
+    An in-process cache for tokens read through TokenStorage.
+
+    Entries hold the token value with its `expires_in`/`obtained_at` metadata
+    and are evicted on read once `ACCESS_TOKEN_EXPIRY_SKEW` is reached, so a
+    hot read never touches the JSON file or Redis.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, Optional[int], int, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _evict_at(expires_in: Optional[int], obtained_at: int) -> Optional[float]:
+        if expires_in is None:
+            return None
+        return obtained_at + expires_in - ConfigSingleton.ACCESS_TOKEN_EXPIRY_SKEW
+
+    def get(self, token_key: str) -> Optional[str]:
+        """
+        Return the cached token value, or None if missing or about to expire.
+
+        Args:
+            token_key (str): The key of the token.
+
+        Returns:
+            Optional[str]: The cached token value.
+        """
+        entry = self._entries.get(token_key)
+        if entry is None:
+            return None
+
+        token_value, _, _, evict_at = entry
+        if evict_at is not None and time.time() >= evict_at:
+            with self._lock:
+                if self._entries.get(token_key) is entry:
+                    del self._entries[token_key]
+            return None
+
+        return token_value
+
+    def set(self,
+            token_key: str,
+            token_value: str,
+            expires_in: Optional[int],
+            obtained_at: int):
+        """
+        Store a token in the cache.
+
+        Args:
+            token_key (str): The key of the token.
+            token_value (str): The value of the token.
+            expires_in (int, optional): Lifetime in seconds, None if it never expires.
+            obtained_at (int): Unix timestamp when the token was obtained.
+        """
+        if not ConfigSingleton.ACCESS_TOKEN_CACHE_ENABLED or not token_value:
+            return
+
+        entry = (token_value, expires_in, obtained_at, self._evict_at(expires_in, obtained_at))
+        with self._lock:
+            self._entries[token_key] = entry
+
+    def invalidate(self, token_key: Optional[str] = None):
+        """
+        Drop one cached token, or every cached token when no key is given.
+        """
+        with self._lock:
+            if token_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(token_key, None)
+
+token_cache = TokenCache()
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+from config import ConfigSingleton
+from modules import metrics
+from modules.token_cache import token_cache
+
+logger = logging.getLogger(__name__)
+
+def rotation_message(tokens: List[Tuple[str, str, Optional[int]]], obtained_at: int) -> str:
+    """
+    Return the event published with a token write of `(token_name, token_value,
+    expires_in)` items obtained at `obtained_at`. Only access tokens travel with
+    their values; every other key (refresh tokens) is listed by name, to be
+    dropped from the caches, so refresh tokens never reach the subscribers.
+    """
+    access_tokens = [token for token in tokens if token[0].endswith('access_token')]
+    invalidated = [token[0] for token in tokens if not token[0].endswith('access_token')]
+    return json.dumps({'obtained_at': obtained_at, 'tokens': access_tokens, 'invalidated': invalidated},
+                      separators=(',', ':'))
+
+def apply_rotation(message):
+    """
+    Bring the in-process token cache in line with a rotation event: access
+    tokens are replaced, invalidated keys are dropped.
+    """
+    event = json.loads(message)
+    obtained_at = event['obtained_at']
+    for token_name, token_value, expires_in in event['tokens']:
+        if token_name.endswith('access_token'):
+            token_cache.set(token_name, token_value, expires_in, obtained_at)
+        else:
+            token_cache.invalidate(token_name)
+    for token_name in event.get('invalidated', ()):
+        token_cache.invalidate(token_name)
+    metrics.increment('bling_token_rotation_events_total')
+
+class RotationListener:
+    """
+    Follows `REDIS_TOKEN_EVENTS_CHANNEL` from a daemon thread and applies every
+    rotation to this process's token cache, so a refresh on any node reaches
+    the other processes' caches within a pub/sub hop.
+
+    The whole cache is dropped on each (re)subscription, since rotations
+    published while disconnected are lost.
+    """
+
+    POLL_TIMEOUT = 1.0
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, channel: Optional[str] = None):
+        self.channel = channel or ConfigSingleton.REDIS_TOKEN_EVENTS_CHANNEL
+        self.subscribed = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _listen(self):
+        from modules import redis_client
+
+        pubsub = redis_client.get_redis_connection().pubsub()
+        try:
+            pubsub.subscribe(self.channel)
+            while not self._stop_event.is_set():
+                message = pubsub.get_message(timeout=self.POLL_TIMEOUT)
+                if message is None:
+                    continue
+                if message['type'] == 'subscribe':
+                    token_cache.invalidate()
+                    self.subscribed.set()
+                elif message['type'] == 'message':
+                    try:
+                        apply_rotation(message['data'])
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning('Ignoring malformed token rotation event: %r', message['data'])
+        finally:
+            self.subscribed.clear()
+            pubsub.close()
+
+    def _run(self):
+        from modules import redis_client
+
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+            except redis_client.redis.RedisError as exc:
+                logger.warning('Token rotation events unavailable (%s), retrying in %.0fs',
+                               exc, self.RECONNECT_DELAY)
+                token_cache.invalidate()
+            self._stop_event.wait(self.RECONNECT_DELAY)
+
+    def start(self, timeout: Optional[float] = None, wait: bool = True) -> 'RotationListener':
+        """
+        Start listening and wait up to `timeout` seconds (`REDIS_SOCKET_CONNECT_TIMEOUT`
+        by default) for the subscription, so nothing read afterwards can miss a rotation.
+        With `wait=False` (event loops) it returns at once; tokens cached before
+        the subscription are still dropped when it completes.
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='bling-token-events',
+                                        daemon=True)
+        self._thread.start()
+        if not wait:
+            return self
+        if not self.subscribed.wait(timeout if timeout is not None
+                                    else ConfigSingleton.REDIS_SOCKET_CONNECT_TIMEOUT):
+            logger.warning('Not subscribed to %s yet, cached tokens may lag behind rotations',
+                           self.channel)
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+_listener: Optional[RotationListener] = None
+_listener_pid: Optional[int] = None
+_listener_lock = threading.Lock()
+
+def ensure_listening(wait: bool = True):
+    """
+    Start this process's RotationListener unless it is running, or events are
+    disabled (`REDIS_TOKEN_EVENTS_ENABLED`) or there is no cache to keep coherent.
+    Called by the Redis backend before it hands out anything the cache may keep.
+
+    Args:
+        wait (bool): Wait for the subscription; async callers pass False so the
+            event loop never blocks on the Redis connection or on another
+            caller starting the listener.
+    """
+    global _listener, _listener_pid
+
+    if _listener_pid == os.getpid():
+        return
+    if not ConfigSingleton.REDIS_TOKEN_EVENTS_ENABLED or not ConfigSingleton.ACCESS_TOKEN_CACHE_ENABLED:
+        return
+    if not _listener_lock.acquire(blocking=wait):
+        return  # another caller is starting it
+    try:
+        if _listener_pid != os.getpid():
+            # After a fork the parent's thread is gone, start a new one.
+            _listener = RotationListener().start(wait=wait)
+            _listener_pid = os.getpid()
+    finally:
+        _listener_lock.release()
+
+def stop_listening():
+    """Stop this process's RotationListener, if any."""
+    global _listener, _listener_pid
+
+    with _listener_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+        _listener, _listener_pid = None, None
@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from config import ConfigSingleton
+from modules import metrics
+from modules.bling import BlingApiError, BlingApiTokenHandler, TokenStorage, refresh_access_token
+from modules.locks import LockTimeout
+
+logger = logging.getLogger(__name__)
+
+class BackgroundTokenRefresher:
+    """
+    Renews the access token ahead of expiry so request-path callers never block.
+
+    The token is renewed at `refresh_fraction` of its lifetime, shifted by a random
+    jitter so a fleet does not refresh in lockstep. Refreshes go through
+    `refresh_access_token`, so several refreshers on the same credentials still
+    send a single POST. Failures back off exponentially up to `max_backoff`.
+
+    Run it either as a daemon thread (`start`/`stop`) or as an asyncio task
+    (`start_async`/`stop_async`).
+    """
+
+    MIN_INTERVAL = 1.0
+
+    def __init__(self,
+                 token_storage: TokenStorage,
+                 token_handler: BlingApiTokenHandler,
+                 refresh_fraction: Optional[float] = None,
+                 jitter: Optional[float] = None,
+                 min_backoff: Optional[float] = None,
+                 max_backoff: Optional[float] = None):
+        self.token_storage = token_storage
+        self.token_handler = token_handler
+        self.refresh_fraction = (refresh_fraction if refresh_fraction is not None
+                                 else ConfigSingleton.BACKGROUND_REFRESH_FRACTION)
+        self.jitter = jitter if jitter is not None else ConfigSingleton.BACKGROUND_REFRESH_JITTER
+        self.min_backoff = (min_backoff if min_backoff is not None
+                            else ConfigSingleton.BACKGROUND_REFRESH_MIN_BACKOFF)
+        self.max_backoff = (max_backoff if max_backoff is not None
+                            else ConfigSingleton.BACKGROUND_REFRESH_MAX_BACKOFF)
+
+        if not 0 < self.refresh_fraction < 1:
+            raise ValueError('refresh_fraction must be between 0 and 1')
+
+        self._failures = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _schedule(self) -> Tuple[float, float]:
+        """
+        Return `(refresh_at, margin)`: the Unix timestamp at which the stored access
+        token should be renewed, and how long a token must remain valid from then
+        on. The margin follows the jittered instant, so once `refresh_at` is due
+        the stored token no longer qualifies, even when the jitter is negative.
+        """
+        token, expires_in, obtained_at = self.token_storage.retrieve_token_record(
+            self.token_handler.access_token_key)
+        now = time.time()
+        lifetime = expires_in or ConfigSingleton.DEFAULT_ACCESS_TOKEN_EXPIRES_IN
+        margin = lifetime * (1 - self.refresh_fraction)
+
+        if expires_in is None:
+            return now + self.max_backoff, margin
+        if not token or not expires_in or not obtained_at:
+            return now, margin
+
+        latest = obtained_at + expires_in - ConfigSingleton.ACCESS_TOKEN_EXPIRY_SKEW - 1
+        refresh_at = obtained_at + expires_in * self.refresh_fraction
+        refresh_at += random.uniform(-self.jitter, self.jitter) * expires_in
+        refresh_at = min(refresh_at, latest)
+        return refresh_at, obtained_at + expires_in - refresh_at
+
+    def _backoff(self) -> float:
+        delay = min(self.max_backoff, self.min_backoff * 2 ** (self._failures - 1))
+        return random.uniform(delay / 2, delay)
+
+    def run_once(self) -> float:
+        """
+        Refresh the token if it is due and return the seconds until the next check.
+        """
+        try:
+            refresh_at, margin = self._schedule()
+            if refresh_at <= time.time():
+                if not refresh_access_token(self.token_storage,
+                                            self.token_handler,
+                                            valid_until=time.time() + margin):
+                    raise BlingApiError('No refresh token stored')
+                refresh_at, _ = self._schedule()
+        except (BlingApiError, LockTimeout) as exc:
+            self._failures += 1
+            delay = self._backoff()
+            logger.warning('Background token refresh failed (%s), retrying in %.1fs', exc, delay)
+            return delay
+        except Exception:  # keep the refresher alive, the request path still works
+            self._failures += 1
+            delay = self._backoff()
+            logger.exception('Unexpected background refresh error, retrying in %.1fs', delay)
+            return delay
+
+        self._failures = 0
+        return max(self.MIN_INTERVAL, refresh_at - time.time())
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            delay = self.run_once()
+            self._stop_event.wait(delay)
+
+    def start(self) -> 'BackgroundTokenRefresher':
+        """Start refreshing on a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='bling-token-refresher',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the daemon thread, waiting up to `timeout` seconds for it to exit."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    async def _run_async(self):
+        while True:
+            delay = await asyncio.to_thread(self.run_once)
+            await asyncio.sleep(delay)
+
+    def start_async(self) -> asyncio.Task:
+        """Start refreshing as a task on the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run_async())
+        return self._task
+
+    async def stop_async(self):
+        """Cancel the asyncio task and wait for it to finish."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+def handler_for_refresh_token_key(refresh_token_key: str) -> BlingApiTokenHandler:
+    """
+    Return a handler for a stored refresh token key, using the default client
+    credentials and the key's prefix (`bling:<app>:<tenant>:refresh_token` keeps
+    `bling:<app>:<tenant>:`).
+    """
+    return BlingApiTokenHandler(key_prefix=refresh_token_key[:-len('refresh_token')])
+
+class RefreshTokenRenewer:
+    """
+    Keeps the refresh tokens of every stored account alive, used or not.
+
+    Each run takes the refresh tokens expiring within `renew_before` seconds from
+    the storage expiry index (`TokenStorage.refresh_token_expiries`, nearest first,
+    no scan of the credentials) and refreshes at most `batch_size` of them,
+    sequentially, through the account's rate limiter and the single-flight
+    refresh. A renewal stores a new refresh token, which drops the account out of
+    the due range. Runs sleep until the next token becomes due, or `interval`
+    seconds at most; a full batch is followed by another run right away.
+
+    Accounts whose renewal fails are deferred for an exponentially growing delay,
+    and keys without a handler for `max_backoff`, so they never block the rest
+    of the batch.
+
+    Args:
+        token_storage (TokenStorage, optional): Token storage, `TokenStorage()` by default.
+        handler_for_key (Callable, optional): Maps a refresh token key to its handler,
+            or None to skip it; `TenantTokenManager.handler_for_key` for tenants with
+            their own client credentials, `handler_for_refresh_token_key` by default.
+        renew_before (float, optional): `REFRESH_TOKEN_RENEW_BEFORE` by default.
+        batch_size (int, optional): `REFRESH_TOKEN_RENEWAL_BATCH_SIZE` by default.
+        interval (float, optional): `REFRESH_TOKEN_RENEWAL_INTERVAL` by default.
+    """
+
+    MIN_INTERVAL = 1.0
+
+    def __init__(self,
+                 token_storage: Optional[TokenStorage] = None,
+                 handler_for_key: Optional[Callable[[str], Optional[BlingApiTokenHandler]]] = None,
+                 renew_before: Optional[float] = None,
+                 batch_size: Optional[int] = None,
+                 interval: Optional[float] = None):
+        self.token_storage = token_storage or TokenStorage()
+        self.handler_for_key = handler_for_key or handler_for_refresh_token_key
+        self.renew_before = (renew_before if renew_before is not None
+                             else ConfigSingleton.REFRESH_TOKEN_RENEW_BEFORE)
+        self.batch_size = batch_size or ConfigSingleton.REFRESH_TOKEN_RENEWAL_BATCH_SIZE
+        self.interval = interval or ConfigSingleton.REFRESH_TOKEN_RENEWAL_INTERVAL
+        self.min_backoff = ConfigSingleton.BACKGROUND_REFRESH_MIN_BACKOFF
+        self.max_backoff = ConfigSingleton.BACKGROUND_REFRESH_MAX_BACKOFF
+
+        self._deferred: Dict[str, Tuple[int, float]] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _renew(self, refresh_token_key: str, renew_until: float) -> str:
+        token_handler = self.handler_for_key(refresh_token_key)
+        if token_handler is None:
+            return 'skipped'
+        if not refresh_access_token(self.token_storage, token_handler,
+                                    refresh_valid_until=renew_until):
+            raise BlingApiError('No refresh token stored')
+        return 'success'
+
+    def run_once(self) -> float:
+        """
+        Renew one batch of due refresh tokens and return the seconds until the next run.
+        """
+        now = time.time()
+        renew_until = now + self.renew_before
+        due = self.token_storage.refresh_token_expiries(now, renew_until,
+                                                        self.batch_size + len(self._deferred))
+        batch = [key for key, _ in due if self._deferred.get(key, (0, 0.0))[1] <= now][:self.batch_size]
+
+        for refresh_token_key in batch:
+            try:
+                result = self._renew(refresh_token_key, renew_until)
+                if result == 'skipped':
+                    self._deferred[refresh_token_key] = (0, time.time() + self.max_backoff)
+                else:
+                    self._deferred.pop(refresh_token_key, None)
+            except (BlingApiError, LockTimeout, ValueError) as exc:
+                result = 'failure'
+                failures = self._deferred.get(refresh_token_key, (0, 0.0))[0] + 1
+                delay = min(self.max_backoff, self.min_backoff * 2 ** (failures - 1))
+                self._deferred[refresh_token_key] = (failures, time.time() + delay)
+                logger.warning('Renewal of %s failed (%s), retrying in %.0fs', refresh_token_key, exc, delay)
+            metrics.increment('bling_refresh_token_renewal_total', result=result)
+
+        # Forget deferrals of accounts renewed elsewhere or expired in the meantime.
+        due_keys = {key for key, _ in due}
+        for refresh_token_key in list(self._deferred):
+            if refresh_token_key not in due_keys:
+                del self._deferred[refresh_token_key]
+
+        if len(batch) == self.batch_size:
+            return self.MIN_INTERVAL
+
+        upcoming = self.token_storage.refresh_token_expiries(renew_until, float('inf'), 1)
+        next_run = self.interval
+        if upcoming:
+            next_run = min(next_run, upcoming[0][1] - self.renew_before - time.time())
+        if self._deferred:
+            next_run = min(next_run, min(retry_at for _, retry_at in self._deferred.values()) - time.time())
+        return max(self.MIN_INTERVAL, next_run)
+
+    def _run(self):
+        try:
+            self.token_storage.rebuild_expiry_index()
+        except Exception:  # renewals of newly written tokens still work
+            logger.exception('Could not rebuild the refresh token expiry index')
+
+        while not self._stop_event.is_set():
+            try:
+                delay = self.run_once()
+            except Exception:  # keep the renewer alive, e.g. through a storage outage
+                delay = self.max_backoff
+                logger.exception('Unexpected refresh token renewal error, retrying in %.0fs', delay)
+            self._stop_event.wait(delay)
+
+    def start(self) -> 'RefreshTokenRenewer':
+        """Start renewing on a daemon thread, after indexing previously stored tokens."""
+        if self._thread and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='bling-refresh-token-renewer',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the daemon thread, waiting up to `timeout` seconds for it to exit."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,499 @@
+import logging
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from config import ConfigSingleton
+from modules import metrics
+from modules.bling import (BlingApiError, BlingApiTokenHandler, TokenStorage,
+                           get_valid_access_token, refresh_access_token)
+from modules.token_refresher import BackgroundTokenRefresher
+
+logger = logging.getLogger(__name__)
+
+Address = Union[str, Tuple[str, int]]
+
+DEFAULT_ACCOUNT = 'default'
+
+def service_address() -> Address:
+    """
+    Return where the token service listens: `127.0.0.1:TOKEN_SERVICE_PORT` when
+    a port is set, otherwise the Unix socket `TOKEN_SERVICE_SOCKET`
+    (`credential/token-service.sock` by default).
+
+    The protocol has no authentication. The Unix socket is owner-only, but in
+    TCP mode any process on the host can read every account's access token,
+    so only use a port on hosts where every local user is trusted.
+    """
+    if ConfigSingleton.TOKEN_SERVICE_PORT:
+        return ('127.0.0.1', ConfigSingleton.TOKEN_SERVICE_PORT)
+    return (ConfigSingleton.TOKEN_SERVICE_SOCKET
+            or os.path.join(ConfigSingleton.BASE_DIR, 'credential', 'token-service.sock'))
+
+def _expires_field(expires_at: Optional[float]) -> str:
+    return '-' if expires_at is None else f'{expires_at:.0f}'
+
+def _parse_expires(field: str) -> Optional[float]:
+    return None if field == '-' else float(field)
+
+def _set_send_timeout(sock: socket.socket, seconds: float):
+    """Bound blocking writes to `sock` (SO_SNDTIMEO) while reads keep blocking."""
+    if sys.platform == 'win32':
+        value = struct.pack('L', int(seconds * 1000))
+    else:
+        value = struct.pack('ll', int(seconds), int(seconds % 1 * 1000000))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, value)
+
+class _AccountRefresher(BackgroundTokenRefresher):
+    """A BackgroundTokenRefresher that tells the service about every run."""
+
+    def __init__(self, service: 'TokenService', account: str, **kwargs):
+        super().__init__(service.token_storage, service.handlers[account], **kwargs)
+        self.service = service
+        self.account = account
+
+    def run_once(self) -> float:
+        delay = super().run_once()
+        if self._failures:
+            return delay
+        try:
+            self.service.load(self.account)
+        except Exception:  # the next run retries
+            logger.exception('Could not publish the %s token', self.account)
+        return delay
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Serves one client connection, one command per line."""
+
+    def setup(self):
+        super().setup()
+        if self.request.family != getattr(socket, 'AF_UNIX', None):
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        service: TokenService = self.server.service
+        for line in self.rfile:
+            command, _, args = line.decode('utf-8').strip().partition(' ')
+            if command == 'WATCH':
+                service.watch(self.rfile, self.wfile, self.request)
+                return
+            self.wfile.write(service.execute(command, args).encode('utf-8'))
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:  # pragma: no cover - Windows, use TOKEN_SERVICE_PORT
+    _UnixServer = None
+
+class _TcpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class TokenService:
+    """
+    A per-host token broker: it owns the refresh lifecycle of one or more Bling
+    accounts and serves their current access tokens over a local socket, so
+    worker processes need neither storage nor Redis access to get a token and
+    a host runs one refresher instead of one per process.
+
+    Each account is renewed ahead of expiry by a BackgroundTokenRefresher. The
+    current token of every account is kept in memory, so a `GET` is a dict lookup
+    and a socket write. Watchers are pushed every rotation; one that does not
+    take a push within `WATCH_SEND_TIMEOUT` seconds is disconnected, so a
+    stalled client cannot hold up rotations for the others.
+
+    Protocol (UTF-8 lines, one response line per request):
+        GET <account>                -> OK <token> <expires_at> | ERR <message>
+        REFRESH <account> <stale>    -> OK <token> <expires_at> | ERR <message>
+        PING                         -> PONG
+        WATCH                        -> TOKEN <account> <token> <expires_at>, for
+                                        every account now and on each rotation
+    `expires_at` is the Unix time the token stops being served (expiry minus
+    `ACCESS_TOKEN_EXPIRY_SKEW`), or `-` for a token that never expires.
+    `REFRESH` is what a client sends after the API answered 401 to `<stale>`.
+    """
+
+    WATCH_SEND_TIMEOUT = 1.0
+
+    def __init__(self,
+                 handlers: Optional[Dict[str, BlingApiTokenHandler]] = None,
+                 token_storage: Optional[TokenStorage] = None,
+                 address: Optional[Address] = None):
+        self.handlers = handlers or {DEFAULT_ACCOUNT: BlingApiTokenHandler()}
+        self.token_storage = token_storage or TokenStorage()
+        self.address = address or service_address()
+        self._tokens: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._watchers: List[Tuple[object, threading.Lock, Optional[socket.socket]]] = []
+        self._lock = threading.Lock()
+        self._refreshers: List[_AccountRefresher] = []
+        self._server: Optional[socketserver.BaseServer] = None
+
+    @classmethod
+    def from_tenants_file(cls, path: str, **kwargs) -> 'TokenService':
+        """Serve every tenant of a `TenantTokenManager.from_file` JSON file, by tenant id."""
+        from modules.tenants import TenantTokenManager
+
+        manager = TenantTokenManager.from_file(path)
+        handlers = {tenant_id: manager.handler(tenant_id) for tenant_id in manager.tenant_ids}
+        return cls(handlers, token_storage=manager.token_storage, **kwargs)
+
+    def load(self, account: str) -> Tuple[str, Optional[float]]:
+        """
+        Return the current `(token, expires_at)` of an account, refreshing it if
+        needed, and push it to the watchers if it changed.
+
+        Raises:
+            KeyError: If the account is not served.
+            BlingApiError: If no valid token can be obtained.
+        """
+        token_handler = self.handlers[account]
+        access_token = get_valid_access_token(self.token_storage, token_handler)
+        if not access_token:
+            raise BlingApiError('No access token available, authorize with get_token_using_code first')
+        return self._update(account, access_token)
+
+    def _update(self, account: str, access_token: str) -> Tuple[str, Optional[float]]:
+        current = self._tokens.get(account)
+        if current is not None and current[0] == access_token:
+            return current
+
+        token, expires_in, obtained_at = self.token_storage.retrieve_token_record(
+            self.handlers[account].access_token_key)
+        if token != access_token:
+            # A grace token or a concurrent rotation; serve it briefly and re-check.
+            expires_at = time.time() + BackgroundTokenRefresher.MIN_INTERVAL
+        elif expires_in is None:
+            expires_at = None
+        else:
+            expires_at = obtained_at + expires_in - ConfigSingleton.ACCESS_TOKEN_EXPIRY_SKEW
+
+        entry = (access_token, expires_at)
+        with self._lock:
+            self._tokens[account] = entry
+            watchers = list(self._watchers)
+        self._push(watchers, self._token_line(account, entry))
+        return entry
+
+    @staticmethod
+    def _token_line(account: str, entry: Tuple[str, Optional[float]]) -> bytes:
+        return f'TOKEN {account} {entry[0]} {_expires_field(entry[1])}\n'.encode('utf-8')
+
+    def _push(self, watchers: List[Tuple[object, threading.Lock, Optional[socket.socket]]], line: bytes):
+        for wfile, write_lock, connection in watchers:
+            try:
+                with write_lock:
+                    wfile.write(line)
+            except OSError:
+                # Gone or too slow (send timeout): drop it, the client reconnects.
+                self._unwatch(wfile)
+                if connection is not None:
+                    try:
+                        connection.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+        if watchers:
+            metrics.increment('bling_token_service_pushes_total', len(watchers))
+
+    def _unwatch(self, wfile):
+        with self._lock:
+            self._watchers = [watcher for watcher in self._watchers if watcher[0] is not wfile]
+
+    def get(self, account: str) -> Tuple[str, Optional[float]]:
+        """Return `(token, expires_at)` from memory, loading it only when missing or expired."""
+        entry = self._tokens.get(account)
+        if entry is not None and (entry[1] is None or time.time() < entry[1]):
+            return entry
+        return self.load(account)
+
+    def refresh(self, account: str, stale_token: Optional[str]) -> Tuple[str, Optional[float]]:
+        """
+        Refresh an account whose token the API rejected. Reports for a token that
+        was already replaced only return the current one.
+        """
+        access_token = refresh_access_token(self.token_storage, self.handlers[account],
+                                            stale_token=stale_token)
+        if not access_token:
+            raise BlingApiError('Access token rejected and no refresh token available')
+        return self._update(account, access_token)
+
+    def execute(self, command: str, args: str) -> str:
+        """Run one protocol command and return its response line."""
+        if command == 'PING':
+            return 'PONG\n'
+
+        account, _, stale_token = args.partition(' ')
+        account = account or DEFAULT_ACCOUNT
+        try:
+            if command not in ('GET', 'REFRESH'):
+                response = f'ERR unknown command {command}\n'
+            elif account not in self.handlers:
+                response = f'ERR unknown account {account}\n'
+            else:
+                if command == 'GET':
+                    token, expires_at = self.get(account)
+                else:
+                    token, expires_at = self.refresh(account, stale_token or None)
+                response = f'OK {token} {_expires_field(expires_at)}\n'
+        except Exception as exc:
+            # Storage, lock (LockTimeout) or API failures: answer instead of dropping the connection.
+            if not isinstance(exc, BlingApiError):
+                logger.exception('Token service %s %s failed', command, account)
+            response = 'ERR ' + (' '.join(str(exc).split()) or type(exc).__name__) + '\n'
+
+        metrics.increment('bling_token_service_requests_total',
+                          command=command, result='ok' if response.startswith('OK') else 'error')
+        return response
+
+    def watch(self, rfile, wfile, connection: Optional[socket.socket] = None):
+        """
+        Turn a connection into a push stream: send the current token of every
+        account, then each rotation, until the client disconnects. Writes to
+        `connection` time out after `WATCH_SEND_TIMEOUT` seconds.
+        """
+        if connection is not None:
+            _set_send_timeout(connection, self.WATCH_SEND_TIMEOUT)
+        write_lock = threading.Lock()
+        with self._lock:
+            self._watchers.append((wfile, write_lock, connection))
+        try:
+            for account in self.handlers:
+                entry = self._tokens.get(account)
+                if entry is None:
+                    try:
+                        entry = self.load(account)
+                    except Exception:  # pushed once a refresh succeeds
+                        logger.warning('No %s token to send to a new watcher', account, exc_info=True)
+                        continue
+                with write_lock:
+                    wfile.write(self._token_line(account, entry))
+            while rfile.readline():
+                pass
+        except OSError:
+            pass
+        finally:
+            self._unwatch(wfile)
+
+    def _bind(self) -> socketserver.BaseServer:
+        if isinstance(self.address, tuple):
+            return _TcpServer(self.address, _RequestHandler)
+        if _UnixServer is None:  # pragma: no cover - Windows
+            raise OSError('Unix sockets are not available here, set TOKEN_SERVICE_PORT')
+
+        if os.path.exists(self.address):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.address)
+            except OSError:
+                os.unlink(self.address)  # left behind by a service that died
+            else:
+                raise OSError(f'A token service is already listening on {self.address}')
+            finally:
+                probe.close()
+        os.makedirs(os.path.dirname(os.path.abspath(self.address)), exist_ok=True)
+
+        umask = os.umask(0o177)  # the socket hands out tokens: owner only
+        try:
+            return _UnixServer(self.address, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def start(self, refresh: bool = True) -> 'TokenService':
+        """
+        Bind the socket and serve from a daemon thread.
+
+        Args:
+            refresh (bool): Also start one background refresher per account.
+        """
+        self._server = self._bind()
+        self._server.service = self
+        if isinstance(self.address, tuple):
+            self.address = self._server.server_address[:2]
+        threading.Thread(target=self._server.serve_forever,
+                         name='bling-token-service',
+                         daemon=True).start()
+
+        if refresh:
+            self._refreshers = [_AccountRefresher(self, account).start() for account in self.handlers]
+        logger.info('Token service listening on %s for %d account(s)', self.address, len(self.handlers))
+        return self
+
+    def stop(self):
+        """Stop the refreshers and the server, and remove the Unix socket."""
+        for refresher in self._refreshers:
+            refresher.stop()
+        self._refreshers = []
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if not isinstance(self.address, tuple) and os.path.exists(self.address):
+                os.unlink(self.address)
+
+class TokenServiceClient:
+    """
+    Client of a TokenService.
+
+    Each thread keeps one persistent connection. With `watch=True` a background
+    thread also follows the service's rotation pushes, and `get_token` answers
+    from memory without any round trip.
+
+    Args:
+        address (str | tuple, optional): Socket path or `(host, port)`, `service_address()` by default.
+        timeout (float, optional): Socket timeout in seconds, `TOKEN_SERVICE_TIMEOUT` by default.
+        watch (bool): Follow rotations and serve tokens from memory.
+    """
+
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self,
+                 address: Optional[Address] = None,
+                 timeout: Optional[float] = None,
+                 watch: bool = False):
+        self.address = address or service_address()
+        self.timeout = timeout or ConfigSingleton.TOKEN_SERVICE_TIMEOUT
+        self._local = threading.local()
+        self._tokens: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._callbacks: List[Callable[[str, str, Optional[float]], None]] = []
+        self._closed = threading.Event()
+        self._watch_socket: Optional[socket.socket] = None
+        self._watch_thread: Optional[threading.Thread] = None
+        if watch:
+            self._watch_thread = threading.Thread(target=self._watch,
+                                                  name='bling-token-service-watch',
+                                                  daemon=True)
+            self._watch_thread.start()
+
+    def _connect(self) -> socket.socket:
+        if isinstance(self.address, tuple):
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.address)
+            except OSError:
+                sock.close()
+                raise
+        return sock
+
+    def _disconnect(self):
+        sock = getattr(self._local, 'socket', None)
+        if sock is not None:
+            self._local.rfile.close()
+            sock.close()
+            self._local.socket = None
+
+    def _call(self, line: str) -> str:
+        """Send one command and return the response line; reconnects once if the service restarted."""
+        for attempt in (1, 2):
+            sock = getattr(self._local, 'socket', None)
+            try:
+                if sock is None:
+                    sock = self._local.socket = self._connect()
+                    self._local.rfile = sock.makefile('rb')
+                sock.sendall(f'{line}\n'.encode('utf-8'))
+                response = self._local.rfile.readline()
+                if not response:
+                    raise ConnectionResetError('Token service closed the connection')
+                return response.decode('utf-8').rstrip('\n')
+            except OSError:
+                self._disconnect()
+                if attempt == 2:
+                    raise
+        raise AssertionError('unreachable')
+
+    @staticmethod
+    def _parse(response: str) -> Tuple[str, Optional[float]]:
+        status, _, rest = response.partition(' ')
+        if status != 'OK':
+            raise BlingApiError(f'Token service error: {rest or response}')
+        token, _, expires_at = rest.partition(' ')
+        return token, _parse_expires(expires_at)
+
+    def _cached(self, account: str) -> Optional[str]:
+        if not self._watch_thread.is_alive():
+            return None
+        entry = self._tokens.get(account)
+        if entry is not None and (entry[1] is None or time.time() < entry[1]):
+            return entry[0]
+        return None
+
+    def get_token(self, account: str = DEFAULT_ACCOUNT) -> str:
+        """
+        Return the current access token of an account.
+
+        Raises:
+            BlingApiError: If the service has no valid token for the account.
+            OSError: If the service cannot be reached.
+        """
+        if self._watch_thread is not None:
+            token = self._cached(account)
+            if token:
+                return token
+        token, expires_at = self._parse(self._call(f'GET {account}'))
+        if self._watch_thread is not None:
+            self._tokens[account] = (token, expires_at)
+        return token
+
+    def refresh(self, account: str = DEFAULT_ACCOUNT, stale_token: Optional[str] = None) -> str:
+        """Report a token the API rejected with 401 and return its replacement."""
+        token, expires_at = self._parse(self._call(f'REFRESH {account} {stale_token or ""}'.rstrip()))
+        if self._watch_thread is not None:
+            self._tokens[account] = (token, expires_at)
+        return token
+
+    def ping(self) -> bool:
+        try:
+            return self._call('PING') == 'PONG'
+        except OSError:
+            return False
+
+    def subscribe(self, callback: Callable[[str, str, Optional[float]], None]):
+        """Call `callback(account, token, expires_at)` on every pushed rotation (needs `watch=True`)."""
+        self._callbacks.append(callback)
+
+    def _watch(self):
+        while not self._closed.is_set():
+            try:
+                sock = self._watch_socket = self._connect()
+                sock.settimeout(None)
+                sock.sendall(b'WATCH\n')
+                for line in sock.makefile('rb'):
+                    kind, account, token, expires_at = line.decode('utf-8').split()
+                    if kind != 'TOKEN':
+                        continue
+                    expires_at = _parse_expires(expires_at)
+                    self._tokens[account] = (token, expires_at)
+                    for callback in self._callbacks:
+                        try:
+                            callback(account, token, expires_at)
+                        except Exception:
+                            logger.exception('Token service rotation callback failed for %s', account)
+            except OSError as exc:
+                if not self._closed.is_set():
+                    logger.debug('Token service watch interrupted: %s', exc)
+            except Exception:
+                # A malformed push: reconnect rather than keep serving tokens nobody updates.
+                logger.exception('Token service watch failed, reconnecting')
+            finally:
+                # Cached tokens could miss a rotation while disconnected.
+                self._tokens.clear()
+            self._closed.wait(self.RECONNECT_DELAY)
+
+    def close(self):
+        """Close this thread's connection and stop following rotations."""
+        self._closed.set()
+        if self._watch_socket is not None:
+            try:
+                self._watch_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._watch_socket.close()
+        self._disconnect()
@@ -0,0 +1,489 @@
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import ConfigSingleton
+from modules import metrics
+from modules.bling import BlingApiError
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Bling-Signature-256'
+MAX_BODY_BYTES = 1 << 20
+
+# API paths of the records behind each event resource (`<resource>.<action>`).
+RESOURCE_PATHS = {
+    'product': '/produtos',
+    'order': '/pedidos/vendas',
+    'invoice': '/nfe',
+    'consumer_invoice': '/nfce',
+}
+
+QUEUED = 'queued'
+MERGED = 'merged'
+DUPLICATE = 'duplicate'
+FULL = 'full'
+
+class WebhookError(ValueError):
+    """Raised for a webhook request that is not a valid Bling event."""
+
+def verify_signature(body: bytes, signature: Optional[str], secret: str) -> bool:
+    """
+    Check the `X-Bling-Signature-256` header (`sha256=<hex HMAC-SHA256 of the body
+    keyed with the app's client secret>`) in constant time.
+    """
+    if not signature:
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    algorithm, _, digest = signature.strip().rpartition('=')
+    return algorithm in ('', 'sha256') and hmac.compare_digest(digest, expected)
+
+@dataclass(frozen=True)
+class WebhookEvent:
+    """One Bling change notification, e.g. `product.updated` for the product `record_id`."""
+
+    event_id: str
+    event: str
+    company_id: str = ''
+    record_id: Optional[str] = None
+    date: str = ''
+    data: Dict = field(default_factory=dict, compare=False)
+
+    @property
+    def resource(self) -> str:
+        return self.event.rpartition('.')[0]
+
+    @property
+    def action(self) -> str:
+        return self.event.rpartition('.')[2]
+
+    @property
+    def key(self) -> str:
+        """Events with the same key concern the same record, only the latest needs handling."""
+        return f'{self.company_id}:{self.resource}:{self.record_id or self.event_id}'
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, payload) -> 'WebhookEvent':
+        return cls(**json.loads(payload))
+
+def parse_event(body: bytes) -> WebhookEvent:
+    """
+    Parse a webhook body (`{"eventId", "event", "companyId", "date", "data": {"id", ...}}`).
+
+    Raises:
+        WebhookError: If the body is not JSON or misses the event id or name.
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError as exc:
+        raise WebhookError(f'Invalid JSON: {exc}') from exc
+    if not isinstance(payload, dict):
+        raise WebhookError('Event must be a JSON object')
+
+    event_id, event = payload.get('eventId'), payload.get('event')
+    if not isinstance(event_id, str) or not event_id or not isinstance(event, str) or '.' not in event:
+        raise WebhookError('Missing eventId or event')
+    data = payload.get('data') if isinstance(payload.get('data'), dict) else {}
+    record_id = data.get('id')
+    return WebhookEvent(event_id=event_id,
+                        event=event,
+                        company_id=str(payload.get('companyId') or ''),
+                        record_id=str(record_id) if record_id is not None else None,
+                        date=str(payload.get('date') or ''),
+                        data=data)
+
+class MemoryEventQueue:
+    """
+    A bounded in-process event queue.
+
+    Redeliveries (an event id seen within `dedupe_ttl` seconds) are dropped, and
+    an event for a record that is still queued replaces the queued one in
+    place, so a burst of updates to one product costs one fetch. `put` reports
+    `full` once `maxsize` records are waiting.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None, dedupe_ttl: Optional[float] = None):
+        self.maxsize = maxsize or ConfigSingleton.WEBHOOK_QUEUE_SIZE
+        self.dedupe_ttl = dedupe_ttl if dedupe_ttl is not None else ConfigSingleton.WEBHOOK_DEDUPE_TTL
+        self._pending: 'OrderedDict[str, WebhookEvent]' = OrderedDict()
+        self._seen: 'OrderedDict[str, float]' = OrderedDict()
+        self._condition = threading.Condition()
+
+    def _forget_expired(self, now: float):
+        while self._seen and next(iter(self._seen.values())) <= now:
+            self._seen.popitem(last=False)
+
+    def put(self, event: WebhookEvent) -> str:
+        """Queue an event; returns `queued`, `merged`, `duplicate` or `full`."""
+        now = time.monotonic()
+        with self._condition:
+            self._forget_expired(now)
+            if event.event_id in self._seen:
+                return DUPLICATE
+            if event.key in self._pending:
+                result = MERGED
+            elif len(self._pending) >= self.maxsize:
+                return FULL
+            else:
+                result = QUEUED
+            self._pending[event.key] = event
+            self._seen[event.event_id] = now + self.dedupe_ttl
+            self._condition.notify()
+            return result
+
+    def requeue(self, events: List[WebhookEvent]):
+        """Put back events whose processing failed, ahead of the rest; newer events for a record win."""
+        with self._condition:
+            for event in reversed(events):
+                if event.key not in self._pending:
+                    self._pending[event.key] = event
+                    self._pending.move_to_end(event.key, last=False)
+            self._condition.notify()
+
+    def get_batch(self, max_items: int, timeout: float) -> List[WebhookEvent]:
+        """Return up to `max_items` events, waiting up to `timeout` seconds for the first one."""
+        with self._condition:
+            if not self._pending:
+                self._condition.wait(timeout)
+            batch = []
+            while self._pending and len(batch) < max_items:
+                batch.append(self._pending.popitem(last=False)[1])
+            return batch
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+class RedisEventQueue:
+    """
+    The MemoryEventQueue semantics on Redis (`RedisConn` settings), so several
+    receivers and workers share one queue: event ids are remembered with
+    `SET NX EX`, and queued records live in a hash (one field per record,
+    replaced by newer events) ordered by a list, both updated by Lua scripts.
+    Events are removed when handed out; one lost with a crashing worker is not redelivered.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    PUT_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    if ARGV[4] == 'RPUSH' then
+        redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    end
+    return 2
+end
+local maxsize = tonumber(ARGV[3])
+if maxsize > 0 and redis.call('HLEN', KEYS[1]) >= maxsize then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call(ARGV[4], KEYS[2], ARGV[1])
+return 1
+"""
+
+    POP_SCRIPT = """
+local keys = redis.call('LPOP', KEYS[2], ARGV[1])
+if not keys then
+    return {}
+end
+local events = redis.call('HMGET', KEYS[1], unpack(keys))
+redis.call('HDEL', KEYS[1], unpack(keys))
+return events
+"""
+
+    def __init__(self, maxsize: Optional[int] = None,
+                 dedupe_ttl: Optional[float] = None,
+                 key: Optional[str] = None):
+        from modules import redis_client
+
+        self.maxsize = maxsize or ConfigSingleton.WEBHOOK_QUEUE_SIZE
+        self.dedupe_ttl = dedupe_ttl if dedupe_ttl is not None else ConfigSingleton.WEBHOOK_DEDUPE_TTL
+        self.key = key or ConfigSingleton.WEBHOOK_QUEUE_KEY
+        self._redis_client = redis_client
+        self._put = self._pop = None
+
+    def _connection(self):
+        connection = self._redis_client.get_redis_connection()
+        if self._put is None:
+            self._put = connection.register_script(self.PUT_SCRIPT)
+            self._pop = connection.register_script(self.POP_SCRIPT)
+        return connection
+
+    def _store(self, event: WebhookEvent, command: str, maxsize: int) -> int:
+        # RPUSH queues a new event (replacing a queued one), LPUSH puts back a failed one.
+        connection = self._connection()
+        return self._put(keys=[f'{self.key}:pending', f'{self.key}:order'],
+                         args=[event.key, event.to_json(), maxsize, command],
+                         client=connection)
+
+    def put(self, event: WebhookEvent) -> str:
+        """Queue an event; returns `queued`, `merged`, `duplicate` or `full`."""
+        connection = self._connection()
+        seen_key = f'{self.key}:seen:{event.event_id}'
+        if not connection.set(seen_key, 1, nx=True, ex=max(1, int(self.dedupe_ttl))):
+            return DUPLICATE
+        stored = self._store(event, 'RPUSH', self.maxsize)
+        if not stored:
+            connection.delete(seen_key)  # not accepted, let the redelivery in
+            return FULL
+        return MERGED if stored == 2 else QUEUED
+
+    def requeue(self, events: List[WebhookEvent]):
+        """Put back events whose processing failed, ahead of the rest; newer events for a record win."""
+        for event in reversed(events):
+            self._store(event, 'LPUSH', 0)
+
+    def get_batch(self, max_items: int, timeout: float) -> List[WebhookEvent]:
+        """Return up to `max_items` events, polling up to `timeout` seconds for the first one."""
+        deadline = time.monotonic() + timeout
+        while True:
+            connection = self._connection()
+            payloads = self._pop(keys=[f'{self.key}:pending', f'{self.key}:order'],
+                                 args=[max_items], client=connection)
+            events = [WebhookEvent.from_json(payload) for payload in payloads if payload]
+            if events or time.monotonic() >= deadline:
+                return events
+            time.sleep(self.POLL_INTERVAL)
+
+    def __len__(self) -> int:
+        return self._connection().llen(f'{self.key}:order')
+
+def get_event_queue():
+    """Return a new event queue of the `WEBHOOK_QUEUE` kind (`memory` or `redis`)."""
+    if ConfigSingleton.WEBHOOK_QUEUE == 'redis':
+        return RedisEventQueue()
+    return MemoryEventQueue()
+
+BatchHandler = Callable[[List[Tuple[WebhookEvent, Optional[dict]]]], None]
+
+class WebhookProcessor:
+    """
+    A worker pool draining an event queue in batches.
+
+    Each worker takes up to `batch_size` events, fetches the affected records
+    through one BlingSession (so all workers share the cached access token from
+    `get_valid_access_token` and the account's rate limiter) and calls
+    `handler` with `(event, record)` pairs. `record` is None for deletions,
+    unknown resources and records gone since the event.
+
+    Back-pressure: fetches wait for the rate limiter, so a spent budget slows
+    the workers down and the queue fills until the receiver starts answering
+    503. When the daily quota is used up or the API keeps failing, the batch is
+    put back and the worker pauses for `pause` seconds.
+
+    Args:
+        handler (callable): Receives each batch of `(event, record)` pairs.
+        queue (optional): Event queue, `get_event_queue()` by default.
+        session (BlingSession, optional): Session used for fetches, `BlingSession()` by default.
+        workers (int, optional): Worker threads, `WEBHOOK_WORKERS` by default.
+        batch_size (int, optional): Events per batch, `WEBHOOK_BATCH_SIZE` by default.
+        pause (float, optional): Pause after a failed batch, `WEBHOOK_FAILURE_PAUSE` by default.
+    """
+
+    WAIT = 1.0
+
+    def __init__(self, handler: BatchHandler,
+                 queue=None,
+                 session=None,
+                 workers: Optional[int] = None,
+                 batch_size: Optional[int] = None,
+                 pause: Optional[float] = None):
+        from modules.session import BlingSession
+
+        self.handler = handler
+        self.queue = queue if queue is not None else get_event_queue()
+        self.session = session or BlingSession()
+        self.workers = workers or ConfigSingleton.WEBHOOK_WORKERS
+        self.batch_size = batch_size or ConfigSingleton.WEBHOOK_BATCH_SIZE
+        self.pause = pause if pause is not None else ConfigSingleton.WEBHOOK_FAILURE_PAUSE
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def fetch(self, event: WebhookEvent) -> Optional[dict]:
+        """
+        Return the current record behind an event, or None.
+
+        Raises:
+            BlingApiError: If the API answers 429 or 5xx (after the session's retries).
+        """
+        path = RESOURCE_PATHS.get(event.resource)
+        if path is None or event.action == 'deleted' or event.record_id is None:
+            return None
+        response = self.session.get(f'{path}/{event.record_id}')
+        if response.status_code == 429 or response.status_code >= 500:
+            raise BlingApiError(f'Bling API error ({response.status_code}): {response.text}')
+        if response.status_code >= 400:
+            if response.status_code != 404:
+                logger.warning('Cannot fetch %s %s (%d): %s', event.resource, event.record_id,
+                               response.status_code, response.text)
+            return None
+        return response.json().get('data')
+
+    def process(self, batch: List[WebhookEvent]):
+        """Fetch the records of a batch and hand it to the handler."""
+        with metrics.span('bling_webhook_batch'):
+            records = [(event, self.fetch(event)) for event in batch]
+            self.handler(records)
+        metrics.increment('bling_webhook_batches_total', result='ok')
+        metrics.increment('bling_webhook_events_processed_total', len(batch))
+
+    def run_once(self, timeout: Optional[float] = None) -> int:
+        """Process one batch; returns the number of events handled."""
+        batch = self.queue.get_batch(self.batch_size, self.WAIT if timeout is None else timeout)
+        if not batch:
+            return 0
+
+        import requests
+
+        try:
+            self.process(batch)
+        except (BlingApiError, requests.RequestException) as exc:
+            # Quota spent, auth outage or API errors: keep the events and slow down.
+            logger.warning('Webhook batch of %d events failed (%s), retrying in %.0fs',
+                           len(batch), exc, self.pause)
+            metrics.increment('bling_webhook_batches_total', result='requeued')
+            self.queue.requeue(batch)
+            self._stop_event.wait(self.pause)
+            return 0
+        except Exception:
+            logger.exception('Webhook handler failed, dropping %d events', len(batch))
+            metrics.increment('bling_webhook_batches_total', result='failed')
+            return 0
+        finally:
+            metrics.gauge('bling_webhook_queue_depth', len(self.queue))
+        return len(batch)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception:  # e.g. Redis unavailable, keep the worker alive
+                logger.exception('Webhook worker error, retrying in %.0fs', self.pause)
+                self._stop_event.wait(self.pause)
+
+    def start(self) -> 'WebhookProcessor':
+        self._stop_event.clear()
+        self._threads = [threading.Thread(target=self._run, name=f'bling-webhook-worker-{index}', daemon=True)
+                         for index in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+class WebhookReceiver:
+    """
+    A small HTTP endpoint for Bling webhooks (`http://<host>:<port><path>`).
+
+    Every POST is checked against the `X-Bling-Signature-256` header (401 on
+    mismatch), parsed (400 when invalid) and queued. Bling gets a 200 for
+    queued, merged and duplicate events, and a 503 with `Retry-After` while the
+    queue is full, so it redelivers later instead of the events being dropped.
+
+    Args:
+        queue: Event queue the processor drains.
+        host (str, optional): Listen address, `WEBHOOK_HOST` by default.
+        port (int, optional): Listen port, `WEBHOOK_PORT` by default (0 picks a free one).
+        path (str, optional): Endpoint path, `WEBHOOK_PATH` by default.
+        secret (str, optional): Signing key, `WEBHOOK_SECRET` or else `BLING_CLIENT_SECRET`;
+            signatures are not checked when `WEBHOOK_VERIFY_SIGNATURE` is off.
+
+    Raises:
+        ValueError: If `WEBHOOK_VERIFY_SIGNATURE` is on and there is no secret,
+            rather than accepting unsigned events.
+    """
+
+    def __init__(self, queue,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 path: Optional[str] = None,
+                 secret: Optional[str] = None):
+        self.queue = queue
+        self.host = host or ConfigSingleton.WEBHOOK_HOST
+        self.port = port if port is not None else ConfigSingleton.WEBHOOK_PORT
+        self.path = path or ConfigSingleton.WEBHOOK_PATH
+        if secret is None and ConfigSingleton.WEBHOOK_VERIFY_SIGNATURE:
+            secret = ConfigSingleton.WEBHOOK_SECRET or ConfigSingleton.BLING_CLIENT_SECRET
+        if ConfigSingleton.WEBHOOK_VERIFY_SIGNATURE and not secret:
+            raise ValueError('WEBHOOK_VERIFY_SIGNATURE is on but neither WEBHOOK_SECRET nor '
+                             'BLING_CLIENT_SECRET is set')
+        self.secret = secret
+        self._server = None
+
+    def accept(self, body: bytes, signature: Optional[str]) -> Tuple[int, str]:
+        """Validate and queue one webhook body; returns the HTTP status and result."""
+        if self.secret and not verify_signature(body, signature, self.secret):
+            result, status = 'unauthorized', 401
+        else:
+            try:
+                result = self.queue.put(parse_event(body))
+                status = 503 if result == FULL else 200
+            except WebhookError:
+                result, status = 'invalid', 400
+        metrics.increment('bling_webhook_events_total', result=result)
+        return status, result
+
+    def start(self) -> 'WebhookReceiver':
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        receiver = self
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, result: str):
+                payload = json.dumps({'result': result}).encode('utf-8')
+                self.send_response(status)
+                if status == 503:
+                    self.send_header('Retry-After', str(ConfigSingleton.WEBHOOK_RETRY_AFTER))
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                if self.path.split('?', 1)[0] != receiver.path:
+                    self._reply(404, 'not_found')
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # The body cannot be delimited; drop the connection after answering.
+                    self.close_connection = True
+                    self._reply(400, 'invalid_length')
+                    return
+                if length > MAX_BODY_BYTES:
+                    self.close_connection = True
+                    self._reply(413, 'too_large')
+                    return
+                self._reply(*receiver.accept(self.rfile.read(length), self.headers.get(SIGNATURE_HEADER)))
+
+        self._server = ThreadingHTTPServer((self.host, self.port), WebhookHandler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name='bling-webhook-receiver', daemon=True).start()
+        logger.info('Receiving Bling webhooks on http://%s:%d%s', self.host, self.port, self.path)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,46 @@
+import argparse
+import logging
+import signal
+import threading
+
+from config import ConfigSingleton
+from modules.token_service import TokenService
+
+def main():
+    """Run the token service until SIGINT/SIGTERM.
+
+    Serves the `BLING_CLIENT_ID` account as `default`, or every tenant of
+    `--tenants` (`TOKEN_SERVICE_TENANTS_FILE`) by tenant id. Workers then use
+    `modules.token_service.TokenServiceClient` instead of their own refreshes."""
+
+    parser = argparse.ArgumentParser(description='Serve valid Bling access tokens over a local socket.')
+    parser.add_argument('--socket', help='Unix socket path (TOKEN_SERVICE_SOCKET)')
+    parser.add_argument('--port', type=int, help='Listen on 127.0.0.1:<port> instead (TOKEN_SERVICE_PORT)')
+    parser.add_argument('--tenants', help='Tenants JSON file (TOKEN_SERVICE_TENANTS_FILE)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    address = ('127.0.0.1', args.port) if args.port else args.socket
+    tenants_file = args.tenants or ConfigSingleton.TOKEN_SERVICE_TENANTS_FILE
+    if tenants_file:
+        service = TokenService.from_tenants_file(tenants_file, address=address)
+    else:
+        service = TokenService(address=address)
+
+    if ConfigSingleton.METRICS_ENABLED and ConfigSingleton.METRICS_PORT:
+        from modules.metrics import start_metrics_server
+        start_metrics_server()
+
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+
+    service.start()
+    try:
+        stopped.wait()
+    finally:
+        service.stop()
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+from modules import bling
 from modules.bling import BlingApiTokenHandler, TokenStorage
 
 
@@ -44,18 +45,19 @@ def refresh_tokens_example(refresh_token: str,
 def get_valid_access_token(token_storage: TokenStorage,
                            token_handler: BlingApiTokenHandler):
     """
-    Return a valid access token, refreshing it only when needed.
-    """
-    access_token = token_storage.retrieve_token_by_key('access_token')
-    if access_token and not token_storage.is_token_expired('access_token'):
-        return access_token
+    - Return a valid access token, refreshing it only when needed
+      (see `modules.bling.get_valid_access_token`).
+    - Retorna um token de acesso válido, atualizando-o somente quando necessário.
 
-    refresh_token = token_storage.retrieve_token_by_key('refresh_token')
-    if not refresh_token:
-        return None
+    Args:
+        token_storage: TokenStorage
+        token_handler: BlingApiTokenHandler
+
+    Returns:
+        Optional[str]
+    """
 
-    token_handler.refresh_tokens(refresh_token)
-    return token_storage.retrieve_token_by_key('access_token')
+    return bling.get_valid_access_token(token_storage, token_handler)
 
 def bling_api_call_example(token_storage: TokenStorage,
                   token_handler: BlingApiTokenHandler) -> str:
@@ -80,10 +82,11 @@ def bling_api_call_example(token_storage: TokenStorage,
 
     if access_token:
         # YOUR API CALLS HERE
+        # Reuse one BlingSession: it keeps the connection pool alive, sends the
+        # Bearer token and refreshes it once on a 401.
         """
-            headers = {'Authorization': f'Bearer {access_token}'}
-            request = requests.Session()
-            resp = request.get(url, headers=headers)
+            session = BlingSession(token_storage, token_handler)
+            resp = session.get('/produtos', params={'pagina': 1, 'limite': 100})
             ...
             ...
             data = resp.json()
@@ -0,0 +1,54 @@
+import argparse
+import logging
+import signal
+import threading
+
+from config import ConfigSingleton
+from modules.webhooks import WebhookProcessor, WebhookReceiver, get_event_queue
+
+logger = logging.getLogger('webhooks')
+
+def log_batch(records):
+    """Example handler: log every event with the record fetched for it.
+    Replace it with your own sync (database upsert, cache invalidation, ...)."""
+
+    for event, record in records:
+        logger.info('%s %s %s', event.event, event.record_id,
+                    'deleted' if record is None else f'{len(record)} fields')
+
+def main():
+    """Receive Bling webhooks and process them until SIGINT/SIGTERM.
+
+    Events are queued (`WEBHOOK_QUEUE`), deduplicated and handed in batches to
+    `WEBHOOK_WORKERS` workers, which fetch the changed records with the shared
+    access token instead of polling the API."""
+
+    parser = argparse.ArgumentParser(description='Receive Bling webhooks and fetch the changed records.')
+    parser.add_argument('--host', help='Listen address (WEBHOOK_HOST)')
+    parser.add_argument('--port', type=int, help='Listen port (WEBHOOK_PORT)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    queue = get_event_queue()
+    processor = WebhookProcessor(log_batch, queue=queue)
+    receiver = WebhookReceiver(queue, host=args.host, port=args.port)
+
+    if ConfigSingleton.METRICS_ENABLED and ConfigSingleton.METRICS_PORT:
+        from modules.metrics import start_metrics_server
+        start_metrics_server()
+
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+
+    processor.start()
+    receiver.start()
+    try:
+        stopped.wait()
+    finally:
+        receiver.stop()
+        processor.stop()
+
+if __name__ == '__main__':
+    main()
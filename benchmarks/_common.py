@@ -0,0 +1,58 @@
+"""Shared helpers for the benchmark scripts (run them from the project root)."""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / 'app'
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+os.environ.setdefault('BLING_CLIENT_ID', 'bench-client-id')
+os.environ.setdefault('BLING_CLIENT_SECRET', 'bench-client-secret')
+
+
+def use_temp_base_dir() -> str:
+    """Point the credentials folder at a throwaway directory."""
+    from config import ConfigSingleton
+
+    base_dir = tempfile.mkdtemp(prefix='bling-bench-')
+    ConfigSingleton.BASE_DIR = Path(base_dir)
+    return base_dir
+
+
+def ops_per_second(func, duration: float = 2.0) -> float:
+    """Call `func` in a tight loop for `duration` seconds and return calls/s."""
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + duration
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            func()
+        calls += 100
+    return calls / (time.perf_counter() - started)
+
+
+def use_redis_backend() -> str:
+    """
+    Point TokenStorage at Redis: the server configured in `.env` when reachable,
+    otherwise an in-process fakeredis server. Returns a description of the backend.
+    """
+    import redis
+    from modules import redis_client, storage
+
+    storage.set_storage_backend('redis')
+    try:
+        if redis_client.get_redis_connection().ping():
+            return f'redis-server {redis_client.RedisConn.HOST}:{redis_client.RedisConn.PORT}'
+    except redis.RedisError:
+        pass
+
+    import fakeredis
+
+    server = fakeredis.FakeServer()
+    redis_client._pool = redis.ConnectionPool(connection_class=fakeredis.FakeConnection, server=server)
+    redis_client._client = redis.Redis(connection_pool=redis_client._pool)
+    redis_client._pool_pid = os.getpid()
+    return 'fakeredis'
@@ -0,0 +1,118 @@
+"""
+Throughput of `BatchWriter` against the fake Bling server as the worker count
+grows, with duplicate updates coalesced and injected 503s retried.
+
+    python benchmarks/bench_batch.py --operations 1000 --api-latency 0.02 --rate 1000
+    python benchmarks/bench_batch.py --operations 60 --rate 3   # capped by Bling's 3 req/s
+
+It also times an unrelated `asyncio.to_thread` call while coroutines queue on a
+3 req/s limiter: waiting coroutines must not hold executor threads.
+"""
+import argparse
+import asyncio
+import time
+
+import _common
+from config import ConfigSingleton
+from fake_bling_server import FakeBlingState, start_fake_server
+from modules import storage
+from modules.batch import AsyncBatchWriter, BatchWriter, BlingOperation
+from modules.bling import BlingApiTokenHandler, TokenStorage
+from modules.rate_limit import LocalTokenBucket, RateLimiter
+from modules.session import BlingSession
+
+
+def build_operations(count: int):
+    # Every product gets a price and a stock update, and every 10th price is sent twice.
+    operations = []
+    for product_id in range(1, count // 2 + 1):
+        operations.append(BlingOperation('PATCH', f'/produtos/{product_id}', json={'preco': product_id}))
+        operations.append(BlingOperation('PUT', f'/estoques/{product_id}', json={'saldo': product_id}))
+        if product_id % 10 == 0:
+            operations.append(BlingOperation('PATCH', f'/produtos/{product_id}', json={'preco': -product_id}))
+    return operations
+
+
+def report(label: str, operations, results, elapsed: float, state: FakeBlingState, writes_before: int):
+    failed = [result for result in results if not result.ok]
+    assert len(results) == len(operations), label
+    assert not failed, f'{label}: {len(failed)} failed, first: {failed[0].error}'
+    print(f'  {label:<18} {elapsed:7.3f} s  {len(operations) / elapsed:8.0f} ops/s  '
+          f'writes={state.api_writes - writes_before}')
+
+
+async def executor_latency(waiters: int) -> float:
+    """Seconds an `asyncio.to_thread` call takes while `waiters` coroutines queue on a 3 req/s limiter."""
+    limiter = RateLimiter(LocalTokenBucket(3, 1))
+    tasks = [asyncio.create_task(limiter.acquire_async()) for _ in range(waiters)]
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    await asyncio.to_thread(time.sleep, 0)
+    latency = time.perf_counter() - started
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    assert not limiter._waiters, 'cancelled waiters left in the queue'
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--operations', type=int, default=1000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--api-latency', type=float, default=0.02)
+    parser.add_argument('--rate', type=float, default=1000.0)
+    parser.add_argument('--error-every', type=int, default=50)
+    args = parser.parse_args()
+
+    _common.use_temp_base_dir()
+    storage.set_storage_backend('json')
+    ConfigSingleton.RATE_LIMIT_PER_SECOND = args.rate
+    ConfigSingleton.RATE_LIMIT_BURST = max(1, int(args.rate))
+
+    state = FakeBlingState(api_latency=args.api_latency, error_every=args.error_every)
+    _, base_url = start_fake_server(state)
+    BlingApiTokenHandler.AUTH_URL = f'{base_url}/Api/v3/oauth/token'
+    TokenStorage.save_token('refresh_token', state.refresh_token)
+    session = BlingSession(base_url=f'{base_url}/Api/v3')
+
+    operations = build_operations(args.operations)
+    print(f'{len(operations)} operations, {args.api_latency * 1000:.0f} ms per call, '
+          f'rate limit {args.rate:g}/s, a 503 every {args.error_every} calls')
+
+    for workers in args.workers:
+        writes_before = state.api_writes
+        started = time.perf_counter()
+        results = BatchWriter(session, workers=workers, backoff=0.01).run(operations)
+        report(f'threads x{workers}', operations, results, time.perf_counter() - started, state, writes_before)
+
+    try:
+        from modules.bling_async import AsyncBlingApiTokenHandler, AsyncBlingSession
+    except ModuleNotFoundError:
+        print('  async: skipped, httpx is not installed')
+    else:
+        AsyncBlingApiTokenHandler.AUTH_URL = BlingApiTokenHandler.AUTH_URL
+
+        async def run_async(workers: int):
+            writer = AsyncBatchWriter(AsyncBlingSession(base_url=f'{base_url}/Api/v3'),
+                                      workers=workers, backoff=0.01)
+            try:
+                return await writer.run(operations)
+            finally:
+                await AsyncBlingApiTokenHandler.aclose()
+
+        workers = max(args.workers)
+        writes_before = state.api_writes
+        started = time.perf_counter()
+        results = asyncio.run(run_async(workers))
+        report(f'asyncio x{workers}', operations, results, time.perf_counter() - started, state, writes_before)
+
+    print(f'token POSTs: {state.token_posts}, injected errors: {state.api_errors}')
+
+    latency = asyncio.run(executor_latency(200))
+    print(f'to_thread call with 200 coroutines waiting on the limiter: {latency * 1000:.1f} ms')
+    assert latency < 1.0, 'waiting coroutines starve the default executor'
+
+
+if __name__ == '__main__':
+    main()
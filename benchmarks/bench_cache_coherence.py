@@ -0,0 +1,73 @@
+"""
+Coherence of the in-process token cache in Redis mode: another node rotates the
+tokens (a direct Redis write, the local cache is not touched) and we measure how
+long the local cache keeps serving the old access token, with and without the
+rotation events, plus the cost of a cached vs an uncached read.
+
+Uses the redis-server configured in `.env` when reachable, otherwise fakeredis.
+
+    python benchmarks/bench_cache_coherence.py
+"""
+import statistics
+import time
+
+import _common
+from config import ConfigSingleton
+from modules import bling, token_events
+from modules.bling import BlingApiTokenHandler, TokenStorage
+from modules.redis_client import RedisClient
+from modules.token_cache import token_cache
+
+
+def rotate(generation: int):
+    """Write new tokens the way another node's refresh would."""
+    RedisClient().set_bling_tokens([('access_token', f'access-{generation}', 3600),
+                                    ('refresh_token', f'refresh-{generation}', 2592000)],
+                                   int(time.time()))
+
+
+def stale_for(token_storage, token_handler, generation: int, limit: float = 1.0) -> float:
+    """Seconds the cache keeps serving the previous token after a rotation (capped at `limit`)."""
+    expected = f'access-{generation}'
+    rotate(generation)
+    started = time.perf_counter()
+    while bling.get_valid_access_token(token_storage, token_handler) != expected:
+        if time.perf_counter() - started >= limit:
+            return limit
+        time.sleep(0.0001)  # let the listener thread take the GIL, as a real worker would
+    return time.perf_counter() - started
+
+
+def main():
+    _common.use_temp_base_dir()
+    backend = _common.use_redis_backend()
+    ConfigSingleton.RATE_LIMIT_ENABLED = False
+    token_storage, token_handler = TokenStorage(), BlingApiTokenHandler()
+
+    rotate(0)
+    bling.get_valid_access_token(token_storage, token_handler)
+    cached = _common.ops_per_second(lambda: bling.get_valid_access_token(token_storage, token_handler), 1.0)
+    ConfigSingleton.ACCESS_TOKEN_CACHE_ENABLED = False
+    token_cache.invalidate()
+    uncached = _common.ops_per_second(lambda: bling.get_valid_access_token(token_storage, token_handler), 1.0)
+    ConfigSingleton.ACCESS_TOKEN_CACHE_ENABLED = True
+
+    print(f'backend                 : {backend}')
+    print(f'cached read             : {1e6 / cached:8.1f} us')
+    print(f'uncached read (Redis)   : {1e6 / uncached:8.1f} us')
+
+    delays = [stale_for(token_storage, token_handler, generation) for generation in range(1, 201)]
+    delays.sort()
+    print(f'stale after rotation    : median {statistics.median(delays) * 1e3:.2f} ms, '
+          f'p99 {delays[int(len(delays) * 0.99)] * 1e3:.2f} ms, max {delays[-1] * 1e3:.2f} ms (events on)')
+
+    token_events.stop_listening()
+    ConfigSingleton.REDIS_TOKEN_EVENTS_ENABLED = False
+    token_cache.invalidate()
+    bling.get_valid_access_token(token_storage, token_handler)
+    print(f'stale after rotation    : >= {stale_for(token_storage, token_handler, 1000):.1f} s '
+          f'(events off, until the cached token expires)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Latency of `get_valid_access_token` during an auth outage, with and without the
+circuit breaker. The stored access token is inside its expiry skew (so every
+call tries to refresh) but still valid, and the fake token endpoint either
+hangs (`--mode slow`) or answers 503 (`--mode error`).
+
+    python benchmarks/bench_circuit_breaker.py --mode slow --calls 40
+"""
+import argparse
+import statistics
+import time
+
+import _common
+from config import ConfigSingleton
+from fake_bling_server import FakeBlingState, start_fake_server
+from modules import bling, storage
+from modules.bling import BlingApiError, BlingApiTokenHandler, TokenStorage
+from modules.token_cache import token_cache
+
+
+def measure(calls: int, token_storage, token_handler):
+    latencies, served, failed = [], 0, 0
+    for _ in range(calls):
+        token_cache.invalidate()
+        started = time.perf_counter()
+        try:
+            served += bool(bling.get_valid_access_token(token_storage, token_handler))
+        except BlingApiError:
+            failed += 1
+        latencies.append(time.perf_counter() - started)
+    return latencies, served, failed
+
+
+def describe(label: str, latencies, served: int, failed: int):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies)
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    print(f'  {label:<28} p50={p50 * 1000:9.3f} ms  p99={p99 * 1000:9.3f} ms  '
+          f'total={sum(latencies):6.2f} s  served={served} failed={failed}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['slow', 'error'], default='slow')
+    parser.add_argument('--calls', type=int, default=40)
+    parser.add_argument('--timeout', type=float, default=0.5)
+    args = parser.parse_args()
+
+    _common.use_temp_base_dir()
+    storage.set_storage_backend('json')
+    ConfigSingleton.RATE_LIMIT_ENABLED = False
+    ConfigSingleton.AUTH_TIMEOUT = args.timeout
+    ConfigSingleton.CIRCUIT_BREAKER_RECOVERY_TIMEOUT = 3600
+    ConfigSingleton.RETRY_ENABLED = False  # measure the breaker alone, see bench_retry.py
+
+    state = FakeBlingState(latency=args.timeout * 4 if args.mode == 'slow' else 0.0,
+                           token_error_status=503 if args.mode == 'error' else None)
+    _, base_url = start_fake_server(state)
+    BlingApiTokenHandler.AUTH_URL = f'{base_url}/Api/v3/oauth/token'
+
+    # Obtained 3570 s ago with a 3600 s lifetime: inside the 60 s skew, still valid.
+    TokenStorage.save_token('access_token', 'still-valid-token', 3600, int(time.time()) - 3570)
+    TokenStorage.save_token('refresh_token', state.refresh_token)
+    token_storage, token_handler = TokenStorage(), BlingApiTokenHandler()
+
+    print(f'auth outage ({args.mode}), {args.calls} calls, auth timeout {args.timeout:g} s')
+
+    ConfigSingleton.CIRCUIT_BREAKER_ENABLED = False
+    ConfigSingleton.CIRCUIT_BREAKER_GRACE_PERIOD = -1
+    describe('no breaker, no grace', *measure(args.calls, token_storage, token_handler))
+
+    ConfigSingleton.CIRCUIT_BREAKER_ENABLED = True
+    ConfigSingleton.CIRCUIT_BREAKER_GRACE_PERIOD = 0
+    describe('breaker + grace window', *measure(args.calls, token_storage, token_handler))
+    print(f'token POSTs: {state.token_posts}')
+
+
+if __name__ == '__main__':
+    main()
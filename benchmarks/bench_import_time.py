@@ -0,0 +1,66 @@
+"""
+Import time of the token modules in a fresh interpreter, and a guard that the
+heavy dependencies (`requests`, `redis`, `dotenv`, `asyncio`, `http.server`)
+are only loaded on first use. Exits with status 1 when a module imports one of
+them eagerly or its median import time exceeds `--max-ms`, so it can run in CI.
+
+    python benchmarks/bench_import_time.py --max-ms 60
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+import _common
+
+MODULES = ['config', 'modules.bling', 'modules.redis_client', 'modules.metrics', 'modules.session']
+DEFERRED = ['requests', 'urllib3', 'redis', 'dotenv', 'asyncio', 'http.server']
+# Modules that need a heavy dependency by design (they wrap it).
+ALLOWED = {'modules.redis_client': {'redis', 'asyncio'}, 'modules.session': {'requests', 'urllib3'}}
+
+SNIPPET = '''
+import importlib, json, sys, time
+sys.path.insert(0, {app_dir!r})
+before = set(sys.modules)
+started = time.perf_counter()
+importlib.import_module({module!r})
+elapsed = time.perf_counter() - started
+loaded = [name for name in {deferred!r} if name in sys.modules and name not in before]
+print(json.dumps({{"ms": elapsed * 1000, "loaded": loaded}}))
+'''
+
+
+def measure(module: str, repeat: int) -> dict:
+    samples, loaded = [], set()
+    for _ in range(repeat):
+        code = SNIPPET.format(app_dir=str(_common.APP_DIR), module=module, deferred=DEFERRED)
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result['ms'])
+        loaded.update(result['loaded'])
+    return {'median_ms': statistics.median(samples), 'min_ms': min(samples), 'loaded': sorted(loaded)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--max-ms', type=float, default=0, help='fail above this median (0 = no budget)')
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        result = measure(module, args.repeat)
+        eager = sorted(set(result['loaded']) - ALLOWED.get(module, set()))
+        over_budget = bool(args.max_ms) and module not in ALLOWED and result['median_ms'] > args.max_ms
+        failed |= bool(eager) or over_budget
+        status = 'FAIL' if eager or over_budget else 'ok'
+        print(f'{module:<22} median {result["median_ms"]:7.1f} ms  min {result["min_ms"]:7.1f} ms  '
+              f'eager: {", ".join(eager) or "-":<20} {status}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Cost of the instrumentation on the hottest path (a cached `get_valid_access_token`)
+with the no-op hook and with PrometheusMetrics, then a sample of the exported
+metrics after a few refreshes against the fake Bling server.
+
+    python benchmarks/bench_metrics.py
+"""
+import time
+
+import _common
+from config import ConfigSingleton
+from fake_bling_server import FakeBlingState, start_fake_server
+from modules import bling, metrics, storage
+from modules.bling import BlingApiTokenHandler, TokenStorage
+from modules.token_cache import token_cache
+
+
+def main():
+    _common.use_temp_base_dir()
+    storage.set_storage_backend('json')
+    ConfigSingleton.RATE_LIMIT_ENABLED = False
+
+    state = FakeBlingState()
+    _, base_url = start_fake_server(state)
+    BlingApiTokenHandler.AUTH_URL = f'{base_url}/Api/v3/oauth/token'
+    TokenStorage.save_token('refresh_token', state.refresh_token)
+    token_storage, token_handler = TokenStorage(), BlingApiTokenHandler()
+    bling.get_valid_access_token(token_storage, token_handler)
+
+    def read():
+        bling.get_valid_access_token(token_storage, token_handler)
+
+    metrics.set_metrics_hook(metrics.MetricsHook())
+    noop = _common.ops_per_second(read)
+    prometheus_hook = metrics.PrometheusMetrics()
+    metrics.set_metrics_hook(prometheus_hook)
+    prometheus = _common.ops_per_second(read)
+    print(f'cached reads, no-op hook:    {noop:12,.0f} ops/s ({1e9 / noop:6.0f} ns/op)')
+    print(f'cached reads, Prometheus:    {prometheus:12,.0f} ops/s ({1e9 / prometheus:6.0f} ns/op)')
+
+    prometheus_hook.reset()
+    now = int(time.time())
+    for _ in range(5):
+        TokenStorage.save_token('access_token', 'expired', 3600, now - 7200)
+        token_cache.invalidate()
+        bling.get_valid_access_token(token_storage, token_handler)
+        for _ in range(10):
+            read()
+
+    print()
+    print('\n'.join(line for line in prometheus_hook.render().splitlines()
+                    if '_bucket' not in line))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Export a paginated list endpoint from the fake Bling server with
+`BlingPaginator`/`AsyncBlingPaginator`, serially and with prefetching.
+
+Every run checks that all records arrive once and in order; the access token is
+revoked mid-stream to exercise the transparent refresh, and one run is
+interrupted and resumed from its checkpoint.
+
+    python benchmarks/bench_pagination.py --records 5000 --api-latency 0.02
+"""
+import argparse
+import asyncio
+import importlib.util
+import time
+
+import _common
+from config import ConfigSingleton
+from fake_bling_server import FakeBlingState, start_fake_server
+from modules import storage
+from modules.bling import BlingApiTokenHandler, TokenStorage
+from modules.pagination import AsyncBlingPaginator, BlingPaginator
+from modules.session import BlingSession
+from modules.token_cache import token_cache
+
+
+def revoke_access_tokens(state: FakeBlingState):
+    with state.lock:
+        state.valid_access_tokens.clear()
+
+
+def check(records, expected, label: str):
+    ids = [record['id'] for record in records]
+    assert ids == expected, f'{label}: got {len(ids)} records, expected {len(expected)} in order'
+
+
+def run_sync(session, state, expected, limit, prefetch):
+    records = []
+    started = time.perf_counter()
+    for record in BlingPaginator(session, '/produtos', limit=limit, prefetch=prefetch):
+        records.append(record)
+        if len(records) == len(expected) // 2:
+            revoke_access_tokens(state)
+    elapsed = time.perf_counter() - started
+    check(records, expected, f'sync prefetch={prefetch}')
+    return elapsed
+
+
+async def run_async(state, expected, limit, prefetch, base_url):
+    from modules.bling_async import AsyncBlingApiTokenHandler, AsyncBlingSession
+
+    session = AsyncBlingSession(base_url=base_url)
+    records = []
+    started = time.perf_counter()
+    async for record in AsyncBlingPaginator(session, '/produtos', limit=limit, prefetch=prefetch):
+        records.append(record)
+        if len(records) == len(expected) // 2:
+            revoke_access_tokens(state)
+    elapsed = time.perf_counter() - started
+    await AsyncBlingApiTokenHandler.aclose()
+    check(records, expected, f'async prefetch={prefetch}')
+    return elapsed
+
+
+def run_resume(session, expected, limit):
+    checkpoints = []
+    records = {}
+    for page, page_records in BlingPaginator(session, '/produtos', limit=limit,
+                                             checkpoint=checkpoints.append).pages():
+        records[page] = page_records
+        if page == 3:
+            break
+
+    # Page 3 was interrupted before the consumer moved on, so it is delivered again.
+    records = [record for page in sorted(records) if page < checkpoints[-1] for record in records[page]]
+    resumed = BlingPaginator(session, '/produtos', limit=limit, start_page=checkpoints[-1])
+    records.extend(resumed)
+    check(records, expected, 'resume')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=5000)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--prefetch', type=int, default=4)
+    parser.add_argument('--api-latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    _common.use_temp_base_dir()
+    storage.set_storage_backend('json')
+    ConfigSingleton.RATE_LIMIT_PER_SECOND = 1000.0
+    ConfigSingleton.RATE_LIMIT_BURST = 1000
+
+    state = FakeBlingState(api_latency=args.api_latency)
+    expected = list(range(1, args.records + 1))
+    state.resources['produtos'] = [{'id': record_id, 'nome': f'Produto {record_id}'}
+                                   for record_id in expected]
+    _, base_url = start_fake_server(state)
+    BlingApiTokenHandler.AUTH_URL = f'{base_url}/Api/v3/oauth/token'
+    TokenStorage.save_token('refresh_token', state.refresh_token)
+    api_url = f'{base_url}/Api/v3'
+
+    session = BlingSession(base_url=api_url)
+    pages = -(-args.records // args.limit)
+    print(f'{args.records} records, {pages} pages, {args.api_latency * 1000:.0f} ms per page')
+
+    for prefetch in (0, args.prefetch):
+        elapsed = run_sync(session, state, expected, args.limit, prefetch)
+        print(f'  sync  prefetch={prefetch}: {elapsed:7.3f} s  ({args.records / elapsed:9.0f} records/s)')
+
+    if importlib.util.find_spec('httpx') is None:
+        print('  async: skipped, httpx is not installed')
+    else:
+        from modules.bling_async import AsyncBlingApiTokenHandler
+        AsyncBlingApiTokenHandler.AUTH_URL = BlingApiTokenHandler.AUTH_URL
+        for prefetch in (0, args.prefetch):
+            token_cache.invalidate()
+            elapsed = asyncio.run(run_async(state, expected, args.limit, prefetch, api_url))
+            print(f'  async prefetch={prefetch}: {elapsed:7.3f} s  ({args.records / elapsed:9.0f} records/s)')
+
+    run_resume(session, expected, args.limit)
+    print(f'resume from checkpoint: ok; token POSTs: {state.token_posts}, failed: {state.failed_posts}')
+
+
+if __name__ == '__main__':
+    main()
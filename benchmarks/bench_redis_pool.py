@@ -0,0 +1,54 @@
+"""
+Latency per token lookup in Redis mode: a new client per call (the previous
+behaviour) vs the shared connection pool.
+
+Uses the redis-server configured in `.env` (REDIS_HOST_IP/REDIS_HOST_PORT) when
+reachable, otherwise falls back to fakeredis (`pip install fakeredis`), which
+only measures client overhead since there is no TCP connect or AUTH.
+
+    python benchmarks/bench_redis_pool.py
+"""
+import time
+
+import _common
+import redis
+from modules import redis_client
+from modules.bling import TokenStorage
+
+
+def main():
+    backend = _common.use_redis_backend()
+    if backend == 'fakeredis':
+        import fakeredis
+
+        backend = 'fakeredis (no network, client overhead only)'
+        server = redis_client._pool.connection_kwargs['server']
+
+        def new_client():
+            return fakeredis.FakeRedis(server=server)
+    else:
+        def new_client():
+            return redis.Redis(host=redis_client.RedisConn.HOST,
+                               port=redis_client.RedisConn.PORT,
+                               password=redis_client.RedisConn.PASSWORD,
+                               db=0)
+
+    TokenStorage.save_token('access_token', 'bench-access-token', 3600, int(time.time()))
+
+    def unpooled():
+        new_client().get('access_token')
+        new_client().ttl('access_token')
+
+    def pooled():
+        TokenStorage.retrieve_token_by_key('access_token')
+        TokenStorage.is_token_expired('access_token')
+
+    before = _common.ops_per_second(unpooled)
+    after = _common.ops_per_second(pooled)
+    print(f'backend          : {backend}')
+    print(f'client per call  : {1e6 / before:>10,.1f} us/lookup')
+    print(f'shared pool      : {1e6 / after:>10,.1f} us/lookup')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Refresh token renewal across many tenants: finding the refresh tokens due for
+renewal through the storage expiry index vs reading every credential record,
+then a RefreshTokenRenewer run against the fake Bling server.
+
+    python benchmarks/bench_renewal.py --tenants 5000 --due 40
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+
+import _common
+from config import ConfigSingleton
+from fake_bling_server import FakeBlingState, start_fake_server
+from modules import storage
+from modules.bling import BlingApiTokenHandler, TokenStorage
+from modules.tenants import BlingTenant, TenantTokenManager
+from modules.token_refresher import RefreshTokenRenewer
+
+DAY = 86400
+
+
+def seed(manager: TenantTokenManager, state: FakeBlingState, tenants: int, due: int, now: int):
+    """Store one account per tenant; `due` of them have a refresh token expiring within a week."""
+    lifetime = ConfigSingleton.DEFAULT_REFRESH_TOKEN_EXPIRES_IN
+    by_obtained_at = defaultdict(list)
+    for index, tenant_id in enumerate(manager.tenant_ids):
+        days_left = random.uniform(1, 6) if index < due else random.uniform(8, 29)
+        obtained_at = now - lifetime + int(days_left * DAY) // 3600 * 3600
+        prefix = manager.key_prefix(tenant_id)
+        by_obtained_at[obtained_at] += [(f'{prefix}access_token', f'access-{index}', 3600),
+                                        (f'{prefix}refresh_token', state.issue_refresh_token(), lifetime)]
+    for obtained_at, entries in by_obtained_at.items():
+        TokenStorage.save_tokens(entries, obtained_at)
+
+
+def full_scan(manager: TenantTokenManager, now: float, renew_until: float):
+    keys = [manager.handler(tenant_id).refresh_token_key for tenant_id in manager.tenant_ids]
+    records = TokenStorage.retrieve_token_records(keys)
+    due = [(key, obtained_at + expires_in) for key, (token, expires_in, obtained_at) in records.items()
+           if token and expires_in and now <= obtained_at + expires_in <= renew_until]
+    return sorted(due, key=lambda item: (item[1], item[0]))
+
+
+def per_call(func, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tenants', type=int, default=5000)
+    parser.add_argument('--due', type=int, default=40)
+    parser.add_argument('--backends', nargs='+', default=['memory', 'sqlite', 'redis', 'json'])
+    args = parser.parse_args()
+
+    ConfigSingleton.RATE_LIMIT_ENABLED = False
+    state = FakeBlingState()
+    _, base_url = start_fake_server(state)
+    BlingApiTokenHandler.AUTH_URL = f'{base_url}/Api/v3/oauth/token'
+
+    for backend in args.backends:
+        _common.use_temp_base_dir()
+        if backend == 'redis':
+            try:
+                label = _common.use_redis_backend()
+            except ModuleNotFoundError:
+                print(f'{backend:<7} skipped: redis and fakeredis unavailable')
+                continue
+            TokenStorage.rebuild_expiry_index()
+        else:
+            label = storage.set_storage_backend(backend).name
+
+        manager = TenantTokenManager([BlingTenant(f'tenant-{index}') for index in range(args.tenants)],
+                                     app_name='bench')
+        now = int(time.time())
+        seed(manager, state, args.tenants, args.due, now)
+        renew_until = now + ConfigSingleton.REFRESH_TOKEN_RENEW_BEFORE
+
+        indexed = TokenStorage.refresh_token_expiries(now, renew_until, args.tenants)
+        assert (sorted(indexed, key=lambda item: (item[1], item[0]))
+                == full_scan(manager, now, renew_until)), 'index and scan disagree'
+        index_seconds = per_call(lambda: TokenStorage.refresh_token_expiries(now, renew_until, 50), 200)
+        scan_seconds = per_call(lambda: full_scan(manager, now, renew_until), 3)
+
+        renewer = RefreshTokenRenewer(handler_for_key=manager.handler_for_key, batch_size=16)
+        posts_before = state.token_posts
+        started = time.perf_counter()
+        runs = 1
+        while renewer.run_once() == renewer.MIN_INTERVAL:
+            runs += 1
+        renew_seconds = time.perf_counter() - started
+        remaining = TokenStorage.refresh_token_expiries(time.time(), renew_until, args.tenants)
+
+        print(f'{label:<7} due={len(indexed):<4} index query {index_seconds * 1e3:8.3f} ms   '
+              f'full scan {scan_seconds * 1e3:9.1f} ms   '
+              f'renewed {state.token_posts - posts_before} in {runs} run(s), {renew_seconds:.2f} s, '
+              f'{len(remaining)} still due')
+
+
+if __name__ == '__main__':
+    main()
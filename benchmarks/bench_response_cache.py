@@ -0,0 +1,140 @@
+"""
+GET response cache against the fake Bling server: a skewed read workload over
+a product list and a category list, without the cache, with the in-memory LRU,
+with a byte budget too small for the working set, with short TTLs revalidated
+through ETags, and with two caches (two processes) sharing the Redis tier.
+
+Each run reports the API requests sent, the hit rate and the memory footprint;
+every response is checked against the uncached one. A last check writes a
+product and reads it back through the same cache, which must not be stale.
+
+    python benchmarks/bench_response_cache.py --reads 3000 --api-latency 0.01
+"""
+import argparse
+import random
+import time
+
+import _common
+from config import ConfigSingleton
+from fake_bling_server import FakeBlingState, start_fake_server
+from modules import storage
+from modules.bling import BlingApiTokenHandler, TokenStorage
+from modules.response_cache import ResponseCache
+from modules.session import BlingSession
+
+
+def workload(reads: int, pages: int, seed: int = 7):
+    """`(path, params)` reads: product pages by a Zipf-like popularity, some category lookups."""
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, pages + 1)]
+    calls = []
+    for _ in range(reads):
+        if rng.random() < 0.2:
+            calls.append(('/categorias/produtos', None))
+        else:
+            calls.append(('/produtos', {'pagina': rng.choices(range(1, pages + 1), weights)[0], 'limite': 100}))
+    return calls
+
+
+def expected_responses(session: BlingSession, calls):
+    expected = {}
+    for path, params in calls:
+        if (path, str(params)) not in expected:
+            expected[path, str(params)] = session.get(path, params=params).json()
+    return expected
+
+
+def run(label, sessions, state, calls, expected):
+    requests_before, not_modified_before = state.api_requests, state.not_modified
+    started = time.perf_counter()
+    for index, (path, params) in enumerate(calls):
+        response = sessions[index % len(sessions)].get(path, params=params)
+        assert response.status_code == 200 and response.json() == expected[(path, str(params))], label
+    elapsed = time.perf_counter() - started
+
+    caches = {id(session.response_cache): session.response_cache
+              for session in sessions if session.response_cache is not None}
+    hits = sum(cache.stats['hit'] for cache in caches.values())
+    footprint = sum(cache.size for cache in caches.values())
+    print(f'{label:<26} {elapsed:7.2f} s  API requests {state.api_requests - requests_before:5}  '
+          f'304s {state.not_modified - not_modified_before:4}  hit rate {hits / len(calls):6.1%}  '
+          f'memory {footprint / 1024:8.1f} KiB')
+
+
+def read_after_write(session: BlingSession, state: FakeBlingState):
+    """PATCH a product, then read its page and record: the write must drop both cached responses."""
+    page = session.get('/produtos', params={'pagina': 1, 'limite': 100})
+    record = session.get('/produtos/1')
+    assert session.get('/produtos/1').from_cache, 'record not cached'
+    product = state.resources['produtos'][0]
+    product['preco'] += 1  # what the fake server would apply for the PATCH below
+    session.patch('/produtos/1', json={'preco': product['preco']})
+    page_after = session.get('/produtos', params={'pagina': 1, 'limite': 100})
+    record_after = session.get('/produtos/1')
+    assert not getattr(page_after, 'from_cache', False) and not getattr(record_after, 'from_cache', False)
+    assert page_after.json()['data'][0]['preco'] == record_after.json()['data']['preco'] == product['preco']
+    assert page.json() != page_after.json() and record.json() != record_after.json()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reads', type=int, default=3000)
+    parser.add_argument('--records', type=int, default=5000)
+    parser.add_argument('--api-latency', type=float, default=0.01)
+    args = parser.parse_args()
+
+    _common.use_temp_base_dir()
+    storage.set_storage_backend('json')
+    ConfigSingleton.RATE_LIMIT_ENABLED = False
+
+    state = FakeBlingState(api_latency=args.api_latency, etags=True)
+    state.resources['produtos'] = [{'id': record_id, 'nome': f'Produto {record_id}', 'preco': record_id * 1.5}
+                                   for record_id in range(1, args.records + 1)]
+    state.resources['categorias/produtos'] = [{'id': record_id, 'descricao': f'Categoria {record_id}'}
+                                              for record_id in range(1, 51)]
+    _, base_url = start_fake_server(state)
+    BlingApiTokenHandler.AUTH_URL = f'{base_url}/Api/v3/oauth/token'
+    TokenStorage.save_token('refresh_token', state.refresh_token)
+    api_url = f'{base_url}/Api/v3'
+
+    pages = -(-args.records // 100)
+    calls = workload(args.reads, pages)
+    uncached = BlingSession(base_url=api_url)
+    expected = expected_responses(uncached, calls)
+    ttls = {'/categorias': 3600}
+
+    run('no cache', [uncached], state, calls, expected)
+
+    cache = ResponseCache(max_bytes=32 << 20, default_ttl=60, ttls=ttls, redis_tier=False)
+    run('memory LRU', [BlingSession(base_url=api_url, response_cache=cache)], state, calls, expected)
+
+    small = ResponseCache(max_bytes=256 << 10, default_ttl=60, ttls=ttls, redis_tier=False)
+    run('memory LRU, 256 KiB', [BlingSession(base_url=api_url, response_cache=small)], state, calls, expected)
+    assert small.size <= 256 << 10, 'byte budget exceeded'
+
+    read_after_write(BlingSession(base_url=api_url, response_cache=cache), state)
+    print('read after write          PATCH /produtos/1 dropped the cached list page and record')
+    expected = expected_responses(uncached, calls)
+
+    expiring = ResponseCache(max_bytes=32 << 20, default_ttl=0.01, ttls={'/categorias': 0.01}, redis_tier=False)
+    run('TTL 10 ms + ETag 304s', [BlingSession(base_url=api_url, response_cache=expiring)], state, calls, expected)
+
+    try:
+        backend = _common.use_redis_backend()
+    except ModuleNotFoundError:
+        print('shared Redis tier         skipped: redis and fakeredis unavailable')
+        return
+    storage.set_storage_backend('json')
+    shared = [ResponseCache(max_bytes=32 << 20, default_ttl=60, ttls=ttls, redis_tier=True) for _ in range(2)]
+    writer = BlingSession(base_url=api_url, response_cache=shared[0])
+    read_after_write(writer, state)
+    record_key = shared[1].key(writer.token_handler.key_prefix, f'{api_url}/produtos/1')
+    assert shared[1].lookup(record_key)[0].content == writer.get('/produtos/1').content, 'Redis entry not invalidated'
+    expected = expected_responses(uncached, calls)
+    run('2 caches + Redis tier', [BlingSession(base_url=api_url, response_cache=cache) for cache in shared],
+        state, calls, expected)
+    print(f'  (Redis tier on {backend}: the two caches together send as many requests as one)')
+
+
+if __name__ == '__main__':
+    main()
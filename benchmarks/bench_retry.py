@@ -0,0 +1,157 @@
+"""
+Retry engine against the fake Bling server:
+
+- herd: when 500 clients fail together, the most retries landing in any 100 ms
+  window, for plain exponential backoff, exponential with equal jitter (the old
+  BatchWriter formula) and decorrelated jitter;
+- flaky auth: refreshes while every k-th token request gets a 503 with
+  `Retry-After`, without and with retries;
+- lost responses: grants applied by the server whose response never arrives;
+  blindly retrying replays the rotated refresh token, the policy never does;
+- flaky API: GETs while every k-th API call gets a 503.
+
+    python benchmarks/bench_retry.py --error-every 3 --base-delay 0.05
+"""
+import argparse
+import random
+import socket
+import time
+
+import _common
+import requests
+from config import ConfigSingleton
+from fake_bling_server import FakeBlingState, start_fake_server
+from modules import bling, storage
+from modules.bling import BlingApiError, BlingApiTokenHandler, TokenStorage
+from modules.retry import RetryPolicy, is_connect_error
+from modules.session import BlingSession
+
+
+class BlindRetryPolicy(RetryPolicy):
+    """Retries every failure as if the request were idempotent, grants included."""
+
+    @staticmethod
+    def retryable(exc, response, idempotent):
+        return RetryPolicy.retryable(exc, response, True)
+
+
+def peak_per_window(clients: int, delays, window: float = 0.1) -> int:
+    """Most retries arriving within one `window` when `clients` fail at t=0, for `delays(client)` schedules."""
+    arrivals = sorted(moment for client in range(clients) for moment in delays(client))
+    peak, start = 0, 0
+    for end, moment in enumerate(arrivals):
+        while arrivals[start] < moment - window:
+            start += 1
+        peak = max(peak, end - start + 1)
+    return peak
+
+
+def herd(clients: int, attempts: int, base: float, cap: float):
+    policy = RetryPolicy(max_attempts=attempts, base_delay=base, max_delay=cap)
+
+    def cumulative(step):
+        def schedule(_):
+            moments, elapsed, delay = [], 0.0, 0.0
+            for attempt in range(attempts - 1):
+                delay = step(attempt, delay)
+                elapsed += delay
+                moments.append(elapsed)
+            return moments
+        return schedule
+
+    print(f'herd: {clients} clients fail together, {attempts - 1} retries each, peak retries per 100 ms')
+    for label, step in (('exponential', lambda attempt, _: min(cap, base * 2 ** attempt)),
+                        ('exponential, equal jitter',
+                         lambda attempt, _: min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)),
+                        ('decorrelated jitter', lambda _, previous: policy.backoff(previous))):
+        print(f'  {label:<26} {peak_per_window(clients, cumulative(step)):5}')
+
+
+def refresh_many(state, token_handler, refreshes: int, reseed: bool):
+    """Run `refreshes` forced refreshes; with `reseed`, re-authorize after each failure."""
+    token_storage = TokenStorage()
+    failures, latencies = 0, []
+    for _ in range(refreshes):
+        started = time.perf_counter()
+        try:
+            bling.refresh_access_token(token_storage, token_handler, valid_until=time.time() + 86400)
+        except BlingApiError:
+            failures += 1
+            if reseed:
+                TokenStorage.save_token('refresh_token', state.issue_refresh_token())
+        latencies.append(time.perf_counter() - started)
+    return failures, max(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--error-every', type=int, default=3)
+    parser.add_argument('--refreshes', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--base-delay', type=float, default=0.05)
+    parser.add_argument('--retry-after', type=float, default=0.2)
+    args = parser.parse_args()
+
+    herd(clients=500, attempts=4, base=0.5, cap=10)
+
+    _common.use_temp_base_dir()
+    storage.set_storage_backend('json')
+    ConfigSingleton.RATE_LIMIT_ENABLED = False
+    ConfigSingleton.CIRCUIT_BREAKER_ENABLED = False
+    ConfigSingleton.RETRY_BASE_DELAY = args.base_delay
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        closed_port = probe.getsockname()[1]
+    try:
+        requests.get(f'http://127.0.0.1:{closed_port}/', timeout=1)
+    except requests.RequestException as exc:
+        assert is_connect_error(exc), f'refused connection not classified as a connect error: {exc!r}'
+
+    state = FakeBlingState()
+    _, base_url = start_fake_server(state)
+    BlingApiTokenHandler.AUTH_URL = f'{base_url}/Api/v3/oauth/token'
+    TokenStorage.save_token('refresh_token', state.refresh_token)
+    token_handler = BlingApiTokenHandler()
+
+    print(f'flaky auth: {args.refreshes} refreshes, a 503 (Retry-After {args.retry_after:g} s) '
+          f'every {args.error_every} token requests')
+    state.token_error_every, state.retry_after = args.error_every, args.retry_after
+    for enabled in (False, True):
+        ConfigSingleton.RETRY_ENABLED = enabled
+        posts_before = state.token_posts
+        failures, slowest = refresh_many(state, token_handler, args.refreshes, reseed=False)
+        survived = TokenStorage.retrieve_token_by_key('refresh_token') in state.valid_refresh_tokens
+        print(f'  retries {"on " if enabled else "off"}  failed {failures:3}/{args.refreshes}  '
+              f'token POSTs {state.token_posts - posts_before:3}  slowest {slowest:.2f} s  '
+              f'refresh token valid: {survived}')
+    state.token_error_every, state.retry_after = 0, None
+
+    print(f'lost responses: {args.refreshes} refreshes, one grant in {args.error_every} applied '
+          f'but its response dropped')
+    ConfigSingleton.RETRY_ENABLED = True
+    state.token_drop_every = args.error_every
+    for label, policy in (('blind retries', BlindRetryPolicy()), ('retry policy', RetryPolicy())):
+        token_handler.retry_policy = policy
+        replayed_before, dropped_before = state.replayed_grants, state.dropped_posts
+        failures, _ = refresh_many(state, token_handler, args.refreshes, reseed=True)
+        print(f'  {label:<14} failed {failures:3}/{args.refreshes}  lost responses '
+              f'{state.dropped_posts - dropped_before:3}  rotated refresh tokens replayed '
+              f'{state.replayed_grants - replayed_before:3}')
+    state.token_drop_every = 0
+    token_handler.retry_policy = None
+
+    print(f'flaky API: {args.requests} GETs, a 503 every {args.error_every} API calls')
+    state.resources['produtos'] = [{'id': record_id} for record_id in range(1, 101)]
+    state.error_every = args.error_every
+    for enabled in (False, True):
+        ConfigSingleton.RETRY_ENABLED = enabled
+        session = BlingSession(base_url=f'{base_url}/Api/v3', token_handler=token_handler)
+        requests_before = state.api_requests
+        ok = sum(session.get('/produtos').status_code == 200 for _ in range(args.requests))
+        print(f'  retries {"on " if enabled else "off"}  succeeded {ok:4}/{args.requests}  '
+              f'API calls {state.api_requests - requests_before:4}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Reads per second of `get_valid_access_token` with and without the
+in-process token cache (JSON storage).
+
+    python benchmarks/bench_token_cache.py
+"""
+import time
+
+import _common
+from config import ConfigSingleton
+from modules import storage
+from modules.bling import BlingApiTokenHandler, TokenStorage
+from modules.token_cache import token_cache
+from usage_example import get_valid_access_token
+
+
+def main():
+    _common.use_temp_base_dir()
+    storage.set_storage_backend('json')
+
+    now = int(time.time())
+    TokenStorage.save_token('access_token', 'bench-access-token', 3600, now)
+    TokenStorage.save_token('refresh_token', 'bench-refresh-token', 2592000, now)
+
+    token_storage = TokenStorage()
+    token_handler = BlingApiTokenHandler()
+
+    def read():
+        get_valid_access_token(token_storage, token_handler)
+
+    ConfigSingleton.ACCESS_TOKEN_CACHE_ENABLED = False
+    token_cache.invalidate()
+    uncached = _common.ops_per_second(read)
+
+    ConfigSingleton.ACCESS_TOKEN_CACHE_ENABLED = True
+    token_cache.invalidate()
+    cached = _common.ops_per_second(read)
+
+    print(f'storage reads : {uncached:>12,.0f} reads/s')
+    print(f'cached reads  : {cached:>12,.0f} reads/s')
+    print(f'speedup       : {cached / uncached:>12,.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Token service round trips: `GET` latency over the Unix socket and over
+localhost TCP, `get_token` served from memory by a watching client, and how long
+a rotation takes to reach a watcher, against the fake Bling server.
+
+    python benchmarks/bench_token_service.py
+"""
+import statistics
+import threading
+import time
+
+import _common
+from config import ConfigSingleton
+from fake_bling_server import FakeBlingState, start_fake_server
+from modules import bling, storage
+from modules.bling import BlingApiTokenHandler, TokenStorage
+from modules.token_service import TokenService, TokenServiceClient
+
+
+def latencies(func, calls: int = 20000):
+    samples = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    base_dir = _common.use_temp_base_dir()
+    storage.set_storage_backend('json')
+    ConfigSingleton.RATE_LIMIT_ENABLED = False
+
+    state = FakeBlingState()
+    _, base_url = start_fake_server(state)
+    BlingApiTokenHandler.AUTH_URL = f'{base_url}/Api/v3/oauth/token'
+    TokenStorage.save_token('refresh_token', state.refresh_token)
+    token_storage, token_handler = TokenStorage(), BlingApiTokenHandler()
+
+    unix_service = TokenService(address=f'{base_dir}/token-service.sock').start()
+    tcp_service = TokenService(address=('127.0.0.1', 0)).start(refresh=False)
+    posts_before = state.token_posts
+
+    ConfigSingleton.ACCESS_TOKEN_CACHE_ENABLED = False
+    rows = [('in-process, storage read', latencies(
+        lambda: bling.get_valid_access_token(token_storage, token_handler)))]
+    ConfigSingleton.ACCESS_TOKEN_CACHE_ENABLED = True
+    for label, address in (('GET over Unix socket', unix_service.address),
+                           ('GET over localhost TCP', tcp_service.address)):
+        client = TokenServiceClient(address)
+        rows.append((label, latencies(client.get_token)))
+        client.close()
+
+    watcher = TokenServiceClient(unix_service.address, watch=True)
+    watcher.get_token()
+    rows.append(('watching client, memory', latencies(watcher.get_token)))
+
+    for label, (p50, p99) in rows:
+        print(f'{label:<26} p50 {p50 * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us')
+
+    rotated = threading.Event()
+    watcher.subscribe(lambda account, token, expires_at: rotated.set())
+    reporter = TokenServiceClient(unix_service.address)
+    push_delays = []
+    for _ in range(20):
+        rotated.clear()
+        stale_token = reporter.get_token()
+        started = time.perf_counter()
+        reporter.refresh(stale_token=stale_token)
+        rotated.wait(5)
+        push_delays.append(time.perf_counter() - started)
+    print(f'REFRESH until watcher push median {statistics.median(push_delays) * 1e3:6.2f} ms '
+          f'(includes the token POST)')
+    print(f'token POSTs: {state.token_posts - posts_before} (1 initial + 20 forced rotations expected)')
+
+    watcher.close()
+    reporter.close()
+    unix_service.stop()
+    tcp_service.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Webhook ingestion vs polling against the fake Bling server.
+
+A stream of product changes (Zipf-skewed, 5% of deliveries repeated like
+Bling's redeliveries) is pushed to a WebhookReceiver as signed events; the
+WebhookProcessor fetches each changed product once per batch. The same stream
+is then "discovered" by polling the full product list every `--poll-interval`.
+Both report API requests and change-to-handled latency. A last run floods a
+small queue under Bling's 3 req/s limit: the receiver answers 503 with
+Retry-After, the sender redelivers, and every event is still handled once.
+
+    python benchmarks/bench_webhooks.py --products 5000 --changes-per-second 10
+    python benchmarks/bench_webhooks.py --queue redis
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import statistics
+import threading
+import time
+import uuid
+
+import _common
+import requests
+from config import ConfigSingleton
+from fake_bling_server import FakeBlingState, start_fake_server
+from modules import storage
+from modules.bling import BlingApiTokenHandler, TokenStorage
+from modules.pagination import BlingPaginator
+from modules.session import BlingSession
+from modules.webhooks import (SIGNATURE_HEADER, MemoryEventQueue, RedisEventQueue, WebhookProcessor,
+                              WebhookReceiver)
+
+
+def change_stream(duration: float, rate: float, products: int, seed: int = 11):
+    """`(at, body)` deliveries: product changes at `rate`/s, 5% delivered twice."""
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, products + 1)]
+    deliveries, at = [], 0.0
+    while at < duration:
+        at += rng.expovariate(rate)
+        product_id = rng.choices(range(1, products + 1), weights)[0]
+        body = json.dumps({'eventId': str(uuid.UUID(int=rng.getrandbits(128))),
+                           'date': time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                           'version': 'v1',
+                           'event': 'product.updated',
+                           'companyId': 'bench-company',
+                           'data': {'id': product_id}}).encode('utf-8')
+        deliveries.append((at, body))
+        if rng.random() < 0.05:
+            deliveries.append((at + 0.05, body))
+    return sorted(deliveries)
+
+
+class Sender:
+    """Posts signed deliveries on schedule, redelivering 503s after their Retry-After like Bling."""
+
+    def __init__(self, url: str, secret: str):
+        self.url = url
+        self.secret = secret.encode('utf-8')
+        self.http = requests.Session()
+        self.sent_at = {}
+        self.rejected = 0
+
+    def post(self, body: bytes) -> requests.Response:
+        signature = 'sha256=' + hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        return self.http.post(self.url, data=body, headers={SIGNATURE_HEADER: signature,
+                                                            'Content-Type': 'application/json'})
+
+    def run(self, deliveries, started: float):
+        pending = list(deliveries)
+        while pending:
+            at, body = pending.pop(0)
+            delay = started + at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            event_id = json.loads(body)['eventId']
+            self.sent_at.setdefault(event_id, time.perf_counter())
+            response = self.post(body)
+            if response.status_code == 503:
+                self.rejected += 1
+                retry_at = time.perf_counter() - started + float(response.headers['Retry-After'])
+                pending.append((retry_at, body))
+                pending.sort(key=lambda item: item[0])
+            else:
+                assert response.status_code == 200, response.text
+
+
+def run_webhooks(label, state, api_url, queue, deliveries, batch_size, workers):
+    handled = {}
+    lock = threading.Lock()
+
+    def handler(records):
+        now = time.perf_counter()
+        for event, record in records:
+            assert record is not None and str(record['id']) == event.record_id
+            with lock:
+                handled[event.event_id] = now
+
+    processor = WebhookProcessor(handler, queue=queue, session=BlingSession(base_url=api_url),
+                                 workers=workers, batch_size=batch_size).start()
+    receiver = WebhookReceiver(queue, port=0).start()
+    sender = Sender(f'http://127.0.0.1:{receiver.port}{receiver.path}', receiver.secret)
+
+    requests_before = state.api_requests
+    started = time.perf_counter()
+    sender.run(deliveries, started)
+    while len(queue):
+        time.sleep(0.01)
+    time.sleep(0.2)
+    receiver.stop()
+    processor.stop()
+
+    records = {json.loads(body)['data']['id'] for _, body in deliveries}
+    latencies = sorted(handled[event_id] - sender.sent_at[event_id] for event_id in handled)
+    fetches = state.api_requests - requests_before
+    assert len({json.loads(body)['data']['id'] for _, body in deliveries}) <= fetches <= len(deliveries)
+    print(f'{label:<22} deliveries {len(deliveries):5}  changed products {len(records):4}  '
+          f'API requests {fetches:5}  latency p50 {statistics.median(latencies) * 1e3:7.1f} ms  '
+          f'p99 {latencies[int(len(latencies) * 0.99)] * 1e3:7.1f} ms  503s {sender.rejected}')
+    return fetches
+
+
+def run_polling(state, api_url, deliveries, interval: float):
+    session = BlingSession(base_url=api_url)
+    requests_before = state.api_requests
+    started = time.perf_counter()
+    duration = deliveries[-1][0]
+    polled_at = []
+    while time.perf_counter() - started < duration + interval:
+        poll_started = time.perf_counter()
+        for _ in BlingPaginator(session, '/produtos', limit=100):
+            pass
+        polled_at.append(time.perf_counter() - started)
+        time.sleep(max(0.0, interval - (time.perf_counter() - poll_started)))
+
+    latencies = sorted(next(moment for moment in polled_at if moment >= at) - at
+                       for at, _ in deliveries if at <= polled_at[-1])
+    fetches = state.api_requests - requests_before
+    print(f'{"polling every " + format(interval, "g") + " s":<22} deliveries {len(deliveries):5}  '
+          f'{"":21}API requests {fetches:5}  latency p50 {statistics.median(latencies) * 1e3:7.1f} ms  '
+          f'p99 {latencies[int(len(latencies) * 0.99)] * 1e3:7.1f} ms')
+    return fetches
+
+
+def make_queue(kind: str, maxsize: int):
+    if kind == 'redis':
+        return RedisEventQueue(maxsize=maxsize, key=f'bench:webhooks:{uuid.uuid4().hex}')
+    return MemoryEventQueue(maxsize=maxsize)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--changes-per-second', type=float, default=10)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--api-latency', type=float, default=0.01)
+    parser.add_argument('--queue', choices=['memory', 'redis'], default='memory')
+    args = parser.parse_args()
+
+    _common.use_temp_base_dir()
+    storage.set_storage_backend('json')
+    if args.queue == 'redis':
+        print(f'queue: redis ({_common.use_redis_backend()})')
+        storage.set_storage_backend('json')
+    ConfigSingleton.RATE_LIMIT_PER_SECOND = 1000.0
+    ConfigSingleton.RATE_LIMIT_BURST = 1000
+
+    state = FakeBlingState(api_latency=args.api_latency)
+    state.resources['produtos'] = [{'id': product_id, 'nome': f'Produto {product_id}'}
+                                   for product_id in range(1, args.products + 1)]
+    _, base_url = start_fake_server(state)
+    BlingApiTokenHandler.AUTH_URL = f'{base_url}/Api/v3/oauth/token'
+    TokenStorage.save_token('refresh_token', state.refresh_token)
+    api_url = f'{base_url}/Api/v3'
+
+    deliveries = change_stream(args.duration, args.changes_per_second, args.products)
+    webhook_requests = run_webhooks('webhooks', state, api_url, make_queue(args.queue, 10000),
+                                    deliveries, batch_size=50, workers=2)
+    polling_requests = run_polling(state, api_url, deliveries, args.poll_interval)
+    print(f'API requests, polling / webhooks: {polling_requests / webhook_requests:.1f}x')
+
+    # Back-pressure: Bling's 3 req/s against a burst of 45 distinct changes and a 15-event queue.
+    ConfigSingleton.RATE_LIMIT_PER_SECOND = 3.0
+    ConfigSingleton.RATE_LIMIT_BURST = 3
+    ConfigSingleton.WEBHOOK_RETRY_AFTER = 1
+    from modules import rate_limit
+    rate_limit._limiters.clear()
+    burst = [(0.0, json.dumps({'eventId': f'burst-{product_id}', 'event': 'product.updated',
+                               'companyId': 'bench-company', 'data': {'id': product_id}}).encode('utf-8'))
+             for product_id in range(1, 46)]
+    run_webhooks('burst at 3 req/s', state, api_url, make_queue(args.queue, 15), burst,
+                 batch_size=10, workers=2)
+
+
+if __name__ == '__main__':
+    main()
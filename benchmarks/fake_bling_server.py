@@ -0,0 +1,224 @@
+"""
+A local stand-in for Bling's `/Api/v3/oauth/token` endpoint and list endpoints.
+
+Refresh tokens are single use and rotated on every successful refresh, like
+Bling does, so a replayed refresh token fails with `invalid_grant`. Several
+accounts can be served at once: every issued refresh token stays valid until used.
+List endpoints registered in `FakeBlingState.resources` are paginated with
+`pagina`/`limite` like the real API, and `GET <resource>/<id>` returns one
+record. Writes are counted in `api_writes`, and `error_every` makes every
+n-th API call fail with `error_status`, and `token_error_status` makes the
+token endpoint fail (an auth outage), or only every n-th token request with
+`token_error_every`; `retry_after` adds that header to the injected errors.
+`token_drop_every` applies every n-th grant but drops the connection before
+answering (a lost response), and a replayed refresh token is counted in
+`replayed_grants`. With `etags`, list pages carry an ETag and a matching
+`If-None-Match` gets a 304 (counted in `not_modified`).
+"""
+import hashlib
+import json
+import secrets
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeBlingState:
+    """Mutable server state shared by the request handlers."""
+
+    def __init__(self, refresh_token: str = 'initial-refresh-token',
+                 expires_in: int = 3600,
+                 latency: float = 0.0,
+                 api_latency: float = 0.0,
+                 error_every: int = 0,
+                 error_status: int = 503,
+                 token_error_status: int = None,
+                 token_error_every: int = 0,
+                 etags: bool = False,
+                 retry_after: float = None,
+                 token_drop_every: int = 0):
+        self.refresh_token = refresh_token
+        self.valid_refresh_tokens = {refresh_token}
+        self.valid_access_tokens = set()
+        self.api_requests = 0
+        self.expires_in = expires_in
+        self.latency = latency
+        self.api_latency = api_latency
+        self.resources = {}
+        self.api_writes = 0
+        self.api_errors = 0
+        self.error_every = error_every
+        self.error_status = error_status
+        self.token_error_status = token_error_status
+        self.token_error_every = token_error_every
+        self.etags = etags
+        self.retry_after = retry_after
+        self.token_drop_every = token_drop_every
+        self.used_refresh_tokens = set()
+        self.replayed_grants = 0
+        self.dropped_posts = 0
+        self.not_modified = 0
+        self.token_posts = 0
+        self.failed_posts = 0
+        self.lock = threading.Lock()
+
+    def issue_refresh_token(self) -> str:
+        self.refresh_token = secrets.token_hex(16)
+        self.valid_refresh_tokens.add(self.refresh_token)
+        return self.refresh_token
+
+    def issue_access_token(self) -> str:
+        access_token = secrets.token_hex(16)
+        self.valid_access_tokens.add(access_token)
+        return access_token
+
+    def issue_tokens(self) -> dict:
+        self.issue_refresh_token()
+        return {
+            'access_token': self.issue_access_token(),
+            'expires_in': self.expires_in,
+            'token_type': 'Bearer',
+            'scope': '',
+            'refresh_token': self.refresh_token,
+        }
+
+
+class FakeBlingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = -1
+    state: FakeBlingState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, etag: bool = False):
+        payload = json.dumps(body).encode('utf-8')
+        retry_after = self.state.retry_after if status in (429, 503) else None
+        tag = f'"{hashlib.sha1(payload).hexdigest()}"' if etag else None
+        if tag and self.headers.get('If-None-Match') == tag:
+            with self.state.lock:
+                self.state.not_modified += 1
+            status, payload = 304, b''
+        self.send_response(status)
+        if tag:
+            self.send_header('ETag', tag)
+        if retry_after is not None:
+            self.send_header('Retry-After', f'{retry_after:g}')
+        if status != 304:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length)
+
+    def _authorized(self) -> bool:
+        authorization = self.headers.get('Authorization', '')
+        token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else None
+        with self.state.lock:
+            self.state.api_requests += 1
+            return token in self.state.valid_access_tokens
+
+    def _handle_api(self, method: str):
+        self._read_body()
+        if not self._authorized():
+            self._send_json(401, {'error': {'type': 'invalid_token'}})
+            return
+        if self.state.api_latency:
+            time.sleep(self.state.api_latency)
+
+        with self.state.lock:
+            inject_error = self.state.error_every and self.state.api_requests % self.state.error_every == 0
+            if inject_error:
+                self.state.api_errors += 1
+            elif method != 'GET':
+                self.state.api_writes += 1
+        if inject_error:
+            self._send_json(self.state.error_status, {'error': {'type': 'TOO_MANY_REQUESTS'}})
+            return
+
+        url = urlsplit(self.path)
+        resource_path = url.path[len('/Api/v3/'):].strip('/')
+        resource = self.state.resources.get(resource_path)
+        parent, _, record_id = resource_path.rpartition('/')
+        if method == 'GET' and resource is None and parent in self.state.resources and record_id.isdigit():
+            record = next((record for record in self.state.resources[parent]
+                           if str(record.get('id')) == record_id), None)
+            if record is None:
+                self._send_json(404, {'error': {'type': 'RESOURCE_NOT_FOUND'}})
+            else:
+                self._send_json(200, {'data': record})
+            return
+        if method != 'GET' or resource is None:
+            self._send_json(200, {'data': []})
+            return
+
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        page = max(1, int(query.get('pagina', 1)))
+        limit = min(100, max(1, int(query.get('limite', 100))))
+        start = (page - 1) * limit
+        self._send_json(200, {'data': resource[start:start + limit]}, etag=self.state.etags)
+
+    def do_GET(self):
+        self._handle_api('GET')
+
+    def do_PUT(self):
+        self._handle_api('PUT')
+
+    def do_PATCH(self):
+        self._handle_api('PATCH')
+
+    def do_DELETE(self):
+        self._handle_api('DELETE')
+
+    def do_POST(self):
+        if self.path != '/Api/v3/oauth/token':
+            self._handle_api('POST')
+            return
+
+        form = {key: values[0] for key, values in parse_qs(self._read_body().decode()).items()}
+
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        with self.state.lock:
+            self.state.token_posts += 1
+            grant_type = form.get('grant_type')
+            intermittent = self.state.token_error_every and self.state.token_posts % self.state.token_error_every == 0
+            if self.state.token_error_status or intermittent:
+                self.state.failed_posts += 1
+                status, body = self.state.token_error_status or 503, {'error': 'temporarily_unavailable'}
+            elif grant_type == 'refresh_token' and form.get('refresh_token') in self.state.valid_refresh_tokens:
+                self.state.valid_refresh_tokens.discard(form['refresh_token'])
+                self.state.used_refresh_tokens.add(form['refresh_token'])
+                status, body = 200, self.state.issue_tokens()
+            elif grant_type == 'authorization_code' and form.get('code'):
+                status, body = 200, self.state.issue_tokens()
+            else:
+                self.state.failed_posts += 1
+                self.state.replayed_grants += form.get('refresh_token') in self.state.used_refresh_tokens
+                status, body = 400, {'error': 'invalid_grant'}
+            drop = (status == 200 and self.state.token_drop_every
+                    and self.state.token_posts % self.state.token_drop_every == 0)
+            if drop:
+                self.state.dropped_posts += 1
+
+        if drop:
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self._send_json(status, body)
+
+
+def start_fake_server(state: FakeBlingState, port: int = 0):
+    """Start the fake server on a daemon thread and return `(server, base_url)`."""
+    handler = type('BoundFakeBlingHandler', (FakeBlingHandler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
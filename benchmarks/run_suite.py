@@ -0,0 +1,381 @@
+"""
+Reproducible benchmark suite for the token lifecycle, offline against the local
+fake Bling server (token rotation, error and latency injection).
+
+Scenarios:
+    storage_reads   TokenStorage reads and expiry checks per second, JSON, SQLite, memory and Redis.
+    steady_state    Cached `get_valid_access_token` throughput with 1 and N threads.
+    cold_start      Fresh interpreter: import time and time to the first token.
+    expiry_storm    N threads hit an expired token at once: latency and token POSTs.
+    refresh_errors  Sequential refreshes with every k-th token request failing.
+    multi_process   Expiry storm across P forked processes (JSON, or a real Redis).
+
+Results are written as JSON (one file per run, named after the git commit) and
+two runs can be compared:
+
+    python benchmarks/run_suite.py
+    python benchmarks/run_suite.py --scenarios storage_reads expiry_storm --output new.json
+    python benchmarks/run_suite.py --compare benchmarks/results/old.json new.json
+
+Redis scenarios use the server from `.env` when reachable, otherwise fakeredis,
+and are skipped when neither is available.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import _common
+from config import ConfigSingleton
+from fake_bling_server import FakeBlingState, start_fake_server
+from modules import bling, storage
+from modules.bling import BlingApiError, BlingApiTokenHandler, TokenStorage
+from modules.token_cache import token_cache
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+SCENARIOS = ['storage_reads', 'steady_state', 'cold_start',
+             'expiry_storm', 'refresh_errors', 'multi_process']
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def latency_summary(latencies) -> dict:
+    return {
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies) * 1000,
+    }
+
+
+class Bench:
+    """Holds the fake server and the options shared by the scenarios."""
+
+    def __init__(self, args):
+        self.args = args
+        self.base_dir = _common.use_temp_base_dir()
+        ConfigSingleton.RATE_LIMIT_ENABLED = False
+        ConfigSingleton.CIRCUIT_BREAKER_ENABLED = False
+        self.state = FakeBlingState(latency=args.latency)
+        _, self.base_url = start_fake_server(self.state)
+        BlingApiTokenHandler.AUTH_URL = f'{self.base_url}/Api/v3/oauth/token'
+        self.redis_backend = None
+
+    def use_backend(self, backend: str) -> bool:
+        token_cache.invalidate()
+        if backend != 'redis':
+            storage.set_storage_backend(backend)
+            return True
+        if self.redis_backend is None:
+            try:
+                self.redis_backend = _common.use_redis_backend()
+            except ModuleNotFoundError:
+                self.redis_backend = ''
+        storage.set_storage_backend('redis' if self.redis_backend else 'json')
+        return bool(self.redis_backend)
+
+    def authorize(self, expired: bool = False):
+        """Store a fresh refresh token and an access token that is valid or an hour past expiry."""
+        now = int(time.time())
+        obtained_at = now - 7200 if expired else now
+        TokenStorage.save_tokens([('access_token', 'bench-access-token', 3600),
+                                  ('refresh_token', self.state.issue_refresh_token(), None)],
+                                 obtained_at=obtained_at)
+        token_cache.invalidate()
+
+    def storm(self, threads: int):
+        """Release `threads` callers at once on an expired token; return latencies, POSTs and errors."""
+        self.authorize(expired=True)
+        token_storage, token_handler = TokenStorage(), BlingApiTokenHandler()
+        latencies, errors = [], []
+        barrier = threading.Barrier(threads)
+        posts_before = self.state.token_posts
+
+        def call():
+            barrier.wait()
+            started = time.perf_counter()
+            try:
+                bling.get_valid_access_token(token_storage, token_handler)
+            except (BlingApiError, TimeoutError) as exc:
+                errors.append(repr(exc))
+            latencies.append(time.perf_counter() - started)
+
+        pool = [threading.Thread(target=call) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return latencies, self.state.token_posts - posts_before, errors
+
+    # Scenarios
+
+    def storage_reads(self) -> dict:
+        results = {}
+        for backend in ('json', 'sqlite', 'memory', 'redis'):
+            if not self.use_backend(backend):
+                results[backend] = {'skipped': 'redis and fakeredis unavailable'}
+                continue
+            self.authorize()
+            token_storage, token_handler = TokenStorage(), BlingApiTokenHandler()
+            duration = self.args.duration
+
+            ConfigSingleton.ACCESS_TOKEN_CACHE_ENABLED = False
+            uncached = _common.ops_per_second(
+                lambda: bling.get_valid_access_token(token_storage, token_handler), duration)
+            ConfigSingleton.ACCESS_TOKEN_CACHE_ENABLED = True
+
+            results[backend] = {
+                'backend': self.redis_backend if backend == 'redis' else backend,
+                'retrieve_token_by_key_ops': _common.ops_per_second(
+                    lambda: TokenStorage.retrieve_token_by_key('access_token'), duration),
+                'is_token_expired_ops': _common.ops_per_second(
+                    lambda: TokenStorage.is_token_expired('access_token'), duration),
+                'retrieve_token_record_ops': _common.ops_per_second(
+                    lambda: TokenStorage.retrieve_token_record('access_token'), duration),
+                'get_valid_access_token_uncached_ops': uncached,
+            }
+        self.use_backend('json')
+        return results
+
+    def steady_state(self) -> dict:
+        self.use_backend('json')
+        self.authorize()
+        token_storage, token_handler = TokenStorage(), BlingApiTokenHandler()
+        results = {}
+
+        for threads in sorted({1, self.args.threads}):
+            calls = [0] * threads
+            deadline = time.perf_counter() + self.args.duration
+
+            def worker(index: int):
+                count = 0
+                while time.perf_counter() < deadline:
+                    for _ in range(100):
+                        bling.get_valid_access_token(token_storage, token_handler)
+                    count += 100
+                calls[index] = count
+
+            started = time.perf_counter()
+            pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+            results[f'threads_{threads}_ops'] = sum(calls) / (time.perf_counter() - started)
+        return results
+
+    def cold_start(self) -> dict:
+        self.use_backend('json')
+        snippet = (
+            'import json, sys, time\n'
+            'started = time.perf_counter()\n'
+            f'sys.path.insert(0, {str(_common.APP_DIR)!r})\n'
+            'from config import ConfigSingleton\n'
+            'from modules import bling\n'
+            'imported = time.perf_counter()\n'
+            'from pathlib import Path\n'
+            f'ConfigSingleton.BASE_DIR = Path({self.base_dir!r})\n'
+            'ConfigSingleton.RATE_LIMIT_ENABLED = False\n'
+            f'bling.BlingApiTokenHandler.AUTH_URL = {BlingApiTokenHandler.AUTH_URL!r}\n'
+            'bling.get_valid_access_token(bling.TokenStorage(), bling.BlingApiTokenHandler())\n'
+            'print(json.dumps({"import_ms": (imported - started) * 1000,'
+            ' "first_token_ms": (time.perf_counter() - imported) * 1000}))\n'
+        )
+        env = {**os.environ, 'TOKENS_STORAGE_METHOD': 'json'}
+        samples = []
+        for _ in range(self.args.repeat):
+            self.authorize(expired=True)
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', snippet], env=env, check=True,
+                                    capture_output=True, text=True).stdout
+            sample = json.loads(output.strip().splitlines()[-1])
+            sample['process_ms'] = (time.perf_counter() - started) * 1000
+            samples.append(sample)
+        return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+    def expiry_storm(self) -> dict:
+        results = {}
+        for backend in ('json', 'sqlite', 'memory', 'redis'):
+            if not self.use_backend(backend):
+                results[backend] = {'skipped': 'redis and fakeredis unavailable'}
+                continue
+            latencies, posts, errors = [], [], 0
+            for _ in range(self.args.repeat):
+                round_latencies, round_posts, round_errors = self.storm(self.args.threads)
+                latencies += round_latencies
+                posts.append(round_posts)
+                errors += len(round_errors)
+            results[backend] = {**latency_summary(latencies),
+                                'token_posts_per_storm': max(posts),
+                                'errors': errors}
+        self.use_backend('json')
+        return results
+
+    def refresh_errors(self) -> dict:
+        self.use_backend('json')
+        self.authorize()
+        token_storage, token_handler = TokenStorage(), BlingApiTokenHandler()
+        self.state.token_error_every = self.args.error_every
+        latencies, failures = [], 0
+        try:
+            for _ in range(self.args.refreshes):
+                started = time.perf_counter()
+                try:
+                    bling.refresh_access_token(token_storage, token_handler, valid_until=time.time() + 86400)
+                except BlingApiError:
+                    failures += 1
+                latencies.append(time.perf_counter() - started)
+            refresh_token_survived = token_storage.retrieve_token_by_key('refresh_token') in \
+                self.state.valid_refresh_tokens
+        finally:
+            self.state.token_error_every = 0
+        return {**latency_summary(latencies),
+                'refreshes': len(latencies),
+                'failures': failures,
+                'refresh_token_survived': refresh_token_survived}
+
+    def multi_process(self) -> dict:
+        backend = 'json'
+        if self.redis_backend and self.redis_backend != 'fakeredis':
+            backend = 'redis'
+        self.use_backend(backend)
+        context = multiprocessing.get_context('fork')
+        rounds = []
+
+        for _ in range(self.args.repeat):
+            self.authorize(expired=True)
+            posts_before = self.state.token_posts
+            results = context.Queue()
+            start_at = time.time() + 0.5
+            processes = [context.Process(target=_storm_process,
+                                         args=(self.args.threads, start_at, results))
+                         for _ in range(self.args.processes)]
+            for process in processes:
+                process.start()
+            outcomes = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            rounds.append((outcomes, self.state.token_posts - posts_before))
+
+        latencies = [latency for outcomes, _ in rounds for latency_list, _ in outcomes for latency in latency_list]
+        return {'backend': backend,
+                'processes': self.args.processes,
+                'threads_per_process': self.args.threads,
+                **latency_summary(latencies),
+                'token_posts_per_storm': max(posts for _, posts in rounds),
+                'errors': sum(errors for outcomes, _ in rounds for _, errors in outcomes)}
+
+
+def _storm_process(threads: int, start_at: float, results):
+    token_cache.invalidate()
+    token_storage, token_handler = TokenStorage(), BlingApiTokenHandler()
+    latencies, errors = [], []
+
+    def call():
+        time.sleep(max(0.0, start_at - time.time()))
+        started = time.perf_counter()
+        try:
+            bling.get_valid_access_token(token_storage, token_handler)
+        except (BlingApiError, TimeoutError):
+            errors.append(1)
+        latencies.append(time.perf_counter() - started)
+
+    pool = [threading.Thread(target=call) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put((latencies, len(errors)))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], check=True,
+                              capture_output=True, text=True,
+                              cwd=_common.APP_DIR.parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def flatten(results: dict, prefix: str = '') -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path, encoding='utf-8') as file:
+        old = json.load(file)
+    with open(new_path, encoding='utf-8') as file:
+        new = json.load(file)
+
+    old_flat, new_flat = flatten(old['scenarios']), flatten(new['scenarios'])
+    print(f'{"metric":<60} {old["commit"]:>14} {new["commit"]:>14} {"change":>9}')
+    for name in sorted(set(old_flat) | set(new_flat)):
+        before, after = old_flat.get(name), new_flat.get(name)
+        change = f'{(after - before) / before * 100:+.1f}%' if before and after is not None else ''
+        print(f'{name:<60} {_format(before):>14} {_format(after):>14} {change:>9}')
+
+
+def _format(value) -> str:
+    return '-' if value is None else f'{value:.6g}'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--duration', type=float, default=1.0, help='seconds per throughput measurement')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05, help='token endpoint latency in seconds')
+    parser.add_argument('--error-every', type=int, default=3)
+    parser.add_argument('--refreshes', type=int, default=30)
+    parser.add_argument('--output', help='results file, benchmarks/results/<commit>.json by default')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    bench = Bench(args)
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'scenarios': {},
+    }
+
+    for name in args.scenarios:
+        started = time.perf_counter()
+        report['scenarios'][name] = getattr(bench, name)()
+        print(f'{name:<15} {time.perf_counter() - started:6.1f} s  {json.dumps(report["scenarios"][name])}')
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f'{commit}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + '\n', encoding='utf-8')
+    print(f'results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Stress the single-flight refresh: N threads in each of M processes call
+`get_valid_access_token` on an expired token at the same moment, for several
+rounds, and the fake token endpoint must see exactly one POST per expiry.
+
+    python benchmarks/stress_single_flight.py --threads 16 --processes 4 --rounds 5
+"""
+import argparse
+import multiprocessing
+import sys
+import threading
+import time
+
+import _common
+from fake_bling_server import FakeBlingState, start_fake_server
+from modules import bling, storage
+from modules.bling import BlingApiTokenHandler, TokenStorage
+from modules.token_cache import token_cache
+
+
+def worker(threads: int, start_at: float, results):
+    token_cache.invalidate()
+    token_storage = TokenStorage()
+    token_handler = BlingApiTokenHandler()
+    tokens, errors = [], []
+
+    def call():
+        time.sleep(max(0.0, start_at - time.time()))
+        try:
+            tokens.append(bling.get_valid_access_token(token_storage, token_handler))
+        except Exception as exc:  # noqa: BLE001 - reported below
+            errors.append(repr(exc))
+
+    pool = [threading.Thread(target=call) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put((sorted(set(tokens)), errors))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--storage', choices=['json', 'redis', 'sqlite'], default='json')
+    args = parser.parse_args()
+
+    _common.use_temp_base_dir()
+    storage.set_storage_backend(args.storage)
+
+    state = FakeBlingState(latency=args.latency)
+    _, base_url = start_fake_server(state)
+    BlingApiTokenHandler.AUTH_URL = f'{base_url}/Api/v3/oauth/token'
+    TokenStorage.save_token('refresh_token', state.refresh_token)
+
+    context = multiprocessing.get_context('fork')
+    failures = 0
+    for round_number in range(1, args.rounds + 1):
+        # Force an expiry: the stored access token is an hour old.
+        TokenStorage.save_token('access_token', 'expired-access-token', 3600, int(time.time()) - 3600)
+        posts_before = state.token_posts
+
+        results = context.Queue()
+        start_at = time.time() + 0.5
+        processes = [context.Process(target=worker, args=(args.threads, start_at, results))
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        posts = state.token_posts - posts_before
+        tokens = {token for process_tokens, _ in outcomes for token in process_tokens}
+        errors = [error for _, process_errors in outcomes for error in process_errors]
+        ok = posts == 1 and len(tokens) == 1 and not errors
+        failures += not ok
+        print(f'round {round_number}: posts={posts} distinct_tokens={len(tokens)} '
+              f'errors={len(errors)} {"OK" if ok else "FAIL"}')
+        for error in errors[:3]:
+            print(f'  {error}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
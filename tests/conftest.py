@@ -0,0 +1,62 @@
+"""
+Fixtures for the tests: the app modules and the offline fake Bling server from
+`benchmarks/`, with a throwaway credentials folder per test, and an in-process
+fakeredis server for the Redis code paths.
+
+    python -m pytest tests
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent.parent / 'benchmarks'
+if str(BENCHMARKS_DIR) not in sys.path:
+    sys.path.insert(0, str(BENCHMARKS_DIR))
+
+import _common  # noqa: E402  (puts app/ on sys.path and sets fake client credentials)
+from config import ConfigSingleton  # noqa: E402
+from fake_bling_server import FakeBlingState, start_fake_server  # noqa: E402
+from modules import rate_limit, storage  # noqa: E402
+from modules.bling import BlingApiTokenHandler, TokenStorage  # noqa: E402
+from modules.token_cache import token_cache  # noqa: E402
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Point the Redis client at a fresh in-process fakeredis server, with rotation events off."""
+    fakeredis = pytest.importorskip('fakeredis')
+    import redis
+    from modules import redis_client
+
+    connection_class = getattr(fakeredis, 'FakeRedisConnection', fakeredis.FakeConnection)
+    pool = redis.ConnectionPool(connection_class=connection_class, server=fakeredis.FakeServer())
+    monkeypatch.setattr(ConfigSingleton, 'REDIS_TOKEN_EVENTS_ENABLED', False)
+    monkeypatch.setattr(redis_client, '_pool', pool)
+    monkeypatch.setattr(redis_client, '_client', redis.Redis(connection_pool=pool))
+    monkeypatch.setattr(redis_client, '_pool_pid', os.getpid())
+    return redis_client._client
+
+
+@pytest.fixture
+def fake_bling(tmp_path, monkeypatch):
+    """A running fake Bling server with a stored refresh token; yields `(state, api_url)`."""
+    monkeypatch.setattr(ConfigSingleton, 'BASE_DIR', tmp_path)
+    monkeypatch.setattr(ConfigSingleton, 'RATE_LIMIT_PER_SECOND', 1000.0)
+    monkeypatch.setattr(ConfigSingleton, 'RATE_LIMIT_BURST', 1000)
+    monkeypatch.setattr(ConfigSingleton, 'RETRY_BASE_DELAY', 0.01)
+    monkeypatch.setattr(rate_limit, '_limiters', {})
+    storage.set_storage_backend('json')
+    token_cache.invalidate()
+
+    state = FakeBlingState()
+    server, base_url = start_fake_server(state)
+    monkeypatch.setattr(BlingApiTokenHandler, 'AUTH_URL', f'{base_url}/Api/v3/oauth/token')
+    TokenStorage.save_token('refresh_token', state.refresh_token)
+    try:
+        yield state, f'{base_url}/Api/v3'
+    finally:
+        server.shutdown()
+        server.server_close()
+        token_cache.invalidate()
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from modules.batch import AsyncBatchWriter, BatchWriter, BlingOperation, _merge, chains, coalesce
+from modules.locks import LockTimeout
+
+
+class Response:
+    status_code = 200
+    content = b''
+    text = ''
+
+
+class StubSession:
+    """Answers 200 to every write, except that `/produtos/2` cannot get a token."""
+
+    timeout = 5.0
+
+    def __init__(self):
+        self.sent = []
+
+    def request(self, method, path, **kwargs):
+        self.sent.append((method, path, kwargs.get('json')))
+        if path == '/produtos/2':
+            raise LockTimeout('refresh lock busy')
+        return Response()
+
+
+class AsyncStubSession(StubSession):
+    async def request(self, method, path, **kwargs):
+        return StubSession.request(self, method, path, **kwargs)
+
+
+OPERATIONS = [BlingOperation('PUT', f'/produtos/{product_id}', json={'id': product_id})
+              for product_id in (1, 2, 3)]
+
+
+def test_an_operation_error_does_not_abort_the_batch():
+    results = BatchWriter(StubSession(), workers=2, max_retries=0).run(OPERATIONS)
+    assert [result.ok for result in results] == [True, False, True]
+    assert isinstance(results[1].error, LockTimeout)
+
+
+def test_an_operation_error_does_not_abort_the_async_batch():
+    results = asyncio.run(AsyncBatchWriter(AsyncStubSession(), workers=2, max_retries=0).run(OPERATIONS))
+    assert [result.ok for result in results] == [True, False, True]
+    assert isinstance(results[1].error, LockTimeout)
+
+
+def test_coalesces_writes_to_one_entity():
+    operations = [BlingOperation('PUT', '/produtos/1', json={'nome': 'a', 'preco': 1}),
+                  BlingOperation('PATCH', '/produtos/1', json={'preco': 2}),
+                  BlingOperation('PATCH', '/produtos/2', json={'preco': 3}),
+                  BlingOperation('PATCH', '/produtos/1', json={'estoque': 4})]
+    unique, index = coalesce(operations)
+    assert unique == [BlingOperation('PUT', '/produtos/1', json={'nome': 'a', 'preco': 2, 'estoque': 4}),
+                      BlingOperation('PATCH', '/produtos/2', json={'preco': 3})]
+    assert index == [0, 0, 1, 0]
+
+
+@pytest.mark.parametrize('first, second, merged', [
+    (('PATCH', {'a': 1}), ('PUT', {'b': 2}), ('PUT', {'b': 2})),
+    (('PUT', {'a': 1}), ('DELETE', None), ('DELETE', None)),
+    (('PATCH', {'a': 1}), ('PATCH', {'a': 2, 'b': 3}), ('PATCH', {'a': 2, 'b': 3})),
+    (('DELETE', None), ('PUT', {'a': 1}), None),
+    (('PUT', ['not', 'a', 'dict']), ('PATCH', {'a': 1}), None),
+    (('POST', {'a': 1}), ('PATCH', {'a': 2}), None),
+])
+def test_merge(first, second, merged):
+    previous = BlingOperation(first[0], '/produtos/1', json=first[1])
+    operation = BlingOperation(second[0], '/produtos/1', json=second[1])
+    result = _merge(previous, operation)
+    if merged is None:
+        assert result is None
+    else:
+        assert (result.method, result.json) == merged
+
+
+def test_keyed_posts_keep_the_last_and_plain_posts_are_all_sent():
+    operations = [BlingOperation('POST', '/pedidos', json={'n': 1}, key='pedido-1'),
+                  BlingOperation('POST', '/pedidos', json={'n': 2}, key='pedido-1'),
+                  BlingOperation('POST', '/pedidos', json={'n': 3}),
+                  BlingOperation('POST', '/pedidos', json={'n': 4})]
+    unique, index = coalesce(operations)
+    assert [operation.json for operation in unique] == [{'n': 2}, {'n': 3}, {'n': 4}]
+    assert index == [0, 0, 1, 2]
+
+
+def test_unmergeable_writes_are_sent_in_order_on_one_chain():
+    operations = [BlingOperation('DELETE', '/produtos/1'),
+                  BlingOperation('PUT', '/produtos/1', json={'nome': 'novo'}),
+                  BlingOperation('PUT', '/produtos/3', json={'nome': 'outro'})]
+    unique, _ = coalesce(operations)
+    assert chains(unique) == [[0, 1], [2]]
+
+    session = StubSession()
+    results = BatchWriter(session, workers=4, max_retries=0).run(operations)
+    assert [result.ok for result in results] == [True, True, True]
+    assert [sent for sent in session.sent if sent[1] == '/produtos/1'] == [
+        ('DELETE', '/produtos/1', None), ('PUT', '/produtos/1', {'nome': 'novo'})]
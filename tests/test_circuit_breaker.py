@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import pytest
+
+from config import ConfigSingleton
+from modules import circuit_breaker
+from modules.bling import BlingApiTokenHandler
+from modules.circuit_breaker import (CLOSED, HALF_OPEN, OPEN, AdaptiveTimeout, CircuitBreaker, CircuitOpenError,
+                                     get_circuit_breaker)
+
+PAYLOAD = {'grant_type': 'refresh_token', 'refresh_token': 'any'}
+
+
+@pytest.fixture
+def half_open(fake_bling, monkeypatch):
+    """The auth endpoint's breaker, due for its half-open probe; yields `(state, breaker)`."""
+    state, _ = fake_bling
+    monkeypatch.setattr(ConfigSingleton, 'CIRCUIT_BREAKER_ENABLED', True)
+    monkeypatch.setattr(ConfigSingleton, 'CIRCUIT_BREAKER_FAILURE_THRESHOLD', 1)
+    monkeypatch.setattr(ConfigSingleton, 'CIRCUIT_BREAKER_RECOVERY_TIMEOUT', 0.0)
+    monkeypatch.setattr(circuit_breaker, '_breakers', {})
+    breaker = get_circuit_breaker(BlingApiTokenHandler.AUTH_URL)
+    breaker.record_failure()
+    return state, breaker
+
+
+def test_cancelled_async_probe_lets_the_next_call_through(half_open):
+    pytest.importorskip('httpx')
+    from modules.bling_async import AsyncBlingApiTokenHandler
+
+    state, breaker = half_open
+    state.latency = 1.0
+    handler = AsyncBlingApiTokenHandler()
+
+    async def cancel_probe():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(handler._send_post(PAYLOAD, remaining=10.0), timeout=0.1)
+        await AsyncBlingApiTokenHandler.aclose()
+
+    asyncio.run(cancel_probe())
+    assert breaker.before_call() is True
+
+
+def test_interrupted_sync_probe_lets_the_next_call_through(half_open, monkeypatch):
+    from modules import bling
+
+    _, breaker = half_open
+
+    class Interrupted(BaseException):
+        pass
+
+    class Session:
+        def post(self, *args, **kwargs):
+            raise Interrupted()
+
+    monkeypatch.setattr(bling, 'get_http_session', Session)
+    with pytest.raises(Interrupted):
+        BlingApiTokenHandler()._send_post(PAYLOAD, remaining=10.0)
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def make_breaker(recovery_timeout=60.0):
+    return CircuitBreaker('test', failure_threshold=3, recovery_timeout=recovery_timeout,
+                          timeout=AdaptiveTimeout(min_timeout=1.0, max_timeout=10.0))
+
+
+def test_opens_after_consecutive_failures_only():
+    breaker = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = make_breaker(recovery_timeout=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+@pytest.mark.parametrize('succeeds, state', [(True, CLOSED), (False, OPEN)])
+def test_probe_outcome_closes_or_reopens(succeeds, state):
+    breaker = make_breaker(recovery_timeout=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    if succeeds:
+        breaker.record_success(0.1)
+    else:
+        breaker.record_failure()
+    assert breaker.state == state
+    if succeeds:
+        assert breaker.before_call() is False
+
+
+def test_adaptive_timeout_follows_the_latency_percentile():
+    timeout = AdaptiveTimeout(min_timeout=1.0, max_timeout=10.0, percentile=0.9, multiplier=3.0, window=10)
+    assert timeout.timeout() == 10.0
+    for latency in [0.5] * 9 + [2.0]:
+        timeout.observe(latency)
+    assert timeout.timeout() == 1.5
+    for _ in range(10):
+        timeout.observe(0.01)
+    assert timeout.timeout() == 1.0
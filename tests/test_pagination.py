@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from modules.bling import BlingApiError
+from modules.pagination import AsyncBlingPaginator, BlingPaginator
+from modules.session import BlingSession
+
+RECORDS = 250
+LIMIT = 20
+
+
+@pytest.fixture
+def products(fake_bling):
+    state, api_url = fake_bling
+    state.resources['produtos'] = [{'id': record_id} for record_id in range(1, RECORDS + 1)]
+    return state, api_url
+
+
+def revoke_access_tokens(state):
+    with state.lock:
+        state.valid_access_tokens.clear()
+
+
+@pytest.mark.parametrize('prefetch', [0, 3])
+def test_yields_every_record_once_in_order(products, prefetch):
+    state, api_url = products
+    records = list(BlingPaginator(BlingSession(base_url=api_url), '/produtos', limit=LIMIT, prefetch=prefetch))
+    assert [record['id'] for record in records] == list(range(1, RECORDS + 1))
+
+
+def test_refreshes_the_token_mid_stream(products):
+    state, api_url = products
+    ids = []
+    for record in BlingPaginator(BlingSession(base_url=api_url), '/produtos', limit=LIMIT, prefetch=2):
+        ids.append(record['id'])
+        if len(ids) == RECORDS // 2:
+            revoke_access_tokens(state)
+    assert ids == list(range(1, RECORDS + 1))
+    assert state.token_posts == 2
+    assert state.failed_posts == 0
+
+
+def test_resumes_from_the_checkpoint(products):
+    state, api_url = products
+    session = BlingSession(base_url=api_url)
+    checkpoints, pages = [], {}
+    for page, records in BlingPaginator(session, '/produtos', limit=LIMIT,
+                                        checkpoint=checkpoints.append).pages():
+        pages[page] = records
+        if page == 3:
+            break
+
+    # Page 3 was interrupted before the consumer moved on: it is not checkpointed.
+    assert checkpoints[-1] == 3
+    ids = [record['id'] for page in sorted(pages) if page < checkpoints[-1] for record in pages[page]]
+    ids.extend(record['id'] for record in BlingPaginator(session, '/produtos', limit=LIMIT,
+                                                         start_page=checkpoints[-1]))
+    assert ids == list(range(1, RECORDS + 1))
+
+
+def test_stops_on_an_empty_endpoint(fake_bling):
+    state, api_url = fake_bling
+    state.resources['produtos'] = []
+    assert list(BlingPaginator(BlingSession(base_url=api_url), '/produtos', limit=LIMIT)) == []
+
+
+def test_raises_on_an_error_page(products):
+    state, api_url = products
+    state.error_every, state.error_status = 1, 400
+    with pytest.raises(BlingApiError, match='page 1'):
+        list(BlingPaginator(BlingSession(base_url=api_url), '/produtos', limit=LIMIT))
+
+
+@pytest.mark.parametrize('prefetch', [0, 3])
+def test_async_yields_every_record_once_in_order(products, prefetch, monkeypatch):
+    pytest.importorskip('httpx')
+    from modules.bling_async import AsyncBlingApiTokenHandler, AsyncBlingSession
+
+    state, api_url = products
+    monkeypatch.setattr(AsyncBlingApiTokenHandler, 'AUTH_URL', f'{api_url}/oauth/token')
+
+    async def export():
+        ids = []
+        try:
+            async for record in AsyncBlingPaginator(AsyncBlingSession(base_url=api_url), '/produtos',
+                                                    limit=LIMIT, prefetch=prefetch):
+                ids.append(record['id'])
+                if len(ids) == RECORDS // 2:
+                    revoke_access_tokens(state)
+        finally:
+            await AsyncBlingApiTokenHandler.aclose()
+        return ids
+
+    assert asyncio.run(export()) == list(range(1, RECORDS + 1))
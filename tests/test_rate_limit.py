@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+
+from modules.rate_limit import (PRIORITY_BULK, PRIORITY_DEFAULT, PRIORITY_REFRESH, LocalTokenBucket,
+                                RateLimiter)
+
+
+class SlowBucket:
+    """A shared-bucket stand-in: `tokens` in total, each draw taking `latency` seconds."""
+
+    def __init__(self, tokens: int, latency: float = 0.0):
+        self.tokens = tokens
+        self.latency = latency
+        self.draws = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: int = 1) -> float:
+        time.sleep(self.latency)
+        with self._lock:
+            self.draws += 1
+            if self.tokens < tokens:
+                return 60.0
+            self.tokens -= tokens
+            return 0.0
+
+
+def test_a_cancelled_async_draw_hands_its_token_to_the_next_waiter():
+    bucket = SlowBucket(tokens=1, latency=0.2)
+    limiter = RateLimiter(bucket)
+
+    async def scenario():
+        cancelled = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.05)
+        cancelled.cancel()
+        started = time.monotonic()
+        await limiter.acquire_async(timeout=2.0)
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 1.0
+    assert bucket.tokens == 0
+
+
+def test_serves_waiters_by_priority_then_arrival():
+    limiter = RateLimiter(LocalTokenBucket(rate=10.0, capacity=1))
+    limiter.acquire()
+    order = []
+
+    def wait(name, priority):
+        limiter.acquire(priority, timeout=5.0)
+        order.append(name)
+
+    threads = []
+    for name, priority in (('bulk-1', PRIORITY_BULK), ('default', PRIORITY_DEFAULT),
+                           ('bulk-2', PRIORITY_BULK), ('refresh', PRIORITY_REFRESH)):
+        threads.append(threading.Thread(target=wait, args=(name, priority)))
+        threads[-1].start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    assert order == ['refresh', 'default', 'bulk-1', 'bulk-2']
+
+
+def test_threads_and_coroutines_share_one_queue():
+    limiter = RateLimiter(LocalTokenBucket(rate=10.0, capacity=1))
+    limiter.acquire()
+    order = []
+    bulk = threading.Thread(target=lambda: (limiter.acquire(PRIORITY_BULK, timeout=5.0), order.append('thread')))
+    bulk.start()
+    time.sleep(0.01)
+
+    async def refresh():
+        await limiter.acquire_async(PRIORITY_REFRESH, timeout=5.0)
+        order.append('coroutine')
+
+    asyncio.run(refresh())
+    bulk.join()
+    assert order == ['coroutine', 'thread']
@@ -0,0 +1,58 @@
+import pytest
+import requests
+
+from modules.bling import BlingApiError, BlingApiTokenHandler
+from modules.retry import RetryPolicy
+
+
+class Response:
+    headers = {}
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize('status, idempotent, reason', [
+    (429, False, '429'),
+    (503, False, '503'),
+    (500, False, None),
+    (502, False, None),
+    (504, False, None),
+    (502, True, '502'),
+    (400, True, None),
+    (401, False, None),
+])
+def test_classifies_responses(status, idempotent, reason):
+    assert RetryPolicy.retryable(None, Response(status), idempotent) == reason
+
+
+@pytest.mark.parametrize('error, idempotent, reason', [
+    (requests.ConnectTimeout(), False, 'connect'),
+    (requests.ReadTimeout(), False, None),
+    (requests.ReadTimeout(), True, 'network'),
+    (requests.ConnectionError(), False, None),
+    (ValueError('not a transport error'), True, None),
+])
+def test_classifies_errors(error, idempotent, reason):
+    assert RetryPolicy.retryable(error, None, idempotent) == reason
+
+
+def test_classifies_wrapped_httpx_errors():
+    httpx = pytest.importorskip('httpx')
+    request = httpx.Request('POST', 'http://bling.invalid/oauth/token')
+    for error, reason in ((httpx.ConnectError('refused', request=request), 'connect'),
+                          (httpx.ReadTimeout('slow', request=request), None)):
+        try:
+            raise BlingApiError('Bling auth request failed') from error
+        except BlingApiError as wrapped:
+            assert RetryPolicy.retryable(wrapped, None, idempotent=False) == reason
+
+
+@pytest.mark.parametrize('status, posts', [(503, 3), (429, 3), (502, 1), (500, 1)])
+def test_replays_a_refresh_grant_only_when_it_was_not_processed(fake_bling, status, posts):
+    state, _ = fake_bling
+    state.token_error_status = status
+    handler = BlingApiTokenHandler(retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01, max_delay=0.01))
+    with pytest.raises(BlingApiError):
+        handler.refresh_tokens(state.refresh_token)
+    assert state.token_posts == posts
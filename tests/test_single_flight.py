@@ -0,0 +1,41 @@
+import multiprocessing
+import time
+
+import pytest
+
+from modules import storage
+from modules.bling import TokenStorage
+from stress_single_flight import worker
+
+THREADS = 4
+PROCESSES = 2
+ROUNDS = 2
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_one_post_per_expiry_across_threads_and_processes(fake_bling, backend):
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip('needs fork')
+    state, _ = fake_bling
+    state.latency = 0.2
+    storage.set_storage_backend(backend)
+    TokenStorage.save_token('refresh_token', state.refresh_token)
+    context = multiprocessing.get_context('fork')
+
+    for _ in range(ROUNDS):
+        TokenStorage.save_token('access_token', 'expired-access-token', 3600, int(time.time()) - 3600)
+        posts_before = state.token_posts
+
+        results = context.Queue()
+        start_at = time.time() + 0.3
+        processes = [context.Process(target=worker, args=(THREADS, start_at, results))
+                     for _ in range(PROCESSES)]
+        for process in processes:
+            process.start()
+        outcomes = [results.get(timeout=30) for _ in processes]
+        for process in processes:
+            process.join()
+
+        assert [errors for _, errors in outcomes] == [[]] * PROCESSES
+        assert len({token for tokens, _ in outcomes for token in tokens}) == 1
+        assert state.token_posts - posts_before == 1
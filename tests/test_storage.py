@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from config import ConfigSingleton
+from modules import storage
+from modules.bling import TokenStorage
+from modules.token_cache import token_cache
+
+BACKENDS = ['json', 'sqlite', 'memory', 'redis']
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, tmp_path, monkeypatch):
+    """Each storage backend on a throwaway folder (or an in-process fakeredis server)."""
+    monkeypatch.setattr(ConfigSingleton, 'BASE_DIR', tmp_path)
+    monkeypatch.setattr(ConfigSingleton, 'ACCESS_TOKEN_EXPIRY_SKEW', 60)
+    if request.param == 'redis':
+        request.getfixturevalue('fake_redis')
+    storage.set_storage_backend(request.param)
+    token_cache.invalidate()
+    yield request.param
+    storage.set_storage_backend('json')
+
+
+def test_round_trip(backend):
+    now = int(time.time())
+    TokenStorage.save_tokens([('access_token', 'access', 3600),
+                              ('refresh_token', 'refresh', 86400)], obtained_at=now)
+
+    assert TokenStorage.retrieve_token_by_key('access_token') == 'access'
+    assert TokenStorage.retrieve_token_record('refresh_token') == ('refresh', 86400, now)
+    assert TokenStorage.retrieve_token_records(['access_token', 'tenant_access_token']) == {
+        'access_token': ('access', 3600, now),
+        'tenant_access_token': (None, 0, 0),
+    }
+
+
+def test_later_writes_replace_earlier_ones(backend):
+    now = int(time.time())
+    TokenStorage.save_tokens([('access_token', 'old', 3600)], obtained_at=now - 10)
+    TokenStorage.save_tokens([('access_token', 'new', 1800)], obtained_at=now)
+    assert TokenStorage.retrieve_token_record('access_token') == ('new', 1800, now)
+
+
+def test_expiry_check(backend):
+    now = int(time.time())
+    TokenStorage.save_tokens([('access_token', 'fresh', 3600),
+                              ('tenant_access_token', 'expiring', 30)], obtained_at=now)
+    assert not TokenStorage.is_token_expired('access_token')
+    assert TokenStorage.is_token_expired('tenant_access_token')
+    assert TokenStorage.is_token_expired('missing_access_token')
+
+
+def test_refresh_token_expiries_nearest_first(backend):
+    now = int(time.time())
+    TokenStorage.save_tokens([('a_refresh_token', 'a', 100),
+                              ('b_refresh_token', 'b', 50),
+                              ('refresh_token', 'default', 86400),
+                              ('b_access_token', 'not indexed', 60)], obtained_at=now)
+
+    assert TokenStorage.refresh_token_expiries(now, now + 200, 10) == [('b_refresh_token', now + 50),
+                                                                       ('a_refresh_token', now + 100)]
+    assert TokenStorage.refresh_token_expiries(now, now + 200, 1) == [('b_refresh_token', now + 50)]
+    assert TokenStorage.refresh_token_expiries(now + 60, now + 86400, 10) == [('a_refresh_token', now + 100),
+                                                                            ('refresh_token', now + 86400)]
+
+
+@pytest.mark.parametrize('backend', ['sqlite'], indirect=True)
+def test_sqlite_expiry_index_matches_the_suffix_literally(backend):
+    now = int(time.time())
+    connection = storage.get_storage_backend().connection()
+    connection.execute("INSERT INTO tokens VALUES ('refreshXtoken', 'x', 50, ?)", (now,))
+    connection.commit()
+    assert TokenStorage.refresh_token_expiries(now, now + 200, 10) == []
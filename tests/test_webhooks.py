@@ -0,0 +1,87 @@
+import hashlib
+import hmac
+import http.client
+import json
+
+import pytest
+
+from modules.webhooks import (DUPLICATE, FULL, MERGED, QUEUED, MemoryEventQueue, RedisEventQueue, WebhookReceiver,
+                              verify_signature)
+
+
+@pytest.fixture
+def receiver():
+    receiver = WebhookReceiver(MemoryEventQueue(maxsize=10), host='127.0.0.1', port=0, secret='secret').start()
+    try:
+        yield receiver
+    finally:
+        receiver.stop()
+
+
+@pytest.mark.parametrize('length', ['abc', '-1'])
+def test_rejects_an_invalid_content_length(receiver, length):
+    connection = http.client.HTTPConnection('127.0.0.1', receiver.port, timeout=5)
+    connection.putrequest('POST', receiver.path)
+    connection.putheader('Content-Length', length)
+    connection.endheaders()
+    response = connection.getresponse()
+    assert response.status == 400
+    connection.close()
+
+
+def signed(body: bytes, secret: str = 'secret', prefix: str = 'sha256=') -> str:
+    return prefix + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def event_body(event_id: str, record_id: int = 1) -> bytes:
+    return json.dumps({'eventId': event_id, 'event': 'product.updated', 'companyId': 'c',
+                       'data': {'id': record_id}}).encode('utf-8')
+
+
+@pytest.mark.parametrize('signature, valid', [
+    (signed(b'{}'), True),
+    (signed(b'{}', prefix=''), True),
+    (signed(b'{}', secret='other'), False),
+    (signed(b'{"tampered": 1}'), False),
+    (signed(b'{}', prefix='sha1='), False),
+    ('', False),
+    (None, False),
+])
+def test_verify_signature(signature, valid):
+    assert verify_signature(b'{}', signature, 'secret') is valid
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def queue(request):
+    if request.param == 'redis':
+        request.getfixturevalue('fake_redis')
+        return RedisEventQueue(maxsize=2, dedupe_ttl=60, key='test:webhooks')
+    return MemoryEventQueue(maxsize=2, dedupe_ttl=60)
+
+
+def test_accept_checks_the_signature_before_queueing(queue):
+    receiver = WebhookReceiver(queue, secret='secret')
+    body = event_body('event-1')
+    assert receiver.accept(body, signed(body, secret='other')) == (401, 'unauthorized')
+    assert receiver.accept(body, None) == (401, 'unauthorized')
+    assert len(queue) == 0
+    assert receiver.accept(body, signed(body)) == (200, QUEUED)
+    assert receiver.accept(b'not json', signed(b'not json')) == (400, 'invalid')
+
+
+def test_dedupes_redeliveries_and_merges_updates_per_record(queue):
+    receiver = WebhookReceiver(queue, secret='secret')
+
+    def accept(body):
+        return receiver.accept(body, signed(body))
+
+    assert accept(event_body('event-1', record_id=1)) == (200, QUEUED)
+    assert accept(event_body('event-1', record_id=1)) == (200, DUPLICATE)
+    assert accept(event_body('event-2', record_id=1)) == (200, MERGED)
+    assert accept(event_body('event-3', record_id=2)) == (200, QUEUED)
+    assert accept(event_body('event-4', record_id=3)) == (503, FULL)
+
+    batch = queue.get_batch(10, timeout=0.1)
+    assert [(event.event_id, event.record_id) for event in batch] == [('event-2', '1'), ('event-3', '2')]
+    # Refused while full, so Bling's redelivery is accepted once there is room.
+    assert accept(event_body('event-4', record_id=3)) == (200, QUEUED)